@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Offline gazetteer and rules engine for address normalization.
+
+Spanish and US addresses can usually be resolved without the LLM: the first
+two digits of a Spanish postcode identify the province and the first three
+digits of a US ZIP code identify the state. normalize_address_local() returns
+(city, province_code, country) when the rules agree with everything the
+address already says (its province/state and, for well-known cities, the city), and None when the address is ambiguous and should be
+sent to the model.
+"""
+
+import unicodedata
+
+# Mapping of 3-letter to 2-letter country codes for European countries and US
+EU_COUNTRY_CODES = {
+    'ESP': 'ES', 'FRA': 'FR', 'DEU': 'DE', 'ITA': 'IT', 'PRT': 'PT', 'NLD': 'NL', 'BEL': 'BE', 'GBR': 'GB', 'IRL': 'IE',
+    'CHE': 'CH', 'AUT': 'AT', 'SWE': 'SE', 'NOR': 'NO', 'DNK': 'DK', 'FIN': 'FI', 'POL': 'PL', 'CZE': 'CZ', 'SVK': 'SK',
+    'HUN': 'HU', 'ROU': 'RO', 'BGR': 'BG', 'HRV': 'HR', 'SVN': 'SI', 'EST': 'EE', 'LVA': 'LV', 'LTU': 'LT', 'GRC': 'GR',
+    'CYP': 'CY', 'MLT': 'MT', 'LUX': 'LU', 'ISL': 'IS', 'LIE': 'LI',
+    'USA': 'US', 'GUM': 'GU', 'PRI': 'PR', 'VIR': 'VI', 'ASM': 'AS', 'MNP': 'MP'  # US and territories
+}
+
+# US State codes mapping
+US_STATE_CODES = {
+    'ALABAMA': 'AL', 'ALASKA': 'AK', 'ARIZONA': 'AZ', 'ARKANSAS': 'AR', 'CALIFORNIA': 'CA',
+    'COLORADO': 'CO', 'CONNECTICUT': 'CT', 'DELAWARE': 'DE', 'FLORIDA': 'FL', 'GEORGIA': 'GA',
+    'HAWAII': 'HI', 'IDAHO': 'ID', 'ILLINOIS': 'IL', 'INDIANA': 'IN', 'IOWA': 'IA',
+    'KANSAS': 'KS', 'KENTUCKY': 'KY', 'LOUISIANA': 'LA', 'MAINE': 'ME', 'MARYLAND': 'MD',
+    'MASSACHUSETTS': 'MA', 'MICHIGAN': 'MI', 'MINNESOTA': 'MN', 'MISSISSIPPI': 'MS', 'MISSOURI': 'MO',
+    'MONTANA': 'MT', 'NEBRASKA': 'NE', 'NEVADA': 'NV', 'NEW HAMPSHIRE': 'NH', 'NEW JERSEY': 'NJ',
+    'NEW MEXICO': 'NM', 'NEW YORK': 'NY', 'NORTH CAROLINA': 'NC', 'NORTH DAKOTA': 'ND', 'OHIO': 'OH',
+    'OKLAHOMA': 'OK', 'OREGON': 'OR', 'PENNSYLVANIA': 'PA', 'RHODE ISLAND': 'RI', 'SOUTH CAROLINA': 'SC',
+    'SOUTH DAKOTA': 'SD', 'TENNESSEE': 'TN', 'TEXAS': 'TX', 'UTAH': 'UT', 'VERMONT': 'VT',
+    'VIRGINIA': 'VA', 'WASHINGTON': 'WA', 'WEST VIRGINIA': 'WV', 'WISCONSIN': 'WI', 'WYOMING': 'WY',
+    'DISTRICT OF COLUMBIA': 'DC', 'AMERICAN SAMOA': 'AS', 'GUAM': 'GU', 'NORTHERN MARIANA ISLANDS': 'MP',
+    'PUERTO RICO': 'PR', 'VIRGIN ISLANDS': 'VI'
+}
+
+# Spanish postcode prefix (first two digits) to ISO 3166-2:ES province code without the "ES-" prefix
+ES_POSTCODE_PROVINCES = {
+    '01': 'VI', '02': 'AB', '03': 'A', '04': 'AL', '05': 'AV', '06': 'BA', '07': 'PM', '08': 'B',
+    '09': 'BU', '10': 'CC', '11': 'CA', '12': 'CS', '13': 'CR', '14': 'CO', '15': 'C', '16': 'CU',
+    '17': 'GI', '18': 'GR', '19': 'GU', '20': 'SS', '21': 'H', '22': 'HU', '23': 'J', '24': 'LE',
+    '25': 'L', '26': 'LO', '27': 'LU', '28': 'M', '29': 'MA', '30': 'MU', '31': 'NA', '32': 'OR',
+    '33': 'O', '34': 'P', '35': 'GC', '36': 'PO', '37': 'SA', '38': 'TF', '39': 'S', '40': 'SG',
+    '41': 'SE', '42': 'SO', '43': 'T', '44': 'TE', '45': 'TO', '46': 'V', '47': 'VA', '48': 'BI',
+    '49': 'ZA', '50': 'Z', '51': 'CE', '52': 'ML'
+}
+
+# Province names as they appear in Brightpearl (accents and case are folded before lookup)
+ES_PROVINCE_NAMES = {
+    'ALAVA': 'VI', 'ARABA': 'VI', 'ARABA/ALAVA': 'VI', 'ALBACETE': 'AB', 'ALICANTE': 'A', 'ALACANT': 'A',
+    'ALMERIA': 'AL', 'AVILA': 'AV', 'BADAJOZ': 'BA', 'BALEARES': 'PM', 'ILLES BALEARS': 'PM',
+    'ISLAS BALEARES': 'PM', 'BALEARIC ISLANDS': 'PM', 'MALLORCA': 'PM', 'BARCELONA': 'B', 'BURGOS': 'BU',
+    'CACERES': 'CC', 'CADIZ': 'CA', 'CASTELLON': 'CS', 'CASTELLO': 'CS', 'CIUDAD REAL': 'CR',
+    'CORDOBA': 'CO', 'A CORUNA': 'C', 'LA CORUNA': 'C', 'CORUNA': 'C', 'CUENCA': 'CU', 'GIRONA': 'GI',
+    'GERONA': 'GI', 'GRANADA': 'GR', 'GUADALAJARA': 'GU', 'GIPUZKOA': 'SS', 'GUIPUZCOA': 'SS',
+    'HUELVA': 'H', 'HUESCA': 'HU', 'JAEN': 'J', 'LEON': 'LE', 'LLEIDA': 'L', 'LERIDA': 'L',
+    'LA RIOJA': 'LO', 'RIOJA': 'LO', 'LUGO': 'LU', 'MADRID': 'M', 'MALAGA': 'MA', 'MURCIA': 'MU',
+    'NAVARRA': 'NA', 'NAFARROA': 'NA', 'OURENSE': 'OR', 'ORENSE': 'OR', 'ASTURIAS': 'O',
+    'PALENCIA': 'P', 'LAS PALMAS': 'GC', 'PONTEVEDRA': 'PO', 'SALAMANCA': 'SA',
+    'SANTA CRUZ DE TENERIFE': 'TF', 'TENERIFE': 'TF', 'CANTABRIA': 'S', 'SEGOVIA': 'SG',
+    'SEVILLA': 'SE', 'SEVILLE': 'SE', 'SORIA': 'SO', 'TARRAGONA': 'T', 'TERUEL': 'TE', 'TOLEDO': 'TO',
+    'VALENCIA': 'V', 'VALLADOLID': 'VA', 'BIZKAIA': 'BI', 'VIZCAYA': 'BI', 'ZAMORA': 'ZA',
+    'ZARAGOZA': 'Z', 'CEUTA': 'CE', 'MELILLA': 'ML'
+}
+
+# US ZIP code prefix ranges (first three digits, inclusive) to state codes.
+# Prefixes used by the military (AA/AE/AP) and prefixes shared by several
+# territories are deliberately left out so those addresses go to the LLM.
+US_ZIP_PREFIX_RANGES = [
+    (5, 5, 'NY'), (6, 7, 'PR'), (8, 8, 'VI'), (9, 9, 'PR'), (10, 27, 'MA'), (28, 29, 'RI'),
+    (30, 38, 'NH'), (39, 49, 'ME'), (50, 54, 'VT'), (55, 55, 'MA'), (56, 59, 'VT'), (60, 69, 'CT'),
+    (70, 89, 'NJ'), (100, 149, 'NY'), (150, 196, 'PA'), (197, 199, 'DE'), (200, 200, 'DC'),
+    (201, 201, 'VA'), (202, 205, 'DC'), (206, 219, 'MD'), (220, 246, 'VA'), (247, 268, 'WV'),
+    (270, 289, 'NC'), (290, 299, 'SC'), (300, 319, 'GA'), (320, 339, 'FL'), (341, 349, 'FL'),
+    (350, 369, 'AL'), (370, 385, 'TN'), (386, 397, 'MS'), (398, 399, 'GA'), (400, 427, 'KY'),
+    (430, 459, 'OH'), (460, 479, 'IN'), (480, 499, 'MI'), (500, 528, 'IA'), (530, 549, 'WI'),
+    (550, 567, 'MN'), (569, 569, 'DC'), (570, 577, 'SD'), (580, 588, 'ND'), (590, 599, 'MT'),
+    (600, 629, 'IL'), (630, 658, 'MO'), (660, 679, 'KS'), (680, 693, 'NE'), (700, 714, 'LA'),
+    (716, 729, 'AR'), (730, 732, 'OK'), (733, 733, 'TX'), (734, 749, 'OK'), (750, 799, 'TX'),
+    (800, 816, 'CO'), (820, 831, 'WY'), (832, 838, 'ID'), (840, 847, 'UT'), (850, 865, 'AZ'),
+    (870, 884, 'NM'), (885, 885, 'TX'), (889, 898, 'NV'), (900, 961, 'CA'), (967, 968, 'HI'),
+    (970, 979, 'OR'), (980, 994, 'WA'), (995, 999, 'AK')
+]
+
+US_ZIP_PREFIX_STATES = {}
+for _start, _end, _state in US_ZIP_PREFIX_RANGES:
+    for _prefix in range(_start, _end + 1):
+        US_ZIP_PREFIX_STATES['{:03d}'.format(_prefix)] = _state
+
+# Spellings and abbreviations that should map to a canonical city name.
+# Keys are accent-folded and upper-cased.
+CITY_ALIASES = {
+    'ES': {
+        'BCN': 'Barcelona', 'BARNA': 'Barcelona', 'MAD': 'Madrid', 'SEVILLE': 'Sevilla',
+        'LA CORUNA': 'A Coruña', 'CORUNA': 'A Coruña', 'A CORUNA': 'A Coruña',
+        'ORENSE': 'Ourense', 'GERONA': 'Girona', 'LERIDA': 'Lleida', 'SAN SEBASTIAN': 'Donostia-San Sebastián',
+        'DONOSTIA': 'Donostia-San Sebastián', 'PALMA DE MALLORCA': 'Palma', 'VITORIA': 'Vitoria-Gasteiz',
+        'GASTEIZ': 'Vitoria-Gasteiz', 'ALICANTE': 'Alicante', 'ALACANT': 'Alicante',
+        'CASTELLON': 'Castellón de la Plana', 'CASTELLON DE LA PLANA': 'Castellón de la Plana',
+        'MALAGA': 'Málaga', 'CORDOBA': 'Córdoba', 'CADIZ': 'Cádiz', 'LEON': 'León', 'JAEN': 'Jaén',
+        'AVILA': 'Ávila', 'CACERES': 'Cáceres', 'ALMERIA': 'Almería'
+    },
+    'US': {
+        'NYC': 'New York', 'NEW YORK CITY': 'New York', 'MANHATTAN': 'New York',
+        'SF': 'San Francisco', 'SAN FRAN': 'San Francisco',
+        'PHILLY': 'Philadelphia', 'VEGAS': 'Las Vegas', 'WASHINGTON DC': 'Washington',
+        'WASHINGTON D.C.': 'Washington'
+    }
+}
+
+# Cities known to lie in one province/state: the Spanish province capitals and
+# the targets of the aliases above. Keys are accent-folded and upper-cased.
+# A city here with a postcode of another province is sent to the LLM.
+CITY_PROVINCES = {
+    'ES': {
+        'VITORIA-GASTEIZ': 'VI', 'ALBACETE': 'AB', 'ALICANTE': 'A', 'ALMERIA': 'AL', 'AVILA': 'AV',
+        'BADAJOZ': 'BA', 'PALMA': 'PM', 'BARCELONA': 'B', 'BURGOS': 'BU', 'CACERES': 'CC', 'CADIZ': 'CA',
+        'CASTELLON DE LA PLANA': 'CS', 'CIUDAD REAL': 'CR', 'CORDOBA': 'CO', 'A CORUNA': 'C', 'CUENCA': 'CU',
+        'GIRONA': 'GI', 'GRANADA': 'GR', 'GUADALAJARA': 'GU', 'DONOSTIA-SAN SEBASTIAN': 'SS', 'HUELVA': 'H',
+        'HUESCA': 'HU', 'JAEN': 'J', 'LEON': 'LE', 'LLEIDA': 'L', 'LOGRONO': 'LO', 'LUGO': 'LU',
+        'MADRID': 'M', 'MALAGA': 'MA', 'MURCIA': 'MU', 'PAMPLONA': 'NA', 'OURENSE': 'OR', 'OVIEDO': 'O',
+        'PALENCIA': 'P', 'LAS PALMAS DE GRAN CANARIA': 'GC', 'PONTEVEDRA': 'PO', 'SALAMANCA': 'SA',
+        'SANTA CRUZ DE TENERIFE': 'TF', 'SANTANDER': 'S', 'SEGOVIA': 'SG', 'SEVILLA': 'SE', 'SORIA': 'SO',
+        'TARRAGONA': 'T', 'TERUEL': 'TE', 'TOLEDO': 'TO', 'VALENCIA': 'V', 'VALLADOLID': 'VA', 'BILBAO': 'BI',
+        'ZAMORA': 'ZA', 'ZARAGOZA': 'Z', 'CEUTA': 'CE', 'MELILLA': 'ML'
+    },
+    'US': {
+        'NEW YORK': 'NY', 'SAN FRANCISCO': 'CA', 'PHILADELPHIA': 'PA', 'LAS VEGAS': 'NV', 'WASHINGTON': 'DC'
+    }
+}
+
+# Words kept lower-case when re-casing all-caps or all-lower-case city names
+LOWERCASE_CITY_WORDS = {'de', 'del', 'la', 'las', 'los', 'el', 'y', 'i', 'da', 'do', 'dos', 'das', 'of'}
+
+
+def fold(text):
+    """Upper-case text and strip accents so lookups ignore spelling variants"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.upper().split())
+
+
+def to_alpha2(country):
+    """Return the 2-letter country code for a 2- or 3-letter code, or ''"""
+    code = (country or '').strip().upper()
+    if len(code) == 3:
+        return EU_COUNTRY_CODES.get(code, '')
+    if len(code) == 2:
+        return code
+    return ''
+
+
+def recase_city(city):
+    """Title-case city names that arrive all upper- or lower-case, leave mixed case alone"""
+    city = ' '.join((city or '').split())
+    if not city or (city != city.upper() and city != city.lower()):
+        return city
+    words = city.lower().split(' ')
+    recased = []
+    for i, word in enumerate(words):
+        if i > 0 and word in LOWERCASE_CITY_WORDS:
+            recased.append(word)
+        else:
+            recased.append('-'.join(part[:1].upper() + part[1:] for part in word.split('-')))
+    return ' '.join(recased)
+
+
+def normalize_city(city, country2):
+    """Resolve a city through the alias table, falling back to re-casing"""
+    alias = CITY_ALIASES.get(country2, {}).get(fold(city))
+    return alias if alias else recase_city(city)
+
+
+def province_from_postcode(postcode, country2):
+    """Derive the province/state code from a postcode, or '' when the prefix is unknown"""
+    digits = ''.join(c for c in str(postcode or '') if c.isdigit())
+    if country2 == 'ES':
+        if not digits or len(digits) > 5:
+            return ''
+        return ES_POSTCODE_PROVINCES.get(digits.zfill(5)[:2], '')
+    if country2 == 'US':
+        # Accept ZIP (5 digits) and ZIP+4 (9 digits)
+        if len(digits) not in (5, 9):
+            return ''
+        return US_ZIP_PREFIX_STATES.get(digits[:3], '')
+    return ''
+
+
+def province_from_text(text, country2):
+    """Map a free-text province/state to its code; returns None when the text is not recognised"""
+    key = fold(text)
+    if not key:
+        return ''
+    if key.startswith(country2 + '-'):
+        key = key[len(country2) + 1:]
+    if country2 == 'ES':
+        if key in ES_PROVINCE_NAMES:
+            return ES_PROVINCE_NAMES[key]
+        if key in ES_POSTCODE_PROVINCES.values():
+            return key
+    elif country2 == 'US':
+        if key in US_STATE_CODES:
+            return US_STATE_CODES[key]
+        if key in US_STATE_CODES.values():
+            return key
+    return None
+
+
+def normalize_address_local(address):
+    """
+    Resolve an address with the offline rules.
+    Returns (city, province_code, country) or None when the address is ambiguous.
+    """
+    country = address.get('country', '') or ''
+    country2 = to_alpha2(country)
+    if country2 not in ('ES', 'US'):
+        return None
+
+    city = (address.get('city', '') or '').strip()
+    if not city:
+        return None
+
+    province = province_from_postcode(address.get('postcode', ''), country2)
+    if not province:
+        return None
+
+    # A city that is only a state code (NY, LA, DC) could be the state's name or one of its cities
+    if country2 == 'US' and fold(city) in US_STATE_CODES.values():
+        return None
+
+    # The province/state written on the address must agree with the postcode.
+    # Unrecognised text (e.g. an autonomous community or a typo) is ambiguous.
+    # addressLine3 is only read when addressLine4 is empty, and skipped when it
+    # just holds the city.
+    stated = (address.get('addressLine4', '') or '').strip()
+    if not stated:
+        stated = (address.get('addressLine3', '') or '').strip()
+        if fold(stated) == fold(city):
+            stated = ''
+    if stated:
+        stated_code = province_from_text(stated, country2)
+        if stated_code is None or (stated_code and stated_code != province):
+            return None
+
+    # So must the city, when it is one known to lie in another province
+    normalized_city = normalize_city(city, country2)
+    if CITY_PROVINCES[country2].get(fold(normalized_city), province) != province:
+        return None
+
+    return (normalized_city, province, country)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Offline batch-job support for LLM address normalization.
+
+Request lines are written to one JSONL file in the OpenAI batch format
+({"custom_id", "method", "url", "body"}), submitted to a batch backend,
+polled until the job finishes, and the results file is read back into a
+{custom_id: content} mapping.
+
+Two backends are available:
+- OpenAIBatchBackend uses the Files and Batches endpoints of the OpenAI
+  client. It honours OPENAI_BASE_URL, so any OpenAI-compatible batch server
+  (including a local one) can stand in for the real API.
+- LocalBatchBackend answers every request line in-process with a responder
+  callable, for testing the stage without network access.
+"""
+
+import json
+import os
+import shutil
+import time
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+COMPLETION_WINDOW = '24h'
+POLL_INTERVAL = 30  # Seconds between batch status checks
+
+# Batch statuses after which polling stops
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def write_batch_requests(path, requests):
+    """Write (custom_id, body) pairs as batch request lines"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': body
+            }, ensure_ascii=False) + '\n')
+
+
+def read_batch_results(path):
+    """
+    Read a batch results file into {custom_id: content}.
+    Lines that errored or did not return a message map to None.
+    """
+    results = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            custom_id = item.get('custom_id')
+            response = item.get('response') or {}
+            if item.get('error') or response.get('status_code') != 200:
+                print(f"[BATCH] Request {custom_id} failed: {item.get('error') or response.get('status_code')}")
+                results[custom_id] = None
+                continue
+            try:
+                results[custom_id] = response['body']['choices'][0]['message']['content']
+            except (KeyError, IndexError, TypeError):
+                print(f"[BATCH] Request {custom_id} returned no message content")
+                results[custom_id] = None
+    return results
+
+
+class OpenAIBatchBackend:
+    """Submit batch jobs through the OpenAI Files and Batches API"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests_path):
+        with open(requests_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=COMPLETION_WINDOW
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """Return (status, output_file_id, error_file_id)"""
+        batch = self.client.batches.retrieve(batch_id)
+        return batch.status, batch.output_file_id, batch.error_file_id
+
+    def download(self, file_id, path):
+        content = self.client.files.content(file_id)
+        with open(path, 'wb') as f:
+            f.write(content.read())
+
+
+class LocalBatchBackend:
+    """
+    In-process stand-in for a batch endpoint.
+    responder(custom_id, body) returns the message content for one request line.
+    """
+
+    def __init__(self, responder, work_dir):
+        self.responder = responder
+        self.work_dir = work_dir
+        self.jobs = {}
+
+    def submit(self, requests_path):
+        batch_id = 'local-batch-{}'.format(len(self.jobs) + 1)
+        output_path = os.path.join(self.work_dir, batch_id + '_output.jsonl')
+        with open(requests_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as out:
+            for line in src:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                content = self.responder(request['custom_id'], request['body'])
+                out.write(json.dumps({
+                    'custom_id': request['custom_id'],
+                    'response': {
+                        'status_code': 200,
+                        'body': {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+                    },
+                    'error': None
+                }, ensure_ascii=False) + '\n')
+        self.jobs[batch_id] = output_path
+        return batch_id
+
+    def status(self, batch_id):
+        return 'completed', self.jobs[batch_id], None
+
+    def download(self, file_id, path):
+        if os.path.abspath(file_id) != os.path.abspath(path):
+            shutil.copyfile(file_id, path)
+
+
+def run_batch_job(requests, backend, work_dir, poll_interval=POLL_INTERVAL):
+    """
+    Write, submit and poll a batch job, then return {custom_id: content}.
+    Returns an empty dict when the job does not complete.
+    """
+    if not requests:
+        return {}
+
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    requests_path = os.path.join(work_dir, 'batch_requests_{}.jsonl'.format(stamp))
+    results_path = os.path.join(work_dir, 'batch_results_{}.jsonl'.format(stamp))
+
+    write_batch_requests(requests_path, requests)
+    print(f"[BATCH] Wrote {len(requests)} requests to {requests_path}")
+
+    batch_id = backend.submit(requests_path)
+    print(f"[BATCH] Submitted batch job {batch_id}")
+
+    started = time.time()
+    while True:
+        status, output_file_id, error_file_id = backend.status(batch_id)
+        if status in FINAL_STATUSES:
+            break
+        print(f"[BATCH] Job {batch_id} is {status} ({int(time.time() - started)}s elapsed), checking again in {poll_interval}s...")
+        time.sleep(poll_interval)
+
+    if status != 'completed' or not output_file_id:
+        print(f"[BATCH] Job {batch_id} finished with status '{status}', no results to ingest")
+        if error_file_id:
+            print(f"[BATCH] Error file: {error_file_id}")
+        return {}
+
+    backend.download(output_file_id, results_path)
+    print(f"[BATCH] Job {batch_id} completed in {int(time.time() - started)}s, results saved to {results_path}")
+    return read_batch_results(results_path)
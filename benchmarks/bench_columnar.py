@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the row and columnar conversion engines of convert_contacts.py.
+
+Generates synthetic exports, runs each engine in a child process with a
+stubbed address normalizer (no cache, no network), checks that both engines
+wrote byte-identical files and reports wall time and peak RSS.
+
+Usage:
+    python benchmarks/bench_columnar.py [--sizes 100000 1000000]
+"""
+
+import argparse
+import contextlib
+import filecmp
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic_exports import generate_exports  # noqa: E402
+
+
+def run_engine(engine):
+    """Run one engine in the current directory and print its timings as JSON"""
+    import convert_contacts
+
+    # Deterministic stand-in for the cache/rules/LLM normalizer
+    convert_contacts.normalize_addresses_llm_batch = lambda batch, address_type: [
+        convert_contacts.original_address_values(a) for a in batch
+    ]
+    convert_contacts.load_normalized_addresses = lambda: {}
+    args = SimpleNamespace(batch_job=False, batch_backend='local', batch_poll_interval=0, incremental=False, delta=False, workers=1)
+
+    os.makedirs(convert_contacts.CONVERTED_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if engine == 'columnar':
+            from convert_columnar import convert_columnar
+            convert_columnar(args)
+        else:
+            convert_contacts.convert_in_memory(args)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'engine': engine,
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def bench_size(contact_count, work_dir):
+    size_dir = os.path.join(work_dir, str(contact_count))
+    print(f"[INFO] Generating {contact_count} contacts...")
+    generate_exports(os.path.join(size_dir, 'exports'), contact_count)
+
+    results = {}
+    for engine in ('rows', 'columnar'):
+        converted = os.path.join(size_dir, 'converted')
+        shutil.rmtree(converted, ignore_errors=True)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-one', engine],
+            cwd=size_dir, check=True, capture_output=True, text=True,
+            env=dict(os.environ, PYTHONPATH=REPO_ROOT)
+        ).stdout
+        results[engine] = json.loads(output.strip().splitlines()[-1])
+        os.rename(converted, os.path.join(size_dir, 'converted_' + engine))
+
+    identical = all(
+        filecmp.cmp(os.path.join(size_dir, 'converted_rows', name), os.path.join(size_dir, 'converted_columnar', name), shallow=False)
+        for name in ('companies.csv', 'customers.csv')
+    )
+    rows, columnar = results['rows'], results['columnar']
+    print(f"{contact_count:>10} contacts | rows {rows['seconds']:8.2f}s {rows['peak_rss_mb']:8.0f} MB"
+          f" | columnar {columnar['seconds']:8.2f}s {columnar['peak_rss_mb']:8.0f} MB"
+          f" | speedup {rows['seconds'] / columnar['seconds']:5.2f}x | identical: {identical}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the row and columnar conversion engines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000], help='Contact counts to benchmark')
+    parser.add_argument('--run-one', choices=['rows', 'columnar'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_engine(args.run_one)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='bench_columnar_')
+    try:
+        identical = [bench_size(size, work_dir) for size in args.sizes]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not all(identical):
+        print('[ERROR] Engines produced different output')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark convert_contacts.py phase by phase on synthetic exports.
+
+For each size, synthetic_exports.py generates a realistic export set
+(multi-location companies, shared billing addresses, a Spanish/US/EU mix).
+Each conversion then runs in its own process with --profile. The run reports:
+- the time spent per stage (load_inputs, row_building, normalization, csv_write)
+- the script's peak RSS
+- how the addresses were resolved
+
+The address normalizer is deterministic and never touches the network:
+
+- stub:  normalization is replaced by the exported values, as in
+         bench_columnar.py, so only the conversion itself is measured
+- cold:  empty normalized address cache; the offline rules run as usual and
+         the LLM request is stubbed to return the exported values, so the
+         cache reload and save after every batch are measured
+- warm:  every address already in the cache (the steady state after a first
+         run); the real normalizer reloads the cache for every batch
+
+cold and warm reload the whole cache for every batch of BATCH_SIZE
+addresses. They grow quadratically with the number of addresses, and each run
+is stopped after --timeout seconds.
+
+Usage:
+    python benchmarks/bench_convert.py [--sizes 10000 100000 1000000] [--normalizers stub cold warm]
+                                       [--modes rows streaming columnar] [--timeout 600] [--json PATH]
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic_exports import generate_exports  # noqa: E402
+
+MODES = {
+    'rows': [],
+    'streaming': ['--streaming'],
+    'columnar': ['--engine', 'columnar'],
+}
+NORMALIZERS = ['stub', 'cold', 'warm']
+STAGES = ['load_inputs', 'row_building', 'normalization', 'csv_write', 'other']
+
+
+def run_conversion(normalizer, mode):
+    """Run convert_contacts.main() with --profile in the current directory"""
+    import convert_contacts
+    from llm_telemetry import TELEMETRY
+
+    if normalizer == 'stub':
+        convert_contacts.normalize_addresses_llm_batch = lambda batch, address_type: [
+            convert_contacts.original_address_values(a) for a in batch
+        ]
+    else:
+        # The LLM answers instantly with the exported values; cache and rules run for real
+        def request_normalizations(client, addresses_to_normalize, kind):
+            TELEMETRY.record_request(kind, 0.0)
+            return [convert_contacts.original_address_values(a) for a in addresses_to_normalize]
+
+        convert_contacts.openai_api_key = lambda: 'bench'
+        convert_contacts.request_normalizations = request_normalizations
+
+    sys.argv = ['convert_contacts.py', '--profile'] + MODES[mode]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        convert_contacts.main()
+
+
+def prefill_cache(run_dir):
+    """Write a normalized address cache holding every exported address (at its exported values)"""
+    import convert_contacts as cc
+
+    with open(os.path.join(run_dir, cc.ADDRESSES_CSV), newline='', encoding='utf-8') as f, \
+            open(os.path.join(run_dir, cc.NORMALIZED_ADDRESSES_CSV), 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(cc.NORMALIZED_ADDRESSES_COLUMNS)
+        for a in csv.DictReader(f):
+            city, province, country = cc.original_address_values(a)
+            writer.writerow([a['addressId'], a['addressLine1'], a['addressLine2'], a['postcode'],
+                             cc.convert_country_code(country), city, province, '2024-01-01 00:00:00'])
+
+
+def run_one(run_dir, normalizer, mode, timeout):
+    """
+    Convert run_dir/exports in a child process. Returns a result dict with
+    the stage times and normalization counts, or status 'timeout'/'failed'.
+    """
+    converted = os.path.join(run_dir, 'converted')
+    shutil.rmtree(converted, ignore_errors=True)
+    os.makedirs(converted)
+    if normalizer == 'warm':
+        prefill_cache(run_dir)
+
+    result = {'normalizer': normalizer, 'mode': mode}
+    with open(os.path.join(run_dir, 'output.log'), 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--run-one', normalizer, mode],
+            cwd=run_dir, stdout=log, stderr=subprocess.STDOUT, env=dict(os.environ, PYTHONPATH=REPO_ROOT)
+        )
+        timed_out = threading.Event()
+
+        def stop():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, stop)
+        timer.start()
+        # wait4 gives this child's own peak RSS, not the maximum over every child so far
+        _, status, rusage = os.wait4(process.pid, 0)
+        timer.cancel()
+        result['wall_seconds'] = round(time.perf_counter() - start, 2)
+        result['peak_rss_mb'] = round(rusage.ru_maxrss / 1024, 1)
+
+    if os.waitstatus_to_exitcode(status) != 0:
+        result['status'] = 'timeout' if timed_out.is_set() else 'failed'
+        return result
+
+    with open(os.path.join(converted, 'convert_profile.json')) as f:
+        profile = json.load(f)
+    with open(os.path.join(converted, 'normalization_report.json')) as f:
+        report = json.load(f)
+    result['status'] = 'ok'
+    result['stages'] = {name: profile['stages'].get(name, {}).get('seconds', 0.0) for name in STAGES}
+    result['addresses'] = report['addresses']
+    with open(os.path.join(converted, 'companies.csv'), newline='', encoding='utf-8') as f:
+        result['rows'] = sum(1 for _ in f) - 1
+    return result
+
+
+def print_result(size, result):
+    label = f"{size:>8} | {result['mode']:>9} | {result['normalizer']:>5}"
+    if result['status'] != 'ok':
+        print(f"{label} | {result['status']} after {result['wall_seconds']:.0f}s ({result['peak_rss_mb']:.0f} MB)")
+        return
+    stages = ' '.join(f"{result['stages'][name]:>9.2f}" for name in STAGES)
+    addresses = result['addresses']
+    print(f"{label} | {result['wall_seconds']:8.2f}s | {stages} | {result['peak_rss_mb']:7.0f} MB"
+          f" | {addresses['cache']:>8} {addresses['local']:>8} {addresses['llm']:>8} {addresses['original']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the conversion phases on synthetic exports.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Contact counts to benchmark')
+    parser.add_argument('--normalizers', nargs='+', choices=NORMALIZERS, default=NORMALIZERS, help='Normalizer setups (see above)')
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['rows'],
+                        help='Conversion modes: in-memory rows engine, --streaming, --engine columnar')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds before a run is stopped')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic exports')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON')
+    parser.add_argument('--run-one', nargs=2, metavar=('NORMALIZER', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_conversion(*args.run_one)
+        return
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='bench_convert_')
+    try:
+        for size in args.sizes:
+            run_dir = os.path.join(work_dir, str(size))
+            start = time.perf_counter()
+            generate_exports(os.path.join(run_dir, 'exports'), size, args.seed)
+            print(f"[INFO] Generated {size} contacts in {time.perf_counter() - start:.1f}s")
+            print(f"{'contacts':>8} | {'mode':>9} | {'norm':>5} | {'wall':>9} | "
+                  + ' '.join(f"{name[:9]:>9}" for name in STAGES)
+                  + f" | {'peak RSS':>10} | {'cache':>8} {'local':>8} {'llm':>8} {'original':>8}")
+            for mode in args.modes:
+                for normalizer in args.normalizers:
+                    result = run_one(run_dir, normalizer, mode, args.timeout)
+                    result['contacts'] = size
+                    results.append(result)
+                    print_result(size, result)
+            shutil.rmtree(run_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark export_contacts.py and export_orders.py against the local
+Brightpearl simulator (bp_simulator.py).
+
+For each size a simulator with that many contacts and orders is started in
+its own process, and each export script runs in a fresh process and an empty
+working directory, pointed at it through BRIGHTPEARL_BASE_URL. Reported per
+run: wall time, requests made (from the script's run report), requests per
+entity, throttled responses and the script's peak RSS.
+
+The request delay defaults to 0 so the numbers show the scripts' own cost;
+pass --request-delay 0.5 and --requests-per-minute 200 to see a run as it
+would behave against a standard Brightpearl account.
+
+Usage:
+    python benchmarks/bench_export.py [--sizes 1000 10000 100000] [--scripts export_contacts export_orders]
+                                      [--latency 0] [--request-delay 0] [--requests-per-minute 0] [--json PATH]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATOR = os.path.join(REPO_ROOT, 'benchmarks', 'bp_simulator.py')
+
+SCRIPTS = {
+    'export_contacts': ('exports/export_contacts_report.json', 'contacts'),
+    'export_orders': ('exports/export_orders_report.json', 'orders'),
+}
+
+
+def start_simulator(size, args):
+    """Start bp_simulator.py on a free port and return (process, base URL)"""
+    command = [sys.executable, SIMULATOR, '--port', '0', '--contacts', str(size), '--orders', str(size),
+               '--latency', str(args.latency), '--requests-per-minute', str(args.requests_per_minute)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    match = re.search(r'(http://\S+)', line)
+    if not match:
+        process.kill()
+        raise RuntimeError('Simulator did not start: {!r}'.format(line))
+    return process, match.group(1)
+
+
+def run_script(script, base_url, request_delay):
+    """Run one export in a scratch directory; returns (seconds, peak RSS in MB, exit code, run report or None)"""
+    workdir = tempfile.mkdtemp(prefix='bench_export_')
+    env = dict(os.environ,
+               BRIGHTPEARL_ACCOUNT='sim', BRIGHTPEARL_API_TOKEN='sim', BRIGHTPEARL_API_DOMAIN='localhost',
+               BRIGHTPEARL_APP_REF='sim', BRIGHTPEARL_BASE_URL=base_url,
+               BRIGHTPEARL_REQUEST_DELAY=str(request_delay), PYTHONPATH=REPO_ROOT)
+    report_path, _ = SCRIPTS[script]
+    try:
+        with open(os.path.join(workdir, 'output.log'), 'w') as log:
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, script + '.py')],
+                                       cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+            # wait4 gives this child's own rusage, not the maximum over every child so far
+            _, status, rusage = os.wait4(process.pid, 0)
+            seconds = time.perf_counter() - start
+        report = None
+        if os.path.exists(os.path.join(workdir, report_path)):
+            with open(os.path.join(workdir, report_path)) as f:
+                report = json.load(f)
+        return seconds, rusage.ru_maxrss / 1024, os.waitstatus_to_exitcode(status), report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the export scripts against the local Brightpearl simulator.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Contacts and orders in the simulated account')
+    parser.add_argument('--scripts', nargs='+', choices=sorted(SCRIPTS), default=sorted(SCRIPTS))
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated seconds of Brightpearl latency per request')
+    parser.add_argument('--request-delay', type=float, default=0.0, help='BRIGHTPEARL_REQUEST_DELAY for the scripts')
+    parser.add_argument('--requests-per-minute', type=int, default=0, help='Simulated per-minute request cap (0: unlimited)')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'script':>16} | {'size':>7} | {'wall':>9} | {'requests':>8} | {'req/entity':>10} | {'throttled':>9} | {'peak RSS':>9}")
+    for size in args.sizes:
+        simulator, base_url = start_simulator(size, args)
+        try:
+            for script in args.scripts:
+                seconds, peak_mb, exit_code, report = run_script(script, base_url, args.request_delay)
+                http = (report or {}).get('http', {})
+                entities = (report or {}).get(SCRIPTS[script][1], 0)
+                result = {
+                    'script': script, 'size': size, 'exit_code': exit_code,
+                    'wall_seconds': round(seconds, 2), 'peak_rss_mb': round(peak_mb, 1),
+                    'requests': http.get('requests'), 'entities': entities,
+                    'throttled': sum(http.get('throttled', {}).values()),
+                }
+                results.append(result)
+                if exit_code or report is None:
+                    print(f"{script:>16} | {size:>7} | failed with exit code {exit_code}")
+                    continue
+                per_entity = result['requests'] / entities if entities else 0.0
+                print(f"{script:>16} | {size:>7} | {seconds:8.1f}s | {result['requests']:>8} | {per_entity:>10.2f} | "
+                      f"{result['throttled']:>9} | {peak_mb:>6.1f} MB")
+        finally:
+            simulator.terminate()
+            simulator.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the output row representation of convert_contacts.py.
+
+Builds the location rows for synthetic exports with build_contact_rows and
+compares the fixed-schema list rows against the equivalent one-dict-per-row
+records: memory held by the row containers (tracemalloc, the cell strings are
+shared by both) and csv write throughput with csv.writer vs csv.DictWriter.
+
+Usage:
+    python benchmarks/bench_rows.py [--sizes 100000 300000]
+"""
+
+import argparse
+import csv
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import convert_contacts as cc  # noqa: E402
+from synthetic_exports import generate_exports  # noqa: E402
+
+
+def build_rows(export_dir):
+    """Build the location rows (placeholders for city/province) for one export directory"""
+    companies = cc.read_csv(os.path.join(export_dir, 'companies.csv'))
+    contacts = cc.read_csv(os.path.join(export_dir, 'contacts.csv'))
+    addresses = cc.read_csv(os.path.join(export_dir, 'addresses.csv'))
+
+    contacts_by_company = defaultdict(list)
+    for c in contacts:
+        contacts_by_company[c.get('companyId', '')].append(c)
+    addresses_by_contact = defaultdict(list)
+    for a in addresses:
+        addresses_by_contact[a.get('contactId', '')].append(cc.prepare_address(a, {}))
+
+    rows = []
+    for company in companies:
+        for contact in contacts_by_company.get(company.get('companyId', ''), []):
+            entries, _ = cc.build_contact_rows(company, contact, addresses_by_contact.get(contact.get('contactId', ''), []))
+            rows.extend(row for row, _, _ in entries)
+    return rows
+
+
+def measure(make_rows):
+    """Return (rows, MB allocated) for building a row container"""
+    tracemalloc.start()
+    rows = make_rows()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, allocated / (1024 * 1024)
+
+
+def timed_write(path, write):
+    start = time.perf_counter()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        write(f)
+    return time.perf_counter() - start
+
+
+def write_lists(rows):
+    def write(f):
+        writer = csv.writer(f)
+        writer.writerow(cc.OUTPUT_COLUMNS)
+        writer.writerows(rows)
+    return write
+
+
+def write_dicts(rows):
+    def write(f):
+        writer = csv.DictWriter(f, fieldnames=cc.OUTPUT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return write
+
+
+def bench_size(contact_count, work_dir):
+    size_dir = os.path.join(work_dir, str(contact_count))
+    print(f"[INFO] Generating {contact_count} contacts...")
+    generate_exports(os.path.join(size_dir, 'exports'), contact_count)
+    rows = build_rows(os.path.join(size_dir, 'exports'))
+
+    list_rows, list_mb = measure(lambda: [list(row) for row in rows])
+    dict_rows, dict_mb = measure(lambda: [dict(zip(cc.OUTPUT_COLUMNS, row)) for row in rows])
+
+    list_path = os.path.join(size_dir, 'companies_lists.csv')
+    dict_path = os.path.join(size_dir, 'companies_dicts.csv')
+    list_write = timed_write(list_path, write_lists(list_rows))
+    dict_write = timed_write(dict_path, write_dicts(dict_rows))
+    identical = filecmp.cmp(list_path, dict_path, shallow=False)
+
+    print(f"{len(rows):>10} rows | lists {list_mb:7.1f} MB write {len(rows) / list_write:9.0f} rows/s"
+          f" | dicts {dict_mb:7.1f} MB write {len(rows) / dict_write:9.0f} rows/s"
+          f" | memory {dict_mb / list_mb:4.1f}x write {dict_write / list_write:4.1f}x | identical: {identical}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark list rows against dict rows for the converted output.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 300000], help='Contact counts to benchmark')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_rows_')
+    try:
+        identical = [bench_size(size, work_dir) for size in args.sizes]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not all(identical):
+        print('[ERROR] Row representations produced different output')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark cold start of the entry-point modules.
+
+Imports each module in a fresh interpreter, without Brightpearl credentials
+in the environment, and reports the median wall time over several runs,
+whether the import succeeded and which heavy dependencies it pulled in.
+--repo points the benchmark at another checkout to compare against it.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 7] [--repo PATH]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'get_contact', 'get_order', 'export_contacts', 'export_orders',
+    'test_connection', 'convert_contacts', 'pipeline', 'lookup_daemon',
+]
+HEAVY_DEPENDENCIES = ['openai', 'requests', 'dotenv', 'pandas']
+
+PROBE = '''
+import json, sys
+import {module}
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+'''
+
+
+def import_once(repo, module, env):
+    """Return (seconds, heavy modules loaded or None if the import failed)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+        cwd=repo, env=env, capture_output=True, text=True
+    )
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        return seconds, None
+    return seconds, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import time of the entry-point modules.')
+    parser.add_argument('--runs', type=int, default=7, help='Imports per module; the median is reported')
+    parser.add_argument('--repo', default=REPO_ROOT, help='Checkout to benchmark')
+    args = parser.parse_args()
+
+    # No credentials and no .env in the working directory, as in a worker pool or a test
+    env = {k: v for k, v in os.environ.items() if not k.startswith('BRIGHTPEARL_')}
+    env['PYTHONPATH'] = args.repo
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+    baseline = statistics.median(
+        import_once(args.repo, 'sys', env)[0] for _ in range(args.runs)
+    )
+    print(f"[INFO] {args.repo}: bare interpreter start {baseline * 1000:.0f} ms")
+    for module in MODULES:
+        if not os.path.exists(os.path.join(args.repo, module + '.py')):
+            continue
+        runs = [import_once(args.repo, module, env) for _ in range(args.runs)]
+        median = statistics.median(seconds for seconds, _ in runs)
+        loaded = runs[-1][1]
+        status = 'failed without credentials' if loaded is None else 'ok'
+        print(f"{module:>17} | {median * 1000:6.0f} ms (+{(median - baseline) * 1000:5.0f} ms over bare start)"
+              f" | import {status} | heavy modules: {', '.join(loaded or []) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
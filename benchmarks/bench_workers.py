@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark convert_contacts.py --workers scaling.
+
+Generates synthetic exports, runs the in-memory conversion in a child process
+for each worker count with every address already in the normalized address
+cache (the steady state after a first run, so no network is needed), checks
+that every run wrote the same files as --workers 1 and reports wall time,
+time spent building rows and the speedup over one worker.
+
+Usage:
+    python benchmarks/bench_workers.py [--contacts 1000000] [--workers 1 2 4 8 16]
+"""
+
+import argparse
+import contextlib
+import filecmp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic_exports import generate_exports  # noqa: E402
+
+
+def run_workers(workers):
+    """Run one conversion in the current directory and print its timings as JSON"""
+    import convert_contacts
+    import parallel_convert
+
+    # Warm cache: every address already normalized (to its exported values), as after a first run
+    normalized_cache = {
+        a['addressId']: convert_contacts.normalized_cache_entry(a, convert_contacts.original_address_values(a))
+        for a in convert_contacts.read_csv(convert_contacts.ADDRESSES_CSV)
+    }
+    convert_contacts.load_normalized_addresses = lambda: normalized_cache
+
+    # Time the row building step on its own, serial or parallel
+    build_seconds = []
+
+    def timed(build):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = build(*args, **kwargs)
+            build_seconds.append(time.perf_counter() - start)
+            return result
+        return wrapper
+
+    convert_contacts.build_company_rows = timed(convert_contacts.build_company_rows)
+    parallel_convert.build_company_rows_parallel = timed(parallel_convert.build_company_rows_parallel)
+
+    args = SimpleNamespace(batch_job=False, batch_backend='local', batch_poll_interval=0,
+                           incremental=False, delta=False, workers=workers)
+    os.makedirs(convert_contacts.CONVERTED_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        convert_contacts.convert_in_memory(args)
+    print(json.dumps({
+        'workers': workers,
+        'seconds': time.perf_counter() - start,
+        'build_seconds': sum(build_seconds)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark --workers scaling of the in-memory conversion.')
+    parser.add_argument('--contacts', type=int, default=1000000, help='Number of synthetic contacts')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Worker counts to benchmark')
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_workers(args.run_one)
+        return
+
+    print(f"[INFO] {os.cpu_count()} CPUs available")
+    work_dir = tempfile.mkdtemp(prefix='bench_workers_')
+    try:
+        print(f"[INFO] Generating {args.contacts} contacts...")
+        generate_exports(os.path.join(work_dir, 'exports'), args.contacts)
+
+        baseline = None
+        identical = True
+        for workers in args.workers:
+            converted = os.path.join(work_dir, 'converted')
+            shutil.rmtree(converted, ignore_errors=True)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-one', str(workers)],
+                cwd=work_dir, check=True, capture_output=True, text=True,
+                env=dict(os.environ, PYTHONPATH=REPO_ROOT)
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+
+            reference = os.path.join(work_dir, 'converted_reference')
+            if baseline is None:
+                baseline = result
+                os.rename(converted, reference)
+                same = True
+            else:
+                same = all(
+                    filecmp.cmp(os.path.join(reference, name), os.path.join(converted, name), shallow=False)
+                    for name in ('companies.csv', 'customers.csv')
+                )
+                identical = identical and same
+            print(f"{workers:>3} workers | total {result['seconds']:8.2f}s (x{baseline['seconds'] / result['seconds']:5.2f})"
+                  f" | build rows {result['build_seconds']:8.2f}s (x{baseline['build_seconds'] / result['build_seconds']:5.2f})"
+                  f" | identical: {same}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not identical:
+        print('[ERROR] Worker counts produced different output')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Brightpearl public API, for benchmarks and regression
+runs of the export scripts without touching a live account.
+
+Serves the endpoints the scripts use from a synthetic dataset:
+
+    GET contact-service/tag
+    GET contact-service/contact-search?firstResult=&maxResults=&tagIds=
+    GET contact-service/contact/<idset>           (1,2,3 and 1-5 ID sets)
+    GET contact-service/postal-address/<idset>
+    GET order-service/order-search?firstResult=&maxResults=&departmentId=
+    GET order-service/order/<idset>
+
+Every resource is generated from its ID and the seed, so the dataset costs
+no memory and the same seed always serves the same data. Like Brightpearl,
+requests are counted per minute: every response carries the
+brightpearl-requests-remaining and brightpearl-next-throttle-period (ms)
+headers, and requests over the cap are refused with 503 (or 429). Latency,
+jitter and a rate of random 503s are configurable. GET /simulator/stats
+returns the request counts.
+
+Point the scripts at it with BRIGHTPEARL_BASE_URL (any credentials will do):
+
+    python benchmarks/bp_simulator.py --contacts 10000 --orders 10000 --port 8810
+    BRIGHTPEARL_BASE_URL=http://127.0.0.1:8810/public-api/sim BRIGHTPEARL_REQUEST_DELAY=0 python export_contacts.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+DEFAULT_PORT = 8810
+B2B_TAG_ID = 7
+DEPARTMENT_ID = 11
+MAX_PAGE_SIZE = 500  # Brightpearl's search page size limit
+MAX_ID_SET = 200  # IDs Brightpearl accepts in one ID-set request
+THROTTLE_PERIOD = 60.0  # Brightpearl counts requests per minute
+
+# (countryIsoCode, city, province, postcode, phone)
+PLACES = [
+    ('ESP', 'Madrid', 'Madrid', '28013', '612345678'),
+    ('ESP', 'BARCELONA', '', '8001', '0034 934 567 890'),
+    ('ESP', 'Sevilla', 'Andalucía', '41001', '954123456'),
+    ('ESP', 'Valencia', 'VALENCIA', '46002', '+34 963 000 000'),
+    ('USA', 'New York', 'NY', '10001', '(212) 555-0100'),
+    ('USA', 'San Francisco', 'California', '94105', '1-415-555-0100'),
+    ('FRA', 'Paris', '', '75001', '01 23 45 67 89'),
+    ('DEU', 'Berlin', 'Berlin', '10115', '030 1234567'),
+    ('GBR', 'London', '', 'SW1A 1AA', '020 7946 0958'),
+    ('ITA', 'Milano', 'MI', '20121', '02 1234 5678'),
+    ('PRT', 'Lisboa', '', '1100-148', '21 123 4567'),
+]
+STREETS = ['Calle Mayor', 'Gran Via', 'Main Street', 'Rue de Rivoli', 'Hauptstraße', 'High Street', 'Via Roma']
+PRODUCTS = [(1000 + i, 'Product {}'.format(i), 'SKU-{:05d}'.format(i)) for i in range(200)]
+
+
+class Dataset:
+    """
+    Synthetic Brightpearl data: contacts 1..contacts (about a third of them
+    individuals, the rest spread over companies of up to a few contacts),
+    up to three postal addresses per contact with shared billing/delivery
+    addresses, and orders 1..orders with 1-5 rows each.
+    """
+
+    def __init__(self, contacts, orders, seed=42):
+        self.contacts = contacts
+        self.orders = orders
+        self.seed = seed
+        self.companies = max(1, contacts // 3)
+
+    def rng(self, kind, resource_id):
+        return random.Random('{}:{}:{}'.format(self.seed, kind, resource_id))
+
+    def address_ids(self, contact_id):
+        """{type: addressId} for a contact; address IDs are contact_id * 3 + 0..2"""
+        rng = self.rng('contact-addresses', contact_id)
+        base = contact_id * 3
+        shape = rng.random()
+        if shape < 0.05:
+            return {}
+        if shape < 0.45:
+            # One address for everything
+            return {'BIL': base, 'DEL': base, 'DEF': base}
+        if shape < 0.85:
+            return {'BIL': base, 'DEL': base + 1, 'DEF': base + 1}
+        return {'BIL': base, 'DEL': base + 1, 'DEF': base + 2}
+
+    def contact(self, contact_id):
+        if not 1 <= contact_id <= self.contacts:
+            return None
+        rng = self.rng('contact', contact_id)
+        organisation_id = 0 if rng.random() < 0.33 else rng.randint(1, self.companies)
+        country, city, province, postcode, phone = rng.choice(PLACES)
+        return {
+            'contactId': contact_id,
+            'firstName': 'First{}'.format(contact_id),
+            'lastName': 'Last{}'.format(rng.randint(1, 500)),
+            'isPrimaryContact': rng.random() < 0.5,
+            'organisation': {'organisationId': organisation_id, 'name': 'Company {}'.format(organisation_id)} if organisation_id else {},
+            'communication': {
+                'emails': {'PRI': {'email': 'buyer{}@example.com'.format(rng.randint(1, self.contacts))}} if rng.random() < 0.9 else {},
+                'telephones': {'PRI': phone} if rng.random() < 0.8 else {'MOB': phone},
+                'websites': {'PRI': {'url': 'https://company{}.example.com'.format(organisation_id)}} if organisation_id else {},
+            },
+            'financialDetails': {
+                'priceListId': rng.choice([1, 2, 3]),
+                'nominalCode': '4000',
+                'taxCodeId': rng.choice([1, 7]),
+                'creditTermDays': rng.choice([0, 30, 60]),
+                'currencyId': 1,
+                'discountPercentage': 0,
+                'creditTermTypeId': 1,
+                'taxNumber': 'B{:08d}'.format(organisation_id or contact_id) if rng.random() < 0.6 else None,
+            },
+            'postAddressIds': self.address_ids(contact_id),
+            'customFields': {'PCF_CUSTWHOL': rng.choice([True, False, None]), 'PCF_JOORACCO': None},
+        }
+
+    def postal_address(self, address_id):
+        if not 3 <= address_id <= self.contacts * 3 + 2:
+            return None
+        rng = self.rng('address', address_id)
+        country, city, province, postcode, phone = rng.choice(PLACES)
+        return {
+            'addressId': address_id,
+            'addressLine1': '{} {}'.format(rng.choice(STREETS), rng.randint(1, 200)),
+            'addressLine2': 'Piso {}'.format(rng.randint(1, 9)) if rng.random() < 0.3 else '',
+            'addressLine3': city,
+            'addressLine4': province,
+            'postalCode': postcode,
+            'countryId': 0,
+            'countryIsoCode': country,
+        }
+
+    def order(self, order_id):
+        if not 1 <= order_id <= self.orders:
+            return None
+        rng = self.rng('order', order_id)
+        contact_id = rng.randint(1, max(1, self.contacts))
+        country, city, province, postcode, phone = rng.choice(PLACES)
+        party = {
+            'contactId': contact_id,
+            'addressFullName': 'First{} Last'.format(contact_id),
+            'companyName': 'Company {}'.format(contact_id % max(1, self.companies)),
+            'addressLine1': '{} {}'.format(rng.choice(STREETS), rng.randint(1, 200)),
+            'addressLine2': '',
+            'addressLine3': city,
+            'addressLine4': province,
+            'postalCode': postcode,
+            'country': country,
+            'telephone': phone,
+            'mobileTelephone': '',
+            'email': 'buyer{}@example.com'.format(contact_id),
+        }
+        rows = {}
+        for row_number in range(rng.randint(1, 5)):
+            product_id, name, sku = rng.choice(PRODUCTS)
+            quantity = rng.randint(1, 24)
+            price = round(rng.uniform(5, 120), 2)
+            rows[str(order_id * 10 + row_number)] = {
+                'productId': product_id,
+                'productName': name,
+                'productSku': sku,
+                'quantity': {'magnitude': str(quantity)},
+                'productPrice': {'value': '{:.2f}'.format(price), 'currencyCode': 'EUR'},
+                'rowValue': {
+                    'taxRate': '21.00',
+                    'taxCode': 'T20',
+                    'rowNet': {'value': '{:.2f}'.format(price * quantity), 'currencyCode': 'EUR'},
+                    'rowTax': {'value': '{:.2f}'.format(price * quantity * 0.21), 'currencyCode': 'EUR'},
+                },
+            }
+        created = 1700000000 + order_id * 600
+        return {
+            'id': order_id,
+            'orderTypeCode': 'SO',
+            'reference': 'REF-{}'.format(order_id),
+            'orderStatus': {'orderStatusId': 4, 'name': rng.choice(['New', 'Invoiced', 'Shipped'])},
+            'orderPaymentStatus': rng.choice(['PAID', 'UNPAID', 'PARTIALLY_PAID']),
+            'stockStatusCode': 'SOA',
+            'allocationStatusCode': 'AAA',
+            'shippingStatusCode': 'ASS',
+            'createdOn': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(created)),
+            'state': {'tax': 'taxable'},
+            'currency': {'orderCurrencyCode': 'EUR', 'exchangeRate': '1.000000'},
+            'delivery': {'shippingMethodId': rng.choice([1, 2, 5])},
+            'invoices': [{'invoiceReference': 'INV-{}'.format(order_id), 'taxDate': time.strftime('%Y-%m-%dT00:00:00.000Z', time.gmtime(created))}] if rng.random() < 0.7 else [],
+            'parties': {'customer': party, 'delivery': party, 'billing': party},
+            'orderRows': rows,
+        }
+
+
+def parse_id_set(id_set):
+    """[1, 2, 3, 7] for '1-3,7'"""
+    ids = []
+    for part in id_set.split(','):
+        if re.fullmatch(r'\d+-\d+', part):
+            low, high = (int(x) for x in part.split('-'))
+            ids.extend(range(low, high + 1))
+        elif part.isdigit():
+            ids.append(int(part))
+        else:
+            raise ValueError('Invalid ID set: {}'.format(id_set))
+    return ids
+
+
+class Throttle:
+    """Brightpearl-style cap of requests_per_minute per period (0 disables it); the period is shortened for quick tests"""
+
+    def __init__(self, requests_per_minute, period=THROTTLE_PERIOD):
+        self.requests_per_minute = requests_per_minute
+        self.period = period
+        self.lock = threading.Lock()
+        self.period_started = time.monotonic()
+        self.used = 0
+
+    def admit(self):
+        """Return (admitted, requests remaining, ms until the next period)"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.period_started >= self.period:
+                self.period_started = now
+                self.used = 0
+            next_period_ms = int((self.period_started + self.period - now) * 1000)
+            if not self.requests_per_minute:
+                return True, 1000000, next_period_ms
+            if self.used >= self.requests_per_minute:
+                return False, 0, next_period_ms
+            self.used += 1
+            return True, self.requests_per_minute - self.used, next_period_ms
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API behind the client's pooled session
+    disable_nagle_algorithm = True  # Headers and body are separate writes; avoid the 40ms delayed-ACK stall
+    server_version = 'bp-simulator'
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        sim = self.server.simulator
+        url = urlsplit(self.path)
+        path = url.path.strip('/')
+        if path == 'simulator/stats':
+            self.send_json(200, sim.stats())
+            return
+
+        sim.count('requests')
+        if sim.latency or sim.jitter:
+            time.sleep(max(0.0, sim.latency + sim.rng.uniform(-sim.jitter, sim.jitter)))
+        admitted, remaining, next_period_ms = sim.throttle.admit()
+        headers = {'brightpearl-requests-remaining': remaining, 'brightpearl-next-throttle-period': next_period_ms}
+        if not admitted:
+            sim.count('throttled')
+            self.send_json(sim.throttle_status, {'response': 'You have sent too many requests. Please wait before sending another request'}, headers)
+            return
+        if sim.error_rate and sim.rng.random() < sim.error_rate:
+            sim.count('errors')
+            self.send_json(503, {'response': 'Service temporarily unavailable'}, headers)
+            return
+
+        # Strip public-api/<account>/
+        parts = path.split('/')
+        if len(parts) < 4 or parts[0] != 'public-api':
+            self.send_json(404, {'errors': [{'code': 'CMNC-404', 'message': 'Unknown path /{}'.format(path)}]}, headers)
+            return
+        resource = '/'.join(parts[2:])
+        params = dict(parse_qsl(url.query))
+        try:
+            body = sim.respond(resource, params)
+        except ValueError as e:
+            self.send_json(400, {'errors': [{'code': 'CMNC-400', 'message': str(e)}]}, headers)
+            return
+        if body is None:
+            self.send_json(404, {'errors': [{'code': 'CMNC-404', 'message': 'Unknown resource {}'.format(resource)}]}, headers)
+            return
+        self.send_json(200, body, headers)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Simulator:
+    def __init__(self, dataset, latency=0.0, jitter=0.0, requests_per_minute=0, throttle_status=503, error_rate=0.0, seed=42,
+                 throttle_period=THROTTLE_PERIOD):
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = Throttle(requests_per_minute, throttle_period)
+        self.throttle_status = throttle_status
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'throttled': 0, 'errors': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, contacts=self.dataset.contacts, orders=self.dataset.orders)
+
+    def search(self, total, params):
+        """One page of a contact-search/order-search over IDs 1..total"""
+        first = int(params.get('firstResult', 1))
+        size = min(int(params.get('maxResults', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+        ids = range(first, min(total, first + size - 1) + 1)
+        return {'response': {
+            'results': [[i] for i in ids],
+            'metaData': {'resultsAvailable': total, 'resultsReturned': len(ids), 'firstResult': first, 'lastResult': first + len(ids) - 1},
+        }}
+
+    def id_set(self, id_set, fetch):
+        ids = parse_id_set(id_set)
+        if len(ids) > MAX_ID_SET:
+            raise ValueError('ID sets are limited to {} IDs'.format(MAX_ID_SET))
+        return {'response': [resource for resource in map(fetch, ids) if resource is not None]}
+
+    def respond(self, resource, params):
+        """Response body for a path below public-api/<account>/, or None for an unknown resource"""
+        dataset = self.dataset
+        if resource == 'contact-service/tag':
+            return {'response': {str(B2B_TAG_ID): {'tagId': B2B_TAG_ID, 'tagName': 'B2B'}, '8': {'tagId': 8, 'tagName': 'RETAIL'}}}
+        if resource == 'contact-service/contact-search':
+            tagged = params.get('tagIds') in (None, str(B2B_TAG_ID))
+            return self.search(dataset.contacts if tagged else 0, params)
+        if resource == 'order-service/order-search':
+            in_department = params.get('departmentId') in (None, str(DEPARTMENT_ID))
+            return self.search(dataset.orders if in_department else 0, params)
+        path, _, id_set = resource.rpartition('/')
+        fetch = {
+            'contact-service/contact': dataset.contact,
+            'contact-service/postal-address': dataset.postal_address,
+            'order-service/order': dataset.order,
+        }.get(path)
+        if fetch is None or not id_set:
+            return None
+        return self.id_set(id_set, fetch)
+
+
+def start_simulator(simulator, host='127.0.0.1', port=DEFAULT_PORT):
+    """Serve simulator on a background thread and return the server (port 0 picks a free port)"""
+    server = ThreadingHTTPServer((host, port), SimulatorHandler)
+    server.daemon_threads = True
+    server.simulator = simulator
+    threading.Thread(target=server.serve_forever, name='bp-simulator', daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve a synthetic Brightpearl API for benchmarks and tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on (0 picks a free port)')
+    parser.add_argument('--contacts', type=int, default=1000, help='B2B contacts in the dataset')
+    parser.add_argument('--orders', type=int, default=1000, help='Orders in the dataset')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- seconds around --latency')
+    parser.add_argument('--requests-per-minute', type=int, default=0,
+                        help='Per-minute request cap, like Brightpearl (200 on a standard account); 0 disables throttling')
+    parser.add_argument('--throttle-period', type=float, default=THROTTLE_PERIOD,
+                        help='Seconds per throttle period (Brightpearl: 60); shorten it to exercise throttling quickly')
+    parser.add_argument('--throttle-status', type=int, choices=[429, 503], default=503, help='Status of throttled responses')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a random 503')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    simulator = Simulator(Dataset(args.contacts, args.orders, args.seed), args.latency, args.jitter,
+                          args.requests_per_minute, args.throttle_status, args.error_rate, args.seed, args.throttle_period)
+    server = start_simulator(simulator, args.host, args.port)
+    host, port = server.server_address[:2]
+    # The benchmark reads the URL from this line
+    print("[INFO] Brightpearl simulator listening on http://{}:{}/public-api/sim ({} contacts, {} orders)".format(
+        host, port, args.contacts, args.orders), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Brightpearl export generator for the benchmarks.
+
+Writes exports/companies.csv, contacts.csv and addresses.csv with the same
+columns, value formats and ordering as export_contacts.py, using a fixed seed
+so runs are repeatable. The data is shaped like a real wholesale account:
+
+- Company sizes follow a long tail. Most customers are independent shops
+  without an organisation (their companyId is their contactId, as in the
+  export), some are small groups and a few are chains with dozens to
+  hundreds of locations, occasionally across borders.
+- The contacts of a group share one head-office billing address (same text,
+  one address ID per contact, as Brightpearl copies it) and often a central
+  purchasing email. Independents mostly use one address for billing and
+  delivery.
+- Countries are a Spanish/US/EU mix (COUNTRY_WEIGHTS). Addresses are written
+  the way customers type them: province names, abbreviations, autonomous
+  communities or nothing; Spanish postcodes that lost their leading zero;
+  upper-case cities; phones in national, international and broken formats;
+  duplicate delivery addresses that differ only in case and spacing.
+
+Contacts are written in contact ID order with the companies interleaved, and
+companies in order of their first contact, as the export writes them.
+
+Usage:
+    python benchmarks/synthetic_exports.py [--contacts 100000] [--seed 42] [DIRECTORY]
+"""
+
+import argparse
+import csv
+import os
+import random
+
+COMPANY_COLUMNS = ['companyId', 'companyName', 'email', 'phone', 'website', 'isPrimaryContact', 'priceListId', 'nominalCode', 'taxCodeId', 'creditTermDays', 'currencyId', 'discountPercentage', 'creditTermTypeId', 'taxNumber']
+CONTACT_COLUMNS = ['contactId', 'name', 'email', 'phone', 'tagList', 'companyId', 'Wholesale', 'Joor Account Code']
+ADDRESS_COLUMNS = ['contactId', 'addressId', 'isBilling', 'isDelivery', 'isDefault', 'addressLine1', 'addressLine2', 'addressLine3', 'addressLine4', 'city', 'postcode', 'country']
+
+# Share of companies per country (chain locations abroad are drawn from the same weights)
+COUNTRY_WEIGHTS = [
+    ('ESP', 45), ('USA', 20), ('FRA', 8), ('DEU', 7), ('ITA', 7), ('PRT', 5), ('NLD', 3), ('BEL', 3), ('GBR', 2),
+]
+
+# country: [(city, province spellings seen in the exports, postcode prefix, rest of the postcode), ...]
+# An empty spelling leaves the province blank; in the rest of the postcode # is a digit and @ a letter.
+PLACES = {
+    'ESP': [
+        ('Madrid', ['Madrid', 'MADRID', '', 'Comunidad de Madrid'], '280', '##'),
+        ('BARCELONA', ['Barcelona', '', 'Cataluña', 'BCN'], '080', '##'),
+        ('Sevilla', ['Sevilla', 'Andalucía', ''], '410', '##'),
+        ('Málaga', ['Málaga', 'Malaga', 'Andalucía'], '290', '##'),
+        ('Valencia', ['Valencia', 'València', 'Comunidad Valenciana'], '460', '##'),
+        ('Bilbao', ['Bizkaia', 'Vizcaya', 'País Vasco'], '480', '##'),
+        ('Zaragoza', ['Zaragoza', ''], '500', '##'),
+        ('A Coruña', ['A Coruña', 'La Coruña', 'Galicia'], '150', '##'),
+        ('Palma de Mallorca', ['Baleares', 'Illes Balears', ''], '070', '##'),
+        ('Alicante', ['Alicante', 'Alacant', ''], '030', '##'),
+        ('Girona', ['Girona', 'Gerona', ''], '170', '##'),
+        ('San Sebastián', ['Gipuzkoa', 'Guipúzcoa'], '200', '##'),
+    ],
+    'USA': [
+        ('New York', ['NY', 'New York', ''], '100', '##'),
+        ('Brooklyn', ['NY', 'New York'], '112', '##'),
+        ('Los Angeles', ['CA', 'California'], '900', '##'),
+        ('San Francisco', ['CA', 'California', ''], '941', '##'),
+        ('Miami', ['FL', 'Florida'], '331', '##'),
+        ('Chicago', ['IL', 'Illinois'], '606', '##'),
+        ('Austin', ['TX', 'Texas'], '787', '##'),
+        ('Seattle', ['WA', 'Washington'], '981', '##'),
+        ('Boston', ['MA', 'Massachusetts', ''], '021', '##'),
+    ],
+    'FRA': [('Paris', ['', 'Île-de-France'], '750', '##'), ('Lyon', ['Rhône', ''], '690', '##'), ('Marseille', ['', 'Bouches-du-Rhône'], '130', '##')],
+    'DEU': [('Berlin', ['Berlin', ''], '101', '##'), ('München', ['Bayern', ''], '803', '##'), ('Hamburg', ['', 'Hamburg'], '203', '##')],
+    'ITA': [('Milano', ['MI', 'Lombardia'], '201', '##'), ('Roma', ['RM', ''], '001', '##'), ('Firenze', ['FI', 'Toscana'], '501', '##')],
+    'PRT': [('Lisboa', ['', 'Lisboa'], '1100-', '###'), ('Porto', ['', 'Porto'], '4000-', '###')],
+    'NLD': [('Amsterdam', ['Noord-Holland', ''], '101', '# @@'), ('Rotterdam', ['Zuid-Holland', ''], '301', '# @@')],
+    'BEL': [('Bruxelles', ['', 'Brussels'], '10', '##'), ('Antwerpen', ['Antwerp', ''], '20', '##')],
+    'GBR': [('London', ['', 'Greater London'], 'SW1A ', '#@@'), ('Manchester', ['', 'Greater Manchester'], 'M1 ', '#@@')],
+}
+
+# Country written as Brightpearl exports it; a few Spanish records carry the 2-letter code
+COUNTRY_SPELLINGS = {'ESP': ['ESP', 'ESP', 'ESP', 'ES']}
+
+STREETS = {
+    'ESP': ['Calle Mayor', 'Avenida Diagonal', 'Calle Serrano', 'Paseo de Gracia', 'Gran Vía', 'Calle Larios', 'Plaza Nueva'],
+    'USA': ['Main St', 'Broadway', 'Market Street', '5th Ave', 'Ocean Drive', 'Congress Ave'],
+    'FRA': ['Rue de Rivoli', 'Boulevard Haussmann', 'Rue de la République'],
+    'DEU': ['Friedrichstraße', 'Maximilianstraße', 'Mönckebergstraße'],
+    'ITA': ['Via Montenapoleone', 'Via del Corso', 'Via Roma'],
+    'PRT': ['Rua Augusta', 'Avenida da Liberdade', 'Rua de Santa Catarina'],
+    'NLD': ['Kalverstraat', 'Lijnbaan'],
+    'BEL': ['Rue Neuve', 'Meir'],
+    'GBR': ['Oxford Street', 'Market Street'],
+}
+
+SHOP_WORDS = ['Moda', 'Boutique', 'Studio', 'Concept', 'Store', 'Atelier', 'Shop', 'Casa', 'Lab', 'Corner']
+NAME_WORDS = ['Luna', 'Sol', 'Mar', 'Olivia', 'North', 'Verde', 'Azul', 'Blanca', 'Nova', 'Ribera', 'Alba', 'Brisa']
+
+# (share of companies, smallest, largest number of contacts)
+COMPANY_SIZES = [
+    (0.70, 1, 1),  # independent shop, no organisation in Brightpearl
+    (0.22, 2, 5),  # small group
+    (0.07, 6, 40),  # regional chain
+    (0.01, 41, 300),  # national chain, some locations abroad
+]
+
+ORGANISATION_ID_BASE = 5000000  # Organisation IDs live in their own range, above the contact IDs
+
+
+def pick_country(rng):
+    return rng.choices([c for c, _ in COUNTRY_WEIGHTS], weights=[w for _, w in COUNTRY_WEIGHTS])[0]
+
+
+def make_place(rng, country):
+    """One address as (line1, line2, city, province, postcode, country) the way a customer typed it"""
+    city, provinces, prefix, rest = rng.choice(PLACES[country])
+    postcode = prefix + ''.join(
+        rng.choice('0123456789') if c == '#' else rng.choice('ABDEHJLNPRSTUWXYZ') if c == '@' else c for c in rest
+    )
+    if country == 'ESP' and postcode.startswith('0') and rng.random() < 0.3:
+        postcode = postcode[1:]  # Lost its leading zero in a spreadsheet
+    if rng.random() < 0.1:
+        city = city.upper()
+    line1 = '{} {}'.format(rng.choice(STREETS[country]), rng.randint(1, 250))
+    line2 = rng.choice(['', '', '', 'Local {}'.format(rng.randint(1, 20)), 'Suite {}'.format(rng.randint(100, 900))])
+    written_country = rng.choice(COUNTRY_SPELLINGS.get(country, [country]))
+    return line1, line2, city, rng.choice(provinces), postcode, written_country
+
+
+def make_phone(rng, country):
+    """A phone number in one of the formats found in the exports (or missing)"""
+    r = rng.random()
+    if r < 0.05:
+        return ''
+    if r < 0.07:
+        return 'ask for {}'.format(rng.choice(NAME_WORDS))
+    digits = ''.join(rng.choice('0123456789') for _ in range(8))
+    if country == 'ESP':
+        number = rng.choice('69') + digits
+        return rng.choice([number, '+34 ' + number, '0034 ' + number, '{} {} {}'.format(number[:3], number[3:6], number[6:])])
+    if country == 'USA':
+        number = '2' + digits[:2] + '555' + digits[2:6]
+        return rng.choice(['({}) {}-{}'.format(number[:3], number[3:6], number[6:]), '1-{}-{}-{}'.format(number[:3], number[3:6], number[6:]), '+1' + number])
+    return rng.choice(['0' + digits + '1', '+{} {}'.format(rng.randint(30, 49), digits)])
+
+
+def company_sizes(rng, contact_count):
+    """Yield the number of contacts of each company until contact_count contacts are assigned"""
+    weights = [share for share, _, _ in COMPANY_SIZES]
+    remaining = contact_count
+    while remaining > 0:
+        _, smallest, largest = rng.choices(COMPANY_SIZES, weights=weights)[0]
+        size = min(remaining, rng.randint(smallest, largest))
+        remaining -= size
+        yield size
+
+
+def generate_exports(directory, contact_count, seed=42):
+    """Generate a synthetic export set with contact_count contacts"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    # Contact slots are shuffled so a company's contacts are spread over the ID range
+    slots = []  # (company index, location index)
+    companies = []  # (name, country, billing place or None, purchasing email or None, organisation ID or None)
+    for index, size in enumerate(company_sizes(rng, contact_count)):
+        country = pick_country(rng)
+        name = '{} {} {}'.format(rng.choice(NAME_WORDS), rng.choice(SHOP_WORDS), index + 1)
+        if size == 1:
+            companies.append((name, country, None, None, None))
+        else:
+            purchasing = 'compras@{}.example.com'.format(index + 1) if rng.random() < 0.5 else None
+            companies.append((name, country, make_place(rng, country), purchasing, ORGANISATION_ID_BASE + index))
+        slots.extend((index, location) for location in range(size))
+    rng.shuffle(slots)
+
+    address_id = 0
+    company_rows_written = set()
+    with open(os.path.join(directory, 'contacts.csv'), 'w', newline='', encoding='utf-8') as cf, \
+            open(os.path.join(directory, 'addresses.csv'), 'w', newline='', encoding='utf-8') as af, \
+            open(os.path.join(directory, 'companies.csv'), 'w', newline='', encoding='utf-8') as mf:
+        contacts = csv.writer(cf)
+        addresses = csv.writer(af)
+        company_writer = csv.writer(mf)
+        contacts.writerow(CONTACT_COLUMNS)
+        addresses.writerow(ADDRESS_COLUMNS)
+        company_writer.writerow(COMPANY_COLUMNS)
+
+        for contact_id, (index, location) in enumerate(slots, start=1):
+            name, company_country, billing_place, purchasing, organisation_id = companies[index]
+            # National chains put some locations abroad
+            country = company_country if organisation_id is None or rng.random() < 0.9 else pick_country(rng)
+            phone = make_phone(rng, country)
+            if purchasing and rng.random() < 0.7:
+                email = purchasing
+            elif rng.random() < 0.92:
+                email = 'buyer{}@example.com'.format(contact_id)
+            else:
+                email = ''
+            company_id = organisation_id if organisation_id is not None else contact_id
+            contact_name = name if organisation_id is None else '{} {}'.format(name, location + 1)
+            contacts.writerow([contact_id, contact_name, email, phone, '', company_id,
+                               'TRUE' if rng.random() < 0.8 else 'FALSE',
+                               'J{:06d}'.format(contact_id) if rng.random() < 0.15 else ''])
+
+            if company_id not in company_rows_written:
+                company_rows_written.add(company_id)
+                tax_number = ''
+                if company_country == 'ESP':
+                    tax_number = 'B{:08d}'.format(index + 1)
+                elif company_country != 'USA' and rng.random() < 0.6:
+                    tax_number = '{}{:09d}'.format(company_country[:2], index + 1)
+                company_writer.writerow([
+                    company_id, name, email, phone, '', 'true', rng.choice([1, 2, 3]), 4000, rng.choice([1, 7, 9]),
+                    rng.choice([0, 30, 60]), 1 if company_country != 'USA' else 2, rng.choice([0, 0, 5, 10]), 2, tax_number,
+                ])
+
+            delivery = make_place(rng, country)
+            if billing_place is not None:
+                # Group member: head-office billing address plus the store's delivery address
+                address_id += 1
+                line1, line2, city, province, postcode, written = billing_place
+                addresses.writerow([contact_id, address_id, 'TRUE', 'FALSE', 'FALSE', line1, line2, city, province, city, postcode, written])
+                address_id += 1
+                line1, line2, city, province, postcode, written = delivery
+                addresses.writerow([contact_id, address_id, 'FALSE', 'TRUE', 'TRUE', line1, line2, city, province, city, postcode, written])
+            elif rng.random() < 0.75:
+                address_id += 1
+                line1, line2, city, province, postcode, written = delivery
+                addresses.writerow([contact_id, address_id, 'TRUE', 'TRUE', 'TRUE', line1, line2, city, province, city, postcode, written])
+            else:
+                for is_billing, is_delivery, is_default, (line1, line2, city, province, postcode, written) in (
+                        ('TRUE', 'FALSE', 'FALSE', make_place(rng, country)), ('FALSE', 'TRUE', 'TRUE', delivery)):
+                    address_id += 1
+                    addresses.writerow([contact_id, address_id, is_billing, is_delivery, is_default, line1, line2, city, province, city, postcode, written])
+
+            # Extra delivery locations (warehouse, second store), some re-typed duplicates of the main one
+            for _ in range(rng.choice([0, 0, 0, 0, 0, 1, 1, 2])):
+                address_id += 1
+                if rng.random() < 0.3:
+                    line1, line2, city, province, postcode, written = delivery
+                    line1 = '  '.join(line1.lower().split(' '))
+                else:
+                    line1, line2, city, province, postcode, written = make_place(rng, country)
+                addresses.writerow([contact_id, address_id, 'FALSE', 'TRUE', 'FALSE', line1, line2, city, province, city, postcode, written])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Brightpearl export set.')
+    parser.add_argument('directory', nargs='?', default='./exports', help='Output directory (default: ./exports)')
+    parser.add_argument('--contacts', type=int, default=100000, help='Number of contacts')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_exports(args.directory, args.contacts, args.seed)
+    print(f"[INFO] Wrote {args.contacts} synthetic contacts to {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Shared Brightpearl configuration and HTTP client for the export scripts.
+
+Importing this package has no side effects: settings are read from the
+environment (and .env) the first time they are needed, and requests is only
+imported when the first request is made.
+"""
+
+from brightpearl_export.accounts import (account_textfile, add_account_arguments, current_profile, export_path, prefixed_output,
+                                         run_accounts, set_output_label)
+from brightpearl_export.budget import SharedRateBudget
+from brightpearl_export.client import BrightpearlClient, get_client, set_thread_client
+from brightpearl_export.config import BrightpearlConfig, ConfigError, config_or_exit, get_config, getenv
+from brightpearl_export.dead_letters import DeadLetters, add_retry_arguments, dead_letters_path, patch_csv, retry_pass, retryable
+from brightpearl_export.distributed import add_distributed_arguments, coordinate, merge_shards, run_worker
+from brightpearl_export.lookup import add_daemon_arguments, fetch_id_set, lookup_client
+from brightpearl_export.metrics import RequestMetrics, http_summary, write_atomic, write_run_report
+from brightpearl_export.planning import RequestPlan, add_plan_arguments, search_pages
+from brightpearl_export.profiling import PROFILER, StageProfiler, add_profile_arguments
+from brightpearl_export.progress import ProgressReporter
+from brightpearl_export.work_queue import WorkQueue
+
+__all__ = [
+    'BrightpearlClient',
+    'BrightpearlConfig',
+    'ConfigError',
+    'DeadLetters',
+    'PROFILER',
+    'ProgressReporter',
+    'RequestPlan',
+    'RequestMetrics',
+    'SharedRateBudget',
+    'StageProfiler',
+    'WorkQueue',
+    'account_textfile',
+    'add_account_arguments',
+    'add_daemon_arguments',
+    'add_distributed_arguments',
+    'add_plan_arguments',
+    'add_profile_arguments',
+    'add_retry_arguments',
+    'config_or_exit',
+    'coordinate',
+    'current_profile',
+    'dead_letters_path',
+    'export_path',
+    'fetch_id_set',
+    'get_client',
+    'get_config',
+    'getenv',
+    'http_summary',
+    'lookup_client',
+    'merge_shards',
+    'patch_csv',
+    'prefixed_output',
+    'retry_pass',
+    'retryable',
+    'run_accounts',
+    'run_worker',
+    'search_pages',
+    'set_output_label',
+    'set_thread_client',
+    'write_atomic',
+    'write_run_report',
+]
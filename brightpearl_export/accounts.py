@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent exports of several Brightpearl accounts in one process (--accounts).
+
+Each account profile (see config.py) is exported on its own thread with its
+own BrightpearlClient: its own connection pool, request delay and 429/503
+backoff, since Brightpearl quotas are per account and one throttled account
+should not slow the others down. On an account's thread get_client()
+returns that account's client and export_path() points into
+exports/<profile>/. Lines it prints (stdout and stderr) are prefixed with
+the profile name, and progress is written as log lines.
+
+When every account has finished, a combined report adds up their request
+metrics next to the per-account run reports.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+from brightpearl_export.client import BrightpearlClient, set_thread_client
+from brightpearl_export.config import ConfigError, get_profile_config
+from brightpearl_export.metrics import http_summary, write_atomic
+from brightpearl_export.progress import format_duration
+
+EXPORT_DIR = 'exports'
+
+_current = threading.local()  # .profile: the account profile exported on this thread; .label: its output prefix
+
+
+def current_profile():
+    """The account profile exported on the calling thread, or None"""
+    return getattr(_current, 'profile', None)
+
+
+def export_path(name):
+    """exports/<name>, or exports/<profile>/<name> on an account's thread"""
+    profile = current_profile()
+    return os.path.join(EXPORT_DIR, profile, name) if profile else os.path.join(EXPORT_DIR, name)
+
+
+def output_label():
+    """The prefix of the lines printed on the calling thread, or None"""
+    return getattr(_current, 'label', None)
+
+
+def set_output_label(label):
+    """Prefix the lines the calling thread prints while a PrefixedStream is installed"""
+    _current.label = label
+
+
+def account_textfile(path):
+    """A Prometheus textfile path of its own for this thread's account: metrics.prom becomes metrics.<profile>.prom"""
+    profile = current_profile()
+    if not path or not profile:
+        return path
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, profile, ext)
+
+
+def add_account_arguments(parser):
+    """Add --accounts to an export script's argument parser"""
+    parser.add_argument('--accounts', nargs='+', metavar='PROFILE',
+                        help='Export these account profiles concurrently (settings BRIGHTPEARL_<PROFILE>_ACCOUNT etc.), '
+                             'each into exports/<profile>/, and write a combined report')
+
+
+class PrefixedStream:
+    """
+    Wraps stdout or stderr so that lines written on a thread with an output
+    label are prefixed with it and written whole, without interleaving with
+    other threads' lines
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.pending = {}  # label: incomplete last line
+
+    def write(self, text):
+        label = output_label()
+        if label is None:
+            return self.stream.write(text)
+        lines = (self.pending.pop(label, '') + text).split('\n')
+        if lines[-1]:
+            self.pending[label] = lines[-1]
+        if len(lines) > 1:
+            with self.lock:
+                self.stream.write(''.join('[{}] {}\n'.format(label, line) for line in lines[:-1]))
+        return len(text)
+
+    def flush(self):
+        if output_label() is None:
+            self.stream.flush()
+            return
+        with self.lock:
+            self.stream.flush()
+
+    def isatty(self):
+        # Several threads cannot redraw one status line in place
+        return output_label() is None and self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class prefixed_output:
+    """Install PrefixedStreams on stdout and stderr for the duration of a with block"""
+
+    def __enter__(self):
+        self.streams = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = PrefixedStream(sys.stdout), PrefixedStream(sys.stderr)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        sys.stdout, sys.stderr = self.streams
+        return False
+
+
+def run_accounts(script, profiles, export, report_path):
+    """
+    Run export() concurrently for each profile, on a thread bound to the
+    profile's client and output directory. export returns the account's run
+    report (a dict) or None. Writes the combined report to report_path and
+    returns it; exits before starting anything if a profile is misconfigured.
+    """
+    try:
+        configs = {profile: get_profile_config(profile) for profile in profiles}
+    except ConfigError as e:
+        print(e)
+        sys.exit(1)
+
+    started = time.time()
+    reports = {}
+    failures = {}
+
+    def run(profile):
+        _current.profile = profile
+        set_output_label(profile)
+        set_thread_client(BrightpearlClient.from_config(configs[profile]))
+        try:
+            reports[profile] = export()
+        except SystemExit as e:
+            failures[profile] = 'exited with status {}'.format(e.code)
+        except Exception as e:
+            failures[profile] = '{}: {}'.format(type(e).__name__, e)
+            print('[ERROR] Export failed: {}'.format(failures[profile]))
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+    print("[INFO] Exporting {} accounts concurrently: {}".format(len(profiles), ', '.join(profiles)))
+    with prefixed_output():
+        threads = [threading.Thread(target=run, args=(profile,), name='account-' + profile) for profile in profiles]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return write_accounts_report(report_path, script, started, configs, reports, failures)
+
+
+def write_accounts_report(path, script, started, configs, reports, failures):
+    """Write and print the combined report of a multi-account run (or of its --plan)"""
+    finished = time.time()
+    planning = any('estimated_seconds' in report for report in reports.values() if report)
+    accounts = {}
+    totals = {'requests': 0, 'retries': 0, 'bytes': 0, 'throttled': 0, 'latency_seconds': 0.0,
+              'sleep_seconds': {'limiter': 0.0, 'backoff': 0.0}}
+    if planning:
+        totals = {'requests': 0, 'estimated_seconds': 0.0}
+    for profile, config in configs.items():
+        report = reports.get(profile)
+        entry = {'account': config.account, 'output_dir': os.path.join(EXPORT_DIR, profile)}
+        accounts[profile] = entry
+        if profile in failures or not report:
+            entry['status'] = 'failed'
+            entry['error'] = failures.get(profile, 'no report')
+            continue
+        entry['status'] = 'ok'
+        entry.update({key: value for key, value in report.items() if key not in ('script', 'http')})
+        if planning:
+            # Accounts run concurrently, so the slowest one sets the wall time
+            totals['requests'] += report['requests']
+            totals['estimated_seconds'] = max(totals['estimated_seconds'], report['estimated_seconds'])
+            continue
+        http = entry['http'] = http_summary(report['http'])
+        for key in ('requests', 'retries', 'bytes', 'throttled', 'latency_seconds'):
+            totals[key] += http[key]
+        for kind, seconds in http['sleep_seconds'].items():
+            totals['sleep_seconds'][kind] = totals['sleep_seconds'].get(kind, 0.0) + seconds
+    if not planning:
+        totals['latency_seconds'] = round(totals['latency_seconds'], 3)
+        totals['sleep_seconds'] = {kind: round(seconds, 3) for kind, seconds in totals['sleep_seconds'].items()}
+
+    combined = {
+        'script': script,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished)),
+        'wall_seconds': round(finished - started, 3),
+        'accounts': accounts,
+        'totals': totals,
+    }
+    write_atomic(path, json.dumps(combined, indent=2) + '\n')
+
+    print("[INFO] {} accounts in {:.1f}s:".format(len(accounts), finished - started))
+    for profile, entry in accounts.items():
+        if entry['status'] != 'ok':
+            print("[INFO]   {:<12} failed ({})".format(profile, entry['error']))
+        elif planning:
+            print("[INFO]   {:<12} {} requests planned, about {}".format(
+                profile, entry['requests'], format_duration(entry['estimated_seconds'])))
+        else:
+            print("[INFO]   {:<12} {:.1f}s, {} requests, {} throttled".format(
+                profile, entry['wall_seconds'], entry['http']['requests'], entry['http']['throttled']))
+    if planning:
+        print("[INFO] {} requests planned in total, about {} with the accounts exported concurrently. Report: {}".format(
+            totals['requests'], format_duration(totals['estimated_seconds']), path))
+    else:
+        print("[INFO] {} requests in total ({} throttled, {} retries). Report: {}".format(
+            totals['requests'], totals['throttled'], totals['retries'], path))
+    return combined
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+A request rate budget shared by several jobs against one Brightpearl account.
+
+The budget hands out request slots at requests_per_minute, one every
+60 / requests_per_minute seconds. Each job draws from it through its own
+BudgetShare, set as its client's limiter. Slots go to the waiting job
+that has used the least of its weight: with weights 2 and 1, two jobs that
+both keep requesting get two thirds and one third of the budget. A job
+that is not requesting leaves its slots to the others, so a job running
+alone gets the whole budget.
+
+Slots are spaced on the wall clock, not slept after every request as
+request_delay is, so Brightpearl's latency does not slow the budget down.
+Idle time is not saved up for a burst later.
+"""
+
+import threading
+import time
+
+
+class SharedRateBudget:
+    """Weighted fair request slots at requests_per_minute across jobs"""
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.interval = 60.0 / requests_per_minute
+        self.condition = threading.Condition()
+        self.next_slot = 0.0
+        self.virtual_time = 0.0  # The usage (requests / weight) of the last share served
+        self.waiting = set()
+        self.shares = {}
+
+    def share(self, name, weight=1.0):
+        """The share of job name, with its weight against the other shares"""
+        if weight <= 0:
+            raise ValueError('The weight of {} must be positive, got {}'.format(name, weight))
+        share = BudgetShare(self, name, weight)
+        self.shares[name] = share
+        return share
+
+    def acquire(self, share):
+        """Wait for share's next slot; returns the seconds waited"""
+        start = time.monotonic()
+        with self.condition:
+            # A share that was idle starts level with the others instead of catching up on slots
+            share.usage = max(share.usage, self.virtual_time)
+            self.waiting.add(share)
+            try:
+                while True:
+                    now = time.monotonic()
+                    turn = min(self.waiting, key=lambda s: (s.usage, s.name))
+                    if turn is share and now >= self.next_slot:
+                        break
+                    self.condition.wait(max(self.next_slot - now, 0.0) if turn is share else None)
+                self.next_slot = max(self.next_slot, now) + self.interval
+                self.virtual_time = share.usage
+                share.usage += 1.0 / share.weight
+                share.requests += 1
+            finally:
+                self.waiting.discard(share)
+                self.condition.notify_all()
+        waited = time.monotonic() - start
+        share.waited += waited
+        return waited
+
+    def snapshot(self):
+        return {
+            'requests_per_minute': self.requests_per_minute,
+            'shares': {name: share.snapshot() for name, share in self.shares.items()},
+        }
+
+
+class BudgetShare:
+    """One job's limiter on a SharedRateBudget"""
+
+    def __init__(self, budget, name, weight):
+        self.budget = budget
+        self.name = name
+        self.weight = weight
+        self.usage = 0.0
+        self.requests = 0
+        self.waited = 0.0
+
+    def acquire(self):
+        return self.budget.acquire(self)
+
+    def snapshot(self):
+        return {'weight': self.weight, 'requests': self.requests, 'waited_seconds': round(self.waited, 3)}
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP client for the Brightpearl public API.
+
+One pooled requests.Session per client, created (and requests imported) on
+the first request. get() keeps the export scripts' rate limiting: a delay
+before every request and exponential backoff on 429 and 503 responses.
+A client can instead take its requests from a limiter shared with other
+clients (budget.py).
+Every attempt and sleep is recorded in the client's RequestMetrics.
+When get() gives up it returns None; capture_failures() collects why, so
+callers can keep the entity as a dead letter (dead_letters.py).
+get_response() also counts a body without records as a failure.
+"""
+
+import contextlib
+import itertools
+import sys
+import threading
+import time
+
+from brightpearl_export.config import get_config
+from brightpearl_export.metrics import RequestMetrics, endpoint_template
+
+REQUEST_DELAY = 0.5  # Half second delay between requests
+MIN_BACKOFF = 0.5  # Backoff after a 429/503 starts from at least this, even with a smaller request delay
+MAX_RETRIES = 5
+POOL_SIZE = 10
+
+# Brightpearl accepts up to 200 IDs in one ID-set request (e.g. /contact/1,2,3)
+ID_SET_SIZE = 200
+
+INDICATORS = {
+    'error': '[ERROR]',
+    'warning': '[WARNING]',
+}
+
+_client = None
+_thread = threading.local()  # .client: the client of the account exported on this thread (accounts.py)
+
+
+def throttle_period(resp):
+    """Seconds until Brightpearl's next throttle period, from its brightpearl-next-throttle-period header (ms), or 0"""
+    value = resp.headers.get('brightpearl-next-throttle-period', '')
+    return int(value) / 1000 if value.isdigit() else 0
+
+
+def chunked(items, size):
+    """Yield lists of up to size items from any iterable"""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BrightpearlClient:
+    """Requests against one API base URL with one set of headers"""
+
+    def __init__(self, base_url, headers, request_delay=None, limiter=None):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        # Sleep before every request made with retry, so at most 1 / request_delay requests per second
+        self.request_delay = REQUEST_DELAY if request_delay is None else request_delay
+        # With a limiter, requests wait for limiter.acquire() instead of sleeping request_delay
+        self.limiter = limiter
+        self.max_retries = MAX_RETRIES
+        self.metrics = RequestMetrics()
+        self._session = None
+        self._capture = threading.local()  # .failures: the list capture_failures() is filling on this thread
+
+    @classmethod
+    def from_config(cls, config, limiter=None):
+        return cls(config.base_url, config.headers, config.request_delay, limiter)
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+
+    def url(self, path):
+        return '{}/{}'.format(self.base_url, path)
+
+    def send(self, url, params=None):
+        """One GET attempt, recorded in the metrics"""
+        start = time.perf_counter()
+        try:
+            resp = self.session.get(url, params=params)
+        except Exception:
+            self.metrics.record_request(url, 'error', time.perf_counter() - start)
+            raise
+        self.metrics.record_request(url, resp.status_code, time.perf_counter() - start, len(resp.content))
+        return resp
+
+    def get(self, url, params=None, retry=True):
+        """
+        GET url and return the response, or None after printing the error.
+        With retry, every request waits request_delay first and 429/503
+        responses are retried with exponential backoff (at least until the
+        next throttle period Brightpearl announces) up to max_retries times;
+        without it, one immediate attempt is made (interactive lookups).
+        """
+        import requests
+        max_retries = self.max_retries if retry else 1
+        delay = self.request_delay
+        for attempt in range(max_retries):
+            try:
+                if retry:
+                    if attempt or self.limiter is None:
+                        time.sleep(delay)
+                        # After a 429/503 the doubled delay is part of the backoff
+                        self.metrics.record_sleep('limiter' if attempt == 0 else 'backoff', delay)
+                    if self.limiter is not None:
+                        # Retries count against the shared budget too
+                        self.metrics.record_sleep('limiter', self.limiter.acquire())
+                resp = self.send(url, params)
+                resp.raise_for_status()
+                return resp
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code
+                if status in (429, 503):
+                    if attempt < max_retries - 1:
+                        delay = max(delay, MIN_BACKOFF)
+                        wait = max(delay * 2, throttle_period(e.response))
+                        print("{} {} error on {} (attempt {}/{}), waiting {} seconds...".format(
+                            INDICATORS['warning'], status, url, attempt + 1, max_retries, wait
+                        ), file=sys.stderr)
+                        self.metrics.record_retry(url)
+                        time.sleep(wait)
+                        self.metrics.record_sleep('backoff', wait)
+                        delay *= 2
+                        continue
+                print("{} HTTP error on {}: {}".format(INDICATORS['error'], url, str(e)), file=sys.stderr)
+                return self.failed(url, status, str(e), attempt + 1)
+            except Exception as e:
+                print("{} Request error on {}: {}".format(INDICATORS['error'], url, str(e)), file=sys.stderr)
+                return self.failed(url, None, '{}: {}'.format(type(e).__name__, e), attempt + 1)
+        print("{} Max retries exceeded for {}".format(INDICATORS['error'], url), file=sys.stderr)
+        return self.failed(url, None, 'max retries exceeded', max_retries)
+
+    def get_response(self, url, params=None):
+        """
+        get() url and return the records in the 'response' list of its body, or
+        None. A body that is not JSON or holds no records is handed to failed()
+        like an HTTP error, with the 200 status, so a dead letter is not retried
+        in the run.
+        """
+        resp = self.get(url, params=params)
+        if resp is None:
+            return None
+        try:
+            records = resp.json().get('response')
+        except (ValueError, AttributeError) as e:
+            print("{} Invalid response from {}: {}".format(INDICATORS['error'], url, str(e)), file=sys.stderr)
+            return self.failed(url, resp.status_code, 'invalid response: {}'.format(e), 1)
+        if not records:
+            print("{} Empty response from {}".format(INDICATORS['error'], url), file=sys.stderr)
+            return self.failed(url, resp.status_code, 'empty response', 1)
+        return records
+
+    def failed(self, url, status, error, attempts):
+        """Hand a failed get() to the capture_failures() block running on this thread, if any; returns None"""
+        failures = getattr(self._capture, 'failures', None)
+        if failures is not None:
+            failures.append({'endpoint': endpoint_template(url), 'url': url, 'status': status, 'error': error, 'attempts': attempts})
+        return None
+
+    @contextlib.contextmanager
+    def capture_failures(self):
+        """Collect the get() calls that give up on this thread inside the block, as dicts of endpoint, url, status and error"""
+        previous = getattr(self._capture, 'failures', None)
+        self._capture.failures = failures = []
+        try:
+            yield failures
+        finally:
+            self._capture.failures = previous
+
+    def gentler(self, request_delay, max_retries):
+        """
+        A client for the same account that waits at least request_delay before
+        each request and retries up to max_retries times. It shares this
+        client's metrics and limiter, so its requests count in the same run
+        report and budget.
+        """
+        client = BrightpearlClient(self.base_url, self.headers, max(self.request_delay, request_delay), self.limiter)
+        client.max_retries = max(self.max_retries, max_retries)
+        client.metrics = self.metrics
+        return client
+
+    def get_id_set(self, path, ids, id_field, params=None, retry=True):
+        """Fetch resources through ID-set requests of up to ID_SET_SIZE IDs, as {id: resource}"""
+        resources = {}
+        for chunk in chunked(ids, ID_SET_SIZE):
+            resp = self.get(self.url('{}/{}'.format(path, ','.join(str(i) for i in chunk))), params=params, retry=retry)
+            for resource in ((resp.json().get('response') or []) if resp else []):
+                resources[resource.get(id_field)] = resource
+        return resources
+
+
+def set_thread_client(client):
+    """Make get_client() return client on the calling thread (None restores the shared client)"""
+    _thread.client = client
+
+
+def thread_client():
+    """The client set with set_thread_client() on the calling thread, or None"""
+    return getattr(_thread, 'client', None)
+
+
+def get_client():
+    """
+    The client of the account exported on this thread, or else the shared
+    client for the configured Brightpearl account; raises ConfigError if it is
+    not configured
+    """
+    client = thread_client()
+    if client is not None:
+        return client
+    global _client
+    if _client is None:
+        _client = BrightpearlClient.from_config(get_config())
+    return _client
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Settings read from the environment on first use.
+
+.env is loaded the first time a setting is read instead of at import time,
+and missing Brightpearl credentials raise ConfigError instead of exiting, so
+any module can be imported without credentials. Entry points call
+config_or_exit() to keep the old "print and exit" behaviour.
+
+Further accounts are configured as profiles: profile NAME reads the same
+settings with NAME after the BRIGHTPEARL_ prefix, e.g. BRIGHTPEARL_ES_ACCOUNT
+and BRIGHTPEARL_ES_API_TOKEN for profile es (see accounts.py).
+"""
+
+import os
+import re
+import sys
+
+REQUIRED_SETTINGS = ['BRIGHTPEARL_ACCOUNT', 'BRIGHTPEARL_API_TOKEN', 'BRIGHTPEARL_API_DOMAIN', 'BRIGHTPEARL_APP_REF']
+
+# Optional overrides, mainly for running against benchmarks/bp_simulator.py:
+# BRIGHTPEARL_BASE_URL replaces https://<domain>/public-api/<account> and
+# BRIGHTPEARL_REQUEST_DELAY the client's delay before every request (seconds)
+OPTIONAL_SETTINGS = ['BRIGHTPEARL_BASE_URL', 'BRIGHTPEARL_REQUEST_DELAY']
+
+PROFILE_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]*$')
+
+_dotenv_loaded = False
+_config = None
+_profiles = {}
+
+
+class ConfigError(Exception):
+    """A required setting is missing"""
+
+
+def load_environment():
+    """Load .env into the environment once"""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
+
+
+def getenv(name, default=None):
+    """os.getenv after .env has been loaded"""
+    load_environment()
+    return os.getenv(name, default)
+
+
+def profile_setting(name, profile=None):
+    """The environment variable of setting name (BRIGHTPEARL_...) for an account profile"""
+    if not profile:
+        return name
+    return 'BRIGHTPEARL_{}_{}'.format(profile.upper().replace('-', '_'), name[len('BRIGHTPEARL_'):])
+
+
+class BrightpearlConfig:
+    """Brightpearl account credentials and the API base URL and headers derived from them"""
+
+    def __init__(self, account, api_token, api_domain, app_ref, base_url_override=None, request_delay=None, profile=None):
+        self.profile = profile
+        self.account = account
+        self.api_token = api_token
+        self.api_domain = api_domain
+        self.app_ref = app_ref
+        self.base_url_override = base_url_override
+        self.request_delay = request_delay  # None keeps the client's default
+
+    @classmethod
+    def from_env(cls, profile=None):
+        """The default account, or an account profile; a profile without its own request delay uses BRIGHTPEARL_REQUEST_DELAY"""
+        if profile and not PROFILE_NAME.match(profile):
+            raise ConfigError('Invalid account profile name {!r}: use letters, digits, - and _'.format(profile))
+        names = [profile_setting(name, profile) for name in REQUIRED_SETTINGS]
+        missing = [name for name in names if not getenv(name)]
+        if missing:
+            raise ConfigError('Missing one or more required environment variables: {}'.format(', '.join(missing)))
+        delay_setting = profile_setting('BRIGHTPEARL_REQUEST_DELAY', profile)
+        if not getenv(delay_setting):
+            delay_setting = 'BRIGHTPEARL_REQUEST_DELAY'
+        request_delay = getenv(delay_setting) or None
+        if request_delay is not None:
+            try:
+                request_delay = float(request_delay)
+            except ValueError:
+                raise ConfigError('{} must be a number of seconds, got {!r}'.format(delay_setting, request_delay))
+        return cls(*(getenv(name) for name in names),
+                   base_url_override=getenv(profile_setting('BRIGHTPEARL_BASE_URL', profile)) or None,
+                   request_delay=request_delay, profile=profile)
+
+    @property
+    def base_url(self):
+        if self.base_url_override:
+            return self.base_url_override.rstrip('/')
+        return 'https://{}/public-api/{}'.format(self.api_domain, self.account)
+
+    @property
+    def headers(self):
+        return {
+            'brightpearl-account-token': self.api_token,
+            'brightpearl-app-ref': self.app_ref,
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+
+def get_config():
+    """The Brightpearl configuration from the environment, read once; raises ConfigError if incomplete"""
+    global _config
+    if _config is None:
+        _config = BrightpearlConfig.from_env()
+    return _config
+
+
+def get_profile_config(profile):
+    """The configuration of an account profile, read once; raises ConfigError if incomplete"""
+    if profile not in _profiles:
+        _profiles[profile] = BrightpearlConfig.from_env(profile)
+    return _profiles[profile]
+
+
+def config_or_exit():
+    """get_config() for entry points: print the problem and exit(1) if the configuration is incomplete"""
+    try:
+        return get_config()
+    except ConfigError as e:
+        print(e)
+        sys.exit(1)
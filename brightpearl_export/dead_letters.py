@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Dead letters: the contacts or orders an export could not fetch.
+
+When BrightpearlClient.get() gives up (retries exhausted, or another HTTP or
+connection error) it returns None, and the exports used to skip the entity.
+Now every entity with a failed request is recorded as a dead letter, with
+the endpoint, status and error of the request that failed. The entity is
+kept out of the CSV files if its own record could not be fetched or the
+failure may pass (429, 5xx, connection errors). A permanent failure of a
+secondary request, such as a 404 on a deleted postal address, still
+exports what was fetched, as before, and the letter is marked partial.
+
+At the end of a run the export retries the retryable IDs once more with a
+gentler client (retry_pass): a longer delay before each request and more
+retries. The letters left are written to <script>_dead_letters.jsonl next
+to the exports, one JSON object per line. --retry-failed reads that file
+later, fetches all of its IDs again and patches the records it gets into
+the existing CSV files (patch_csv).
+"""
+
+import contextlib
+import csv
+import json
+import os
+import time
+
+from brightpearl_export.accounts import export_path
+from brightpearl_export.client import get_client, set_thread_client, thread_client
+from brightpearl_export.metrics import write_atomic
+
+RETRY_REQUEST_DELAY = 2.0  # Seconds before each request of a retry pass
+RETRY_MAX_RETRIES = 8  # With backoff doubling from 2s, a retried request waits up to about 8.5 minutes
+SHARD_DEAD_LETTERS = 'dead_letters.jsonl'  # In a --distributed shard directory
+
+
+def retryable(failure):
+    """Whether a failed request may succeed later: 429, 5xx and connection errors, not other HTTP errors or errors in the export itself"""
+    status = failure['status']
+    if status is None:
+        return failure['endpoint'] is not None
+    return status == 429 or status >= 500
+
+
+def dead_letters_path(script):
+    return export_path('{}_dead_letters.jsonl'.format(script))
+
+
+def add_retry_arguments(parser):
+    """Add --retry-failed to an export script's argument parser"""
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Fetch only the IDs in the dead-letter file of the last run again, '
+                             'with a gentler rate, and patch them into the existing export files')
+
+
+class DeadLetters:
+    """The failed IDs of one kind of entity ('contact' or 'order'), in the order they failed"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.letters = {}
+
+    def __len__(self):
+        return len(self.letters)
+
+    def add(self, entity_id, failures, partial=False):
+        """
+        Record entity_id with the failed requests captured while fetching it
+        (BrightpearlClient.capture_failures); partial when what could be
+        fetched of it was exported anyway
+        """
+        failure = failures[0] if failures else {'endpoint': None, 'url': None, 'status': None, 'error': 'unknown error'}
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        previous = self.letters.get(str(entity_id), {})
+        self.letters[str(entity_id)] = {
+            'kind': self.kind,
+            'id': entity_id,
+            'endpoint': failure['endpoint'],
+            'url': failure['url'],
+            'status': failure['status'],
+            'error': failure['error'],
+            'attempts': failure.get('attempts'),
+            'failed_requests': len(failures),
+            'retryable': any(retryable(f) for f in failures),
+            'partial': partial,
+            'passes': previous.get('passes', 0) + 1,
+            'first_failed_at': previous.get('first_failed_at', now),
+            'failed_at': now,
+        }
+
+    def ids(self, retryable_only=False):
+        return [letter['id'] for letter in self.letters.values() if letter.get('retryable', True) or not retryable_only]
+
+    def partial_ids(self):
+        return [letter['id'] for letter in self.letters.values() if letter.get('partial')]
+
+    def retried(self, ids, still_failing):
+        """
+        Replace the letters of the retried ids with the ones still_failing
+        records again, with one more pass each; returns the recovered IDs
+        """
+        retried = {str(i) for i in ids}
+        recovered = []
+        letters = {}
+        for key, letter in self.letters.items():
+            if key not in retried:
+                letters[key] = letter
+            elif key in still_failing.letters:
+                letters[key] = still_failing.letters[key]
+                letters[key]['passes'] = letter.get('passes', 0) + letters[key]['passes']
+                letters[key]['first_failed_at'] = letter.get('first_failed_at', letters[key]['first_failed_at'])
+                # Rows of an earlier partial export stay in the CSV files until the entity is fetched again
+                letters[key]['partial'] = letters[key]['partial'] or letter.get('partial', False)
+            else:
+                recovered.append(letter['id'])
+        self.letters = letters
+        return recovered
+
+    def summary(self):
+        """Dead letters per endpoint and status, for the run report"""
+        counts = {}
+        for letter in self.letters.values():
+            key = '{} {}'.format(letter['endpoint'], letter['status'] or 'error')
+            counts[key] = counts.get(key, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def save(self, path):
+        """Replace path with the letters, one JSON object per line (an empty file when nothing failed)"""
+        write_atomic(path, ''.join(json.dumps(letter) + '\n' for letter in self.letters.values()))
+
+    @classmethod
+    def load(cls, path, kind):
+        letters = cls(kind)
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    letter = json.loads(line)
+                    letters.letters[str(letter['id'])] = letter
+        return letters
+
+
+@contextlib.contextmanager
+def gentler_client():
+    """Make get_client() return a gentler copy of the current client on this thread for the duration of the block"""
+    previous = thread_client()
+    set_thread_client(get_client().gentler(RETRY_REQUEST_DELAY, RETRY_MAX_RETRIES))
+    try:
+        yield
+    finally:
+        set_thread_client(previous)
+
+
+def retry_pass(dead_letters, fetch, retryable_only=True):
+    """
+    Fetch the dead letters' IDs again with a gentler client: only the
+    retryable ones, unless retryable_only is False. fetch(ids, still_failing)
+    is the export's own fetch loop, recording the IDs that fail again in
+    still_failing. Their letters replace the retried ones in dead_letters;
+    returns fetch's result (a list) and the recovered IDs.
+    """
+    ids = dead_letters.ids(retryable_only)
+    if not ids:
+        print("\n[INFO] {} {}s failed with errors a retry will not fix, skipping the retry pass".format(len(dead_letters), dead_letters.kind))
+        return [], []
+    print("\n[INFO] Retrying {} {}s that could not be fetched, {}s between requests".format(len(ids), dead_letters.kind, RETRY_REQUEST_DELAY))
+    still_failing = DeadLetters(dead_letters.kind)
+    with gentler_client():
+        result = fetch(ids, still_failing)
+    recovered = dead_letters.retried(ids, still_failing)
+    print("[INFO] Retry pass: {} recovered, {} still failing".format(len(recovered), len(ids) - len(recovered)))
+    return result, recovered
+
+
+def patch_csv(path, fieldnames, key, replaced_ids, rows):
+    """
+    Rewrite the export CSV at path without the rows whose key column is one of
+    replaced_ids, followed by rows (dicts of strings); returns the number of
+    rows written
+    """
+    replaced = {str(i) for i in replaced_ids}
+    with open(path, newline='', encoding='utf-8') as f:
+        kept = [row for row in csv.DictReader(f) if row[key] not in replaced]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(kept)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return len(kept) + len(rows)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Distributed exports (--distributed coordinate | work | merge).
+
+- coordinate: discover the IDs to export (the contact or order search) and
+  enqueue them in the work queue as units of --unit-size IDs.
+- work: lease units one at a time, fetch their IDs and write the unit's
+  CSV files to a shard directory next to the queue. Start any number of
+  workers, on any node that shares the queue's directory. A heartbeat thread
+  extends the lease while the unit is processed. A unit whose worker fails
+  is released for another attempt. A unit whose worker dies is picked up
+  again once its lease expires. Workers exit once every unit is done or
+  failed.
+- merge: concatenate the shards of the done units in unit order into the
+  usual exports/*.csv files, and their dead letters (the IDs that could not
+  be fetched, see dead_letters.py) into the export's dead-letter file.
+
+Shard paths are stored relative to the queue's directory, so every node can
+mount the shared directory wherever it likes.
+"""
+
+import csv
+import glob
+import json
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+
+from brightpearl_export.accounts import export_path
+from brightpearl_export.client import get_client
+from brightpearl_export.dead_letters import SHARD_DEAD_LETTERS, dead_letters_path
+from brightpearl_export.metrics import write_atomic, write_run_report
+from brightpearl_export.work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, WorkQueue
+
+DEFAULT_QUEUE = os.path.join('exports', 'work_queue.sqlite')
+DEFAULT_UNIT_SIZE = 200
+SHARD_DIR = 'shards'  # In the queue's directory
+
+
+def add_distributed_arguments(parser):
+    """Add --distributed and the work queue options to an export script's argument parser"""
+    parser.add_argument('--distributed', choices=['coordinate', 'work', 'merge'],
+                        help='Distributed export: enqueue the IDs as work units, process units as a worker, '
+                             'or merge the finished shards into the export files')
+    parser.add_argument('--queue', default=DEFAULT_QUEUE, metavar='PATH',
+                        help='SQLite work queue shared by the coordinator and workers (default: {})'.format(DEFAULT_QUEUE))
+    parser.add_argument('--unit-size', type=int, default=DEFAULT_UNIT_SIZE,
+                        help='IDs per work unit (default: {})'.format(DEFAULT_UNIT_SIZE))
+    parser.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds without a heartbeat before a worker's unit is handed to another worker (default: {})".format(DEFAULT_LEASE_SECONDS))
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help='Leases of a unit before it is marked failed (default: {})'.format(DEFAULT_MAX_ATTEMPTS))
+    parser.add_argument('--worker-id', default='{}-{}'.format(socket.gethostname(), os.getpid()),
+                        help='Name of this worker in the queue (default: host-pid)')
+
+
+def open_queue(args):
+    directory = os.path.dirname(args.queue)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return WorkQueue(args.queue, args.max_attempts)
+
+
+def coordinate(args, job, ids, **info):
+    """Enqueue ids as a new job of units of --unit-size IDs, replacing any previous run of job and its shards"""
+    queue = open_queue(args)
+    shutil.rmtree(shard_root(args, job), ignore_errors=True)
+    units = [ids[i:i + args.unit_size] for i in range(0, len(ids), args.unit_size)]
+    queue.create_job(job, units, **info)
+    print("[INFO] Queued {} IDs as {} units of up to {} in {}".format(len(ids), len(units), args.unit_size, args.queue))
+    print("[INFO] Start workers with --distributed work --queue {}, then --distributed merge".format(args.queue))
+
+
+class LeaseLost(Exception):
+    """The unit's lease expired and another worker may have taken it over"""
+
+
+class Heartbeat:
+    """Extends a unit's lease every third of --lease-seconds until stopped, on a background thread"""
+
+    def __init__(self, queue, unit, worker, lease_seconds):
+        self.queue = queue
+        self.unit = unit
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='heartbeat', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.unit, self.worker, self.lease_seconds):
+                    self.lost.set()
+                    return
+            except Exception as e:
+                # A busy or briefly unreachable queue: the lease has time left, try again on the next beat
+                print("[WARNING] Heartbeat for unit {} failed: {}".format(self.unit.unit, e), file=sys.stderr)
+
+    def watch(self, ids):
+        """ids, checking the lease before each one; raises LeaseLost once it has been lost"""
+        return _WatchedIds(ids, self.lost)
+
+
+class _WatchedIds:
+    def __init__(self, ids, lost):
+        self.ids = ids
+        self.lost = lost
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for item in self.ids:
+            if self.lost.is_set():
+                raise LeaseLost()
+            yield item
+
+
+def shard_root(args, job):
+    return os.path.join(os.path.dirname(args.queue), SHARD_DIR, job)
+
+
+def run_worker(args, job, process_unit):
+    """
+    Process units of job until none is left. process_unit(ids, shard_dir)
+    fetches the IDs (iterating ids checks the lease), writes the unit's CSV
+    files into shard_dir and returns its record counts.
+    """
+    queue = open_queue(args)
+    if queue.job_info(job) is None:
+        print("[ERROR] No {} job in {}: run --distributed coordinate first".format(job, args.queue))
+        sys.exit(1)
+    started = time.time()
+    worker = args.worker_id
+    root = shard_root(args, job)
+    totals = {}
+    units = 0
+    print("[INFO] Worker {} processing {} units from {}".format(worker, job, args.queue))
+    while True:
+        unit = queue.lease(job, worker, args.lease_seconds)
+        if unit is None:
+            counts = queue.counts(job)
+            if not counts['pending'] and not counts['leased'] and not counts['expired']:
+                break
+            # Units leased by other workers are handed out again if their leases expire
+            time.sleep(min(5.0, args.lease_seconds / 4))
+            continue
+
+        name = 'unit-{:05d}-{}-a{}'.format(unit.unit, worker, unit.attempts)
+        shard = os.path.join(root, name)
+        os.makedirs(shard, exist_ok=True)
+        print("[INFO] Unit {}: {} IDs {}-{} (attempt {})".format(unit.unit, len(unit.ids), unit.ids[0], unit.ids[-1], unit.attempts))
+        try:
+            with Heartbeat(queue, unit, worker, args.lease_seconds) as heartbeat:
+                counts = process_unit(heartbeat.watch(unit.ids), shard)
+        except LeaseLost:
+            print("[WARNING] Lost the lease on unit {}; leaving it to the worker that took it over".format(unit.unit))
+            continue
+        except KeyboardInterrupt:
+            queue.release(unit, worker, 'worker interrupted')
+            raise
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+            print("[ERROR] Unit {} failed, releasing it: {}".format(unit.unit, error))
+            queue.release(unit, worker, error)
+            continue
+        if not queue.complete(unit, worker, os.path.relpath(shard, os.path.dirname(args.queue) or '.')):
+            print("[WARNING] Lost the lease on unit {} before it finished; its shard is ignored".format(unit.unit))
+            continue
+        units += 1
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+
+    counts = queue.counts(job)
+    print("[SUCCESS] Worker {} finished {} units; queue: {} done, {} failed".format(worker, units, counts['done'], counts['failed']))
+    write_run_report(os.path.join(root, 'worker-{}_report.json'.format(worker)), job, started, get_client().metrics,
+                     args.prometheus_textfile, prometheus_labels={'worker': worker}, worker=worker, units=units, **totals)
+
+
+def merge_shards(args, job, outputs):
+    """
+    Concatenate the shard CSVs of job's units, in unit order, into
+    export_path(name) for each (name, fieldnames, key column) in outputs.
+    A key column keeps only the first row of each key, as company_ids_seen
+    does in a single-process export. Exits with status 1 unless every unit
+    is done.
+    """
+    queue = open_queue(args)
+    if queue.job_info(job) is None:
+        print("[ERROR] No {} job in {}".format(job, args.queue))
+        sys.exit(1)
+    counts = queue.counts(job)
+    units = queue.units(job)
+    if counts['done'] != len(units):
+        print("[ERROR] {} of {} units are done ({} pending, {} leased, {} expired, {} failed); nothing merged".format(
+            counts['done'], len(units), counts['pending'], counts['leased'], counts['expired'], counts['failed']))
+        for unit in units:
+            if unit['status'] == 'failed':
+                print("[ERROR] Unit {} (IDs {}-{}) failed after {} attempts: {}".format(
+                    unit['unit'], unit['first_id'], unit['last_id'], unit['attempts'], unit['error']))
+        sys.exit(1)
+
+    base = os.path.dirname(args.queue) or '.'
+    shards = [os.path.join(base, unit['shard']) for unit in units]
+    rows = {}
+    for name, fieldnames, key in outputs:
+        rows[name] = merge_csv(shards, name, export_path(name), fieldnames, key)
+        print("- {}: {} records from {} shards".format(name, rows[name], len(shards)))
+    dead_letters = merge_dead_letters(shards, dead_letters_path(job))
+    if dead_letters:
+        print("[WARNING] {} IDs could not be fetched; run with --retry-failed to fetch them again: {}".format(
+            dead_letters, dead_letters_path(job)))
+
+    workers = []
+    for path in sorted(glob.glob(os.path.join(shard_root(args, job), 'worker-*_report.json'))):
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        workers.append({'worker': report.get('worker'), 'units': report.get('units'), 'wall_seconds': report['wall_seconds'],
+                        'requests': report['http']['requests'], 'throttled': sum(report['http']['throttled'].values())})
+    report = {
+        'script': job,
+        'queue': args.queue,
+        'units': units,
+        'workers': workers,
+        'records': rows,
+        'dead_letters': dead_letters,
+        'requests': sum(worker['requests'] for worker in workers),
+    }
+    path = export_path('{}_distributed_report.json'.format(job))
+    write_atomic(path, json.dumps(report, indent=2) + '\n')
+    attempts = sum(unit['attempts'] for unit in units)
+    print("[SUCCESS] Merged {} units ({} leases) from {} workers ({} requests). Report: {}".format(
+        len(units), attempts, len(workers), report['requests'], path))
+    return rows
+
+
+def merge_dead_letters(shards, path):
+    """Write the dead letters of every shard to path; returns how many there are"""
+    lines = []
+    for shard in shards:
+        shard_path = os.path.join(shard, SHARD_DEAD_LETTERS)
+        if os.path.exists(shard_path):
+            with open(shard_path, encoding='utf-8') as f:
+                lines.extend(line for line in f if line.strip())
+    write_atomic(path, ''.join(lines))
+    return len(lines)
+
+
+def merge_csv(shards, name, path, fieldnames, key=None):
+    """
+    Write the rows of every shard's name CSV to path under one fieldnames
+    header, which is written even without shards; returns the number of rows
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    seen = set()
+    count = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
+        writer.writeheader()
+        for shard in shards:
+            with open(os.path.join(shard, name), newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if key:
+                        if row[key] in seen:
+                            continue
+                        seen.add(row[key])
+                    writer.writerow(row)
+                    count += 1
+    os.replace(tmp_path, path)
+    return count
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Client for the interactive lookups of get_contact.py and get_order.py.
+
+The lookups go straight to Brightpearl, or to lookup_daemon.py when --daemon
+is given or BRIGHTPEARL_LOOKUP_DAEMON is set. Either way they are ID-set
+requests (/contact/1,2,3), retried with backoff when throttled.
+"""
+
+from brightpearl_export.client import BrightpearlClient, get_client
+from brightpearl_export.config import config_or_exit, getenv
+
+DEFAULT_LOOKUP_DAEMON_URL = 'http://127.0.0.1:8765'
+
+_lookup_client = None
+
+
+def add_daemon_arguments(parser):
+    """Add --daemon to a lookup script's argument parser"""
+    parser.add_argument('--daemon', nargs='?', const=DEFAULT_LOOKUP_DAEMON_URL, metavar='URL',
+                        help='Forward lookups to lookup_daemon.py (default URL {}, or set BRIGHTPEARL_LOOKUP_DAEMON)'.format(DEFAULT_LOOKUP_DAEMON_URL))
+
+
+def lookup_client(daemon_url=None):
+    """
+    Client for lookups: the lookup daemon at daemon_url (--daemon) or
+    BRIGHTPEARL_LOOKUP_DAEMON, otherwise Brightpearl, exiting if it is not
+    configured. The first call picks the client for the run.
+    """
+    global _lookup_client
+    if _lookup_client is None:
+        daemon_url = daemon_url or getenv('BRIGHTPEARL_LOOKUP_DAEMON')
+        if daemon_url:
+            # The daemon paces its own upstream requests
+            _lookup_client = BrightpearlClient(daemon_url, {'Accept': 'application/json'}, request_delay=0)
+        else:
+            config_or_exit()
+            _lookup_client = get_client()
+    return _lookup_client
+
+
+def fetch_id_set(path, ids, id_field, params=None):
+    """
+    Fetch the resources with the given IDs through ID-set requests, as {id: resource}.
+    A 429/503 is retried with backoff, so throttling does not fail a whole batch.
+    """
+    return lookup_client().get_id_set(path, ids, id_field, params=params)
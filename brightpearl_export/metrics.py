@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Request metrics for BrightpearlClient and the end-of-run report.
+
+Every request is recorded against its endpoint template (the path with IDs
+and ID sets replaced by {id} / {ids}, e.g. contact-service/contact/{ids}):
+count per status, a latency histogram, bytes received and retries. Time
+spent sleeping in the rate limiter and in 429/503 backoff is recorded
+separately, so a run report shows how much of the wall time went to fixed
+sleeps, to throttling and to Brightpearl itself.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Latency histogram bucket upper bounds in seconds (Prometheus-style, cumulative)
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+ID_SEGMENT = re.compile(r'^[\d,\-]+$')
+
+
+def endpoint_template(url):
+    """contact-service/contact/{ids} for https://host/public-api/acct/contact-service/contact/1,2,3?x=y"""
+    parts = urlsplit(url).path.strip('/').split('/')
+    if len(parts) > 2 and parts[0] == 'public-api':
+        parts = parts[2:]
+    return '/'.join(
+        ('{id}' if part.isdigit() else '{ids}') if ID_SEGMENT.match(part) else part
+        for part in parts
+    )
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.statuses = {}
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.bytes = 0
+        self.retries = 0
+
+    @property
+    def count(self):
+        return sum(self.statuses.values())
+
+    def snapshot(self):
+        cumulative = []
+        total = 0
+        for count in self.bucket_counts:
+            total += count
+            cumulative.append(total)
+        return {
+            'requests': self.count,
+            'statuses': dict(sorted(self.statuses.items())),
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'latency_seconds': {
+                'sum': round(self.latency_sum, 3),
+                'mean': round(self.latency_sum / self.count, 4) if self.count else 0.0,
+                'max': round(self.latency_max, 3),
+                'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], cumulative)),
+            },
+        }
+
+
+class RequestMetrics:
+    """Thread-safe request counters, latency histograms and sleep totals for one client"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.sleep_seconds = {'limiter': 0.0, 'backoff': 0.0}
+        self.throttled = {}
+
+    def _endpoint(self, url):
+        template = endpoint_template(url)
+        if template not in self.endpoints:
+            self.endpoints[template] = EndpointMetrics()
+        return self.endpoints[template]
+
+    def record_request(self, url, status, seconds, nbytes=0):
+        """One completed attempt; status is the HTTP status, or 'error' if no response arrived"""
+        with self.lock:
+            endpoint = self._endpoint(url)
+            endpoint.statuses[str(status)] = endpoint.statuses.get(str(status), 0) + 1
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            endpoint.bucket_counts[bucket] += 1
+            endpoint.latency_sum += seconds
+            endpoint.latency_max = max(endpoint.latency_max, seconds)
+            endpoint.bytes += nbytes
+            if status in (429, 503):
+                self.throttled[str(status)] = self.throttled.get(str(status), 0) + 1
+
+    def record_retry(self, url):
+        with self.lock:
+            self._endpoint(url).retries += 1
+
+    def record_sleep(self, kind, seconds):
+        """Time slept by the rate limiter ('limiter') or while backing off after 429/503 ('backoff')"""
+        with self.lock:
+            self.sleep_seconds[kind] = self.sleep_seconds.get(kind, 0.0) + seconds
+
+    def totals(self):
+        """(requests, 429/503 responses, backoff seconds) so far, cheap enough to poll"""
+        with self.lock:
+            return (
+                sum(endpoint.count for endpoint in self.endpoints.values()),
+                sum(self.throttled.values()),
+                self.sleep_seconds.get('backoff', 0.0),
+            )
+
+    def snapshot(self):
+        with self.lock:
+            endpoints = {template: metrics.snapshot() for template, metrics in sorted(self.endpoints.items())}
+            return {
+                'requests': sum(e['requests'] for e in endpoints.values()),
+                'retries': sum(e['retries'] for e in endpoints.values()),
+                'bytes': sum(e['bytes'] for e in endpoints.values()),
+                'throttled': dict(self.throttled),
+                'latency_seconds': round(sum(e['latency_seconds']['sum'] for e in endpoints.values()), 3),
+                'sleep_seconds': {kind: round(seconds, 3) for kind, seconds in self.sleep_seconds.items()},
+                'endpoints': endpoints,
+            }
+
+    def prometheus_lines(self, labels=''):
+        """Metrics in the Prometheus text exposition format; labels is extra 'key="value"' text for every series"""
+        snapshot = self.snapshot()
+        extra = ',' + labels if labels else ''
+        lines = [
+            '# HELP brightpearl_requests_total Brightpearl API requests by endpoint and status.',
+            '# TYPE brightpearl_requests_total counter',
+        ]
+        for template, endpoint in snapshot['endpoints'].items():
+            for status, count in endpoint['statuses'].items():
+                lines.append('brightpearl_requests_total{{endpoint="{}",status="{}"{}}} {}'.format(template, status, extra, count))
+        lines += [
+            '# HELP brightpearl_request_duration_seconds Brightpearl API request latency.',
+            '# TYPE brightpearl_request_duration_seconds histogram',
+        ]
+        for template, endpoint in snapshot['endpoints'].items():
+            latency = endpoint['latency_seconds']
+            for bound, count in latency['buckets'].items():
+                lines.append('brightpearl_request_duration_seconds_bucket{{endpoint="{}",le="{}"{}}} {}'.format(template, bound, extra, count))
+            lines.append('brightpearl_request_duration_seconds_sum{{endpoint="{}"{}}} {}'.format(template, extra, latency['sum']))
+            lines.append('brightpearl_request_duration_seconds_count{{endpoint="{}"{}}} {}'.format(template, extra, endpoint['requests']))
+        for name, help_text, key in [
+            ('brightpearl_response_bytes_total', 'Response bytes received.', 'bytes'),
+            ('brightpearl_retries_total', 'Requests retried after 429/503.', 'retries'),
+        ]:
+            lines += ['# HELP {} {}'.format(name, help_text), '# TYPE {} counter'.format(name)]
+            for template, endpoint in snapshot['endpoints'].items():
+                lines.append('{}{{endpoint="{}"{}}} {}'.format(name, template, extra, endpoint[key]))
+        lines += [
+            '# HELP brightpearl_sleep_seconds_total Time spent sleeping in the rate limiter and in backoff.',
+            '# TYPE brightpearl_sleep_seconds_total counter',
+        ]
+        for kind, seconds in snapshot['sleep_seconds'].items():
+            lines.append('brightpearl_sleep_seconds_total{{kind="{}"{}}} {}'.format(kind, extra, seconds))
+        return lines
+
+
+def write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def http_summary(snapshot):
+    """The totals of a RequestMetrics snapshot, without the per-endpoint breakdown, for combined reports"""
+    summary = {key: snapshot[key] for key in ('requests', 'retries', 'bytes', 'latency_seconds', 'sleep_seconds')}
+    summary['throttled'] = sum(snapshot['throttled'].values())
+    return summary
+
+
+def write_run_report(path, script, started, metrics, prometheus_textfile=None, prometheus_labels=None, **fields):
+    """
+    Write the JSON run report for a finished run (and optionally a Prometheus
+    textfile for node_exporter's textfile collector) and print a one-line
+    summary of where the wall time went. fields are added to the report as-is;
+    prometheus_labels are added to every series (None values are left out).
+    """
+    finished = time.time()
+    snapshot = metrics.snapshot()
+    report = {
+        'script': script,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished)),
+        'wall_seconds': round(finished - started, 3),
+    }
+    report.update(fields)
+    report['http'] = snapshot
+    write_atomic(path, json.dumps(report, indent=2) + '\n')
+
+    sleeps = snapshot['sleep_seconds']
+    print("[INFO] {} requests in {:.1f}s: {:.1f}s waiting on Brightpearl, {:.1f}s in limiter sleeps, "
+          "{:.1f}s in 429/503 backoff ({} throttled, {} retries). Report: {}".format(
+              snapshot['requests'], finished - started, snapshot['latency_seconds'],
+              sleeps.get('limiter', 0.0), sleeps.get('backoff', 0.0),
+              sum(snapshot['throttled'].values()), snapshot['retries'], path))
+
+    if prometheus_textfile:
+        labels = ','.join('{}="{}"'.format(key, value) for key, value in
+                          dict({'script': script}, **(prometheus_labels or {})).items() if value is not None)
+        lines = metrics.prometheus_lines(labels)
+        lines += [
+            '# HELP brightpearl_run_duration_seconds Wall time of the last run.',
+            '# TYPE brightpearl_run_duration_seconds gauge',
+            'brightpearl_run_duration_seconds{{{}}} {}'.format(labels, report['wall_seconds']),
+            '# HELP brightpearl_run_finished_timestamp_seconds Unix time the last run finished.',
+            '# TYPE brightpearl_run_finished_timestamp_seconds gauge',
+            'brightpearl_run_finished_timestamp_seconds{{{}}} {}'.format(labels, int(finished)),
+        ]
+        write_atomic(prometheus_textfile, '\n'.join(lines) + '\n')
+        print("[INFO] Prometheus metrics written to {}".format(prometheus_textfile))
+    return report
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Dry-run request planning for the export scripts (--plan).
+
+A plan makes only the cheap discovery requests (the tag lookup and one
+single-result search page for its resultsAvailable), then counts the
+requests the full run will make, step by step, and estimates its wall time.
+
+The estimate is the slower of two bounds:
+- Pacing: every request waits request_delay in the limiter, plus the
+  Brightpearl latency measured on the discovery requests.
+- Quota: Brightpearl allows requests_per_minute requests per throttle window.
+
+The quota left in the current window is read from the
+brightpearl-requests-remaining and brightpearl-next-throttle-period headers.
+"""
+
+import json
+
+from brightpearl_export.metrics import write_atomic
+from brightpearl_export.progress import format_duration
+
+THROTTLE_REQUESTS_PER_MINUTE = 200  # Brightpearl's standard per-minute request quota
+SEARCH_PAGE_SIZE = 200  # Results per contact-search/order-search page, the maximum Brightpearl allows
+
+
+def add_plan_arguments(parser):
+    """Add --plan and --requests-per-minute to an export script's argument parser"""
+    parser.add_argument('--plan', action='store_true',
+                        help='Only make the discovery requests, then print how many requests the export will make and how long it should take')
+    parser.add_argument('--requests-per-minute', type=int, default=THROTTLE_REQUESTS_PER_MINUTE,
+                        help="The account's Brightpearl request quota per minute, for the --plan estimate (default: {})".format(THROTTLE_REQUESTS_PER_MINUTE))
+
+
+def search_pages(total):
+    """Search requests the paging loops make for total results: they stop at the first page with fewer than a full page"""
+    return total // SEARCH_PAGE_SIZE + 1
+
+
+class RequestPlan:
+    """The requests an export will make, step by step, with a wall time estimate"""
+
+    def __init__(self, script, client, requests_per_minute=THROTTLE_REQUESTS_PER_MINUTE):
+        self.script = script
+        self.client = client
+        self.requests_per_minute = requests_per_minute
+        self.steps = []  # (stage, description, requests)
+        self.notes = []
+        self.requests_remaining = None
+        self.next_period = None
+
+    def search_total(self, path, params):
+        """resultsAvailable of a contact-search/order-search, from a one-result page; None if the request failed"""
+        resp = self.client.get(self.client.url(path), dict(params, firstResult=1, maxResults=1))
+        if not resp:
+            return None
+        self.observe(resp)
+        return int(resp.json().get('response', {}).get('metaData', {}).get('resultsAvailable', 0))
+
+    def observe(self, resp):
+        """Remember the throttle window state Brightpearl reports on a discovery response"""
+        remaining = resp.headers.get('brightpearl-requests-remaining', '')
+        next_period = resp.headers.get('brightpearl-next-throttle-period', '')
+        if remaining.isdigit():
+            self.requests_remaining = int(remaining)
+        if next_period.isdigit():
+            self.next_period = int(next_period) / 1000
+
+    def add(self, stage, description, requests):
+        self.steps.append((stage, description, requests))
+
+    def note(self, text):
+        self.notes.append(text)
+
+    @property
+    def total(self):
+        return sum(requests for _, _, requests in self.steps)
+
+    def estimate(self):
+        """(estimated seconds, seconds per request when paced, seconds the quota alone needs)"""
+        snapshot = self.client.metrics.snapshot()
+        latency = snapshot['latency_seconds'] / snapshot['requests'] if snapshot['requests'] else 0.0
+        per_request = self.client.request_delay + latency
+        quota_seconds = self.total / self.requests_per_minute * 60 if self.requests_per_minute else 0.0
+        return max(self.total * per_request, quota_seconds), per_request, quota_seconds
+
+    def report(self, path, **fields):
+        """Print the plan and write it to path as JSON; fields are added to the JSON as-is. Returns the plan dict."""
+        seconds, per_request, quota_seconds = self.estimate()
+        plan = {
+            'script': self.script,
+            'requests': self.total,
+            'steps': [{'stage': stage, 'description': description, 'requests': requests}
+                      for stage, description, requests in self.steps],
+            'estimated_seconds': round(seconds, 1),
+            'seconds_per_request': round(per_request, 3),
+            'requests_per_minute': self.requests_per_minute,
+            'quota_seconds': round(quota_seconds, 1),
+            'requests_remaining': self.requests_remaining,
+            'next_throttle_period_seconds': self.next_period,
+            'discovery_requests': self.client.metrics.snapshot()['requests'],
+            'notes': self.notes,
+        }
+        plan.update(fields)
+        write_atomic(path, json.dumps(plan, indent=2) + '\n')
+
+        print("[PLAN] {}: {} requests".format(self.script, self.total))
+        for stage, description, requests in self.steps:
+            print("[PLAN]   {:<14} {:>9}  {}".format(stage, requests, description))
+        limit = 'pacing' if self.total * per_request >= quota_seconds else 'the {}/min quota'.format(self.requests_per_minute)
+        print("[PLAN] Estimated wall time {} ({:.2f}s per request: {}s limiter delay plus measured latency; "
+              "the {}/min quota alone needs {}; limited by {})".format(
+                  format_duration(seconds), per_request, self.client.request_delay,
+                  self.requests_per_minute, format_duration(quota_seconds), limit))
+        if self.requests_remaining is not None:
+            window = ' (next window in {})'.format(format_duration(self.next_period)) if self.next_period is not None else ''
+            print("[PLAN] Brightpearl reports {} requests left in the current window{}".format(self.requests_remaining, window))
+        for text in self.notes:
+            print("[PLAN] Note: {}".format(text))
+        print("[PLAN] {} discovery requests made. Plan: {}".format(plan['discovery_requests'], path))
+        return plan
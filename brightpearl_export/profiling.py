@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Stage-level profiling for the export and conversion scripts (--profile).
+
+The scripts wrap their phases in PROFILER.stage(name). Stage times are
+exclusive: while a nested stage runs (normalization inside row building, say)
+the outer stage's clock is paused, so the stages and 'other' add up to the
+wall time of the run. Only the thread that started the profiler is timed.
+
+--profile-stage NAME also captures that stage (including anything nested in
+it) with cProfile, written as a .pstats file for pstats/snakeviz, and with a
+stack sampler, written as folded stacks ("a;b;c count" lines) that
+flamegraph.pl, inferno and speedscope load directly.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples of the captured stage
+
+_END = object()
+
+
+def add_profile_arguments(parser, stages):
+    """Add --profile and --profile-stage (one of stages) to a script's argument parser"""
+    parser.add_argument('--profile', action='store_true',
+                        help='Time the stages of the run ({}) and write a profile report'.format(', '.join(stages)))
+    parser.add_argument('--profile-stage', choices=stages, metavar='STAGE',
+                        help='Also capture this stage with cProfile (.pstats) and a stack sampler (.folded, for flame graphs); implies --profile')
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack while resumed, counting folded stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.active = threading.Event()
+        self.stacks = Counter()
+
+    def run(self):
+        while True:
+            self.active.wait()
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+            time.sleep(self.interval)
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+
+class StageProfiler:
+    """Exclusive wall time and call counts per named stage"""
+
+    def __init__(self):
+        self.enabled = False
+        self.thread_id = None
+        self.started = None
+        self.seconds = {}
+        self.calls = {}
+        self.stack = []  # [name, time the stage's clock last (re)started]
+        self.capture_stage = None
+        self.capture_depth = 0
+        self.profile = None
+        self.sampler = None
+
+    def start(self, capture_stage=None):
+        """Start timing stages on the calling thread, optionally capturing one stage"""
+        self.enabled = True
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        if capture_stage:
+            import cProfile
+            self.capture_stage = capture_stage
+            self.profile = cProfile.Profile()
+            self.sampler = StackSampler(self.thread_id)
+            self.sampler.start()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled or threading.get_ident() != self.thread_id:
+            yield
+            return
+        now = time.perf_counter()
+        if self.stack:
+            parent = self.stack[-1]
+            self.seconds[parent[0]] = self.seconds.get(parent[0], 0.0) + now - parent[1]
+        self.stack.append([name, now])
+        capturing = name == self.capture_stage
+        if capturing:
+            self.capture_depth += 1
+            if self.capture_depth == 1:
+                self.sampler.active.set()
+                self.profile.enable()
+        try:
+            yield
+        finally:
+            if capturing:
+                self.capture_depth -= 1
+                if self.capture_depth == 0:
+                    self.profile.disable()
+                    self.sampler.active.clear()
+            now = time.perf_counter()
+            resumed = self.stack.pop()[1]
+            self.seconds[name] = self.seconds.get(name, 0.0) + now - resumed
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def iterate(self, name, iterable):
+        """
+        Iterate over a lazy iterable, timing the work of producing each item as
+        stage name (stages entered by the producer are timed as themselves)
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_items(name, iter(iterable))
+
+    def _timed_items(self, name, iterator):
+        while True:
+            with self.stage(name):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        stages = {
+            name: {'seconds': round(seconds, 3), 'calls': self.calls.get(name, 0),
+                   'share': round(seconds / wall, 4) if wall else 0.0}
+            for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+        }
+        other = max(wall - sum(self.seconds.values()), 0.0)
+        stages['other'] = {'seconds': round(other, 3), 'calls': 0, 'share': round(other / wall, 4) if wall else 0.0}
+        return {'wall_seconds': round(wall, 3), 'capture_stage': self.capture_stage, 'stages': stages}
+
+    def report(self, prefix):
+        """
+        Print the stage table and write <prefix>.json, plus <prefix>_<stage>.pstats
+        and <prefix>_<stage>.folded for a captured stage. Returns the summary.
+        """
+        summary = self.summary()
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.capture_stage:
+            pstats_path = '{}_{}.pstats'.format(prefix, self.capture_stage)
+            folded_path = '{}_{}.folded'.format(prefix, self.capture_stage)
+            self.profile.dump_stats(pstats_path)
+            self.sampler.write_folded(folded_path)
+            summary['pstats'] = pstats_path
+            summary['folded_stacks'] = folded_path
+            summary['samples'] = sum(self.sampler.stacks.values())
+        with open(prefix + '.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+
+        print("[PROFILE] {:.2f}s wall time by stage (exclusive):".format(summary['wall_seconds']))
+        for name, stage in summary['stages'].items():
+            print("[PROFILE]   {:<14} {:9.3f}s {:6.1%} {:>8} calls".format(name, stage['seconds'], stage['share'], stage['calls']))
+        if self.capture_stage:
+            print("[PROFILE] Captured '{}': {} (cProfile), {} ({} stack samples)".format(
+                self.capture_stage, summary['pstats'], summary['folded_stacks'], summary['samples']))
+        print("[PROFILE] Report: {}.json".format(prefix))
+        return summary
+
+
+# One profiler per process, started by the script's --profile flag
+PROFILER = StageProfiler()
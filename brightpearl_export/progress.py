@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Progress reporting for the export loops.
+
+ProgressReporter redraws one status line at a fixed interval instead of on
+every item: processed/total, items/s and requests/s over the last
+RATE_WINDOW seconds, whether Brightpearl has been throttling (429/503), and
+an ETA. On a terminal the line is redrawn in place every TTY_INTERVAL
+seconds; when stdout is a pipe or a log file a plain line is printed every
+LOG_INTERVAL seconds instead. Warnings printed through message() clear the
+status line first, so they do not break the display.
+"""
+
+import sys
+import time
+from collections import deque
+
+TTY_INTERVAL = 0.5  # Seconds between redraws on a terminal
+LOG_INTERVAL = 30.0  # Seconds between progress lines in a log
+RATE_WINDOW = 30.0  # Seconds of history the rates and throttle state are computed over
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h{:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}s'.format(seconds)
+
+
+class ProgressReporter:
+    """
+    Progress of a loop over total items. client is the BrightpearlClient the
+    loop uses: its metrics give the request rate and throttling, and its
+    request_delay caps the request rate the ETA assumes.
+    """
+
+    def __init__(self, label, total, client=None, stream=None, interval=None):
+        self.label = label
+        self.total = total
+        self.metrics = client.metrics if client else None
+        self.request_delay = client.request_delay if client else 0
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.interval = interval if interval is not None else (TTY_INTERVAL if self.tty else LOG_INTERVAL)
+        self.done = 0
+        self.started = time.perf_counter()
+        self.last_render = self.started
+        self.line_width = 0
+        self.first_sample = self.sample(self.started)
+        self.samples = deque([self.first_sample])
+
+    def sample(self, now):
+        """(time, items done, requests, 429/503 responses, backoff seconds)"""
+        requests, throttled, backoff = self.metrics.totals() if self.metrics else (0, 0, 0.0)
+        return now, self.done, requests, throttled, backoff
+
+    def advance(self, count=1):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.last_render >= self.interval:
+            self.render(now)
+
+    def message(self, text):
+        """Print a line (a warning, say) without breaking the status line"""
+        if self.tty and self.line_width:
+            self.stream.write('\r' + ' ' * self.line_width + '\r')
+            self.line_width = 0
+        self.stream.write(text + '\n')
+        self.stream.flush()
+
+    def finish(self):
+        """Print the final status line"""
+        self.render(time.perf_counter())
+        if self.tty:
+            self.stream.write('\n')
+            self.stream.flush()
+            self.line_width = 0
+
+    def status(self, now):
+        current = self.sample(now)
+        self.samples.append(current)
+        while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+            self.samples.popleft()
+        oldest = self.samples[0]
+        elapsed = max(now - oldest[0], 1e-9)
+        item_rate = (current[1] - oldest[1]) / elapsed
+        request_rate = (current[2] - oldest[2]) / elapsed
+        throttled = current[3] - oldest[3]
+
+        parts = ['[PROGRESS] {}/{} {}'.format(self.done, self.total, self.label)]
+        if self.total:
+            parts[0] += ' ({:.1%})'.format(self.done / self.total)
+        parts.append('{:.1f} {}/s'.format(item_rate, self.label))
+        if self.metrics:
+            parts.append('{:.1f} req/s'.format(request_rate))
+            if throttled:
+                parts.append('throttled ({} 429/503, {:.0f}s backoff in the last {:.0f}s)'.format(
+                    throttled, current[4] - oldest[4], elapsed))
+            else:
+                parts.append('not throttled')
+        if self.done < self.total:
+            parts.append('ETA {}'.format(self.eta(current, request_rate, item_rate)))
+        else:
+            parts.append('done in {}'.format(format_duration(now - self.started)))
+        return ' | '.join(parts)
+
+    def eta(self, current, request_rate, item_rate):
+        """
+        Remaining items times the requests each item has taken so far, at the
+        recent request rate capped by the limiter budget (1 / request_delay)
+        """
+        remaining = self.total - self.done
+        processed = self.done - self.first_sample[1]
+        requests = current[2] - self.first_sample[2]
+        if self.metrics and processed and requests:
+            budget = 1.0 / self.request_delay if self.request_delay else float('inf')
+            rate = min(request_rate, budget) if request_rate else budget
+            if rate == float('inf'):
+                return '--'
+            return format_duration(remaining * requests / processed / rate)
+        if item_rate:
+            return format_duration(remaining / item_rate)
+        return '--'
+
+    def render(self, now):
+        self.last_render = now
+        line = self.status(now)
+        if self.tty:
+            self.stream.write('\r' + line.ljust(self.line_width))
+            self.line_width = len(line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
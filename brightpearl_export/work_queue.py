@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+A shared SQLite work queue for distributed exports (see distributed.py).
+
+The coordinator enqueues a job's work units: runs of consecutive IDs in
+discovery order. Workers lease one unit at a time. A lease lasts
+lease_seconds and is extended by heartbeats, so a worker that dies or hangs
+stops extending it. Once a lease has expired, the unit is handed to the
+next worker that asks.
+
+Every state change checks that the worker still holds the lease: a worker
+that lost its unit cannot complete or release it after another worker took
+it over.
+
+SQLite's file locking serializes leases. The queue can live on a shared
+filesystem whose locks work across nodes, or on one node's disk for local
+worker processes. Lease expiry compares wall clocks, so the nodes' clocks
+should be in sync to well within a lease.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 5  # Leases of a unit before it is marked failed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    units INTEGER NOT NULL,
+    ids INTEGER NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS units (
+    job TEXT NOT NULL,
+    unit INTEGER NOT NULL,
+    first_id TEXT NOT NULL,
+    last_id TEXT NOT NULL,
+    ids TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    shard TEXT,
+    updated REAL,
+    PRIMARY KEY (job, unit)
+);
+"""
+
+
+class WorkUnit:
+    """A leased run of IDs: unit is its position in discovery order"""
+
+    def __init__(self, job, unit, ids, attempts):
+        self.job = job
+        self.unit = unit
+        self.ids = ids
+        self.attempts = attempts
+
+    def __repr__(self):
+        return 'WorkUnit({}#{}, {} IDs {}-{}, attempt {})'.format(
+            self.job, self.unit, len(self.ids), self.ids[0], self.ids[-1], self.attempts)
+
+
+class WorkQueue:
+    """Work units of jobs in one SQLite file; safe to use from several threads and processes"""
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.local = threading.local()  # .connection: one connection per thread
+        self.db.executescript(SCHEMA)
+
+    @property
+    def db(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self.local.connection = connection
+        return connection
+
+    def transaction(self):
+        return _Transaction(self.db)
+
+    def create_job(self, job, id_units, **info):
+        """Replace job with new pending units (lists of IDs, in order); info is kept for the merge"""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute('DELETE FROM units WHERE job = ?', (job,))
+            db.execute('DELETE FROM jobs WHERE job = ?', (job,))
+            db.execute('INSERT INTO jobs VALUES (?, ?, ?, ?, ?)',
+                       (job, now, len(id_units), sum(len(ids) for ids in id_units), json.dumps(info)))
+            db.executemany(
+                'INSERT INTO units (job, unit, first_id, last_id, ids, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                [(job, unit, str(ids[0]), str(ids[-1]), json.dumps(ids), now) for unit, ids in enumerate(id_units)]
+            )
+
+    def job_info(self, job):
+        """The info stored by create_job, or None if the job does not exist"""
+        row = self.db.execute('SELECT info FROM jobs WHERE job = ?', (job,)).fetchone()
+        return json.loads(row['info']) if row else None
+
+    def lease(self, job, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Lease the first pending unit of job, or a leased unit whose lease has
+        expired, to worker. Returns a WorkUnit, or None if no unit is available.
+        Expired units that reach max_attempts are marked failed instead.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("UPDATE units SET status = 'failed', worker = NULL, lease_expires = NULL, updated = ?, "
+                       "error = 'lease expired after the last attempt' "
+                       "WHERE job = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                       (now, job, now, self.max_attempts))
+            row = db.execute("SELECT unit, ids, attempts FROM units WHERE job = ? AND "
+                             "(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                             "ORDER BY unit LIMIT 1", (job, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                       "updated = ? WHERE job = ? AND unit = ?",
+                       (worker, now + lease_seconds, now, job, row['unit']))
+        return WorkUnit(job, row['unit'], json.loads(row['ids']), row['attempts'] + 1)
+
+    def _update_leased(self, unit, worker, assignments, params):
+        """Apply an update to unit if worker still holds its lease; returns whether it did"""
+        with self.transaction() as db:
+            cursor = db.execute("UPDATE units SET {}, updated = ? WHERE job = ? AND unit = ? AND status = 'leased' "
+                                "AND worker = ?".format(assignments),
+                                tuple(params) + (time.time(), unit.job, unit.unit, worker))
+            return cursor.rowcount == 1
+
+    def heartbeat(self, unit, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend worker's lease on unit; False if the lease was lost to another worker"""
+        return self._update_leased(unit, worker, 'lease_expires = ?', [time.time() + lease_seconds])
+
+    def complete(self, unit, worker, shard):
+        """Mark unit done with the shard directory holding its output; False if the lease was lost"""
+        return self._update_leased(unit, worker, "status = 'done', lease_expires = NULL, shard = ?, error = NULL", [shard])
+
+    def release(self, unit, worker, error):
+        """Give unit back after a failure, for another attempt (failed after max_attempts); False if the lease was lost"""
+        status = 'failed' if unit.attempts >= self.max_attempts else 'pending'
+        return self._update_leased(unit, worker, 'status = ?, worker = NULL, lease_expires = NULL, error = ?', [status, error])
+
+    def counts(self, job):
+        """Units of job per status: pending, leased (with a live lease), expired, done, failed"""
+        now = time.time()
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0, 'failed': 0}
+        for row in self.db.execute('SELECT status, lease_expires FROM units WHERE job = ?', (job,)):
+            status = row['status']
+            if status == 'leased' and row['lease_expires'] < now:
+                status = 'expired'
+            counts[status] += 1
+        return counts
+
+    def units(self, job):
+        """Every unit of job as a dict, in order"""
+        return [dict(row) for row in self.db.execute(
+            'SELECT unit, first_id, last_id, status, worker, attempts, error, shard FROM units WHERE job = ? ORDER BY unit',
+            (job,))]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error: takes SQLite's write lock up front so leases never race"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Per-company conversion state kept between convert_contacts.py runs.
+
+Each company's inputs (the company row, its contacts and their prepared
+addresses) are hashed into a fingerprint. The state file stores, per
+company, the fingerprint together with the output rows and customer records
+it produced, so a later run can reuse them for every company whose
+fingerprint is unchanged and only rebuild (and re-normalize) the rest.
+
+The file is JSONL: a header line with the output columns, then one line per
+company in output order. A state written with different columns is ignored.
+"""
+
+import hashlib
+import json
+import os
+
+
+def company_fingerprint(company, contacts):
+    """Hash a company row and its [(contact, addresses), ...] into a hex digest"""
+    payload = json.dumps([company, contacts], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def company_keys(companies):
+    """
+    State keys for the company rows, in order. Usually the companyId; repeated
+    companyIds get an occurrence suffix so each company row keeps its own entry.
+    """
+    seen = {}
+    keys = []
+    for company in companies:
+        company_id = company.get('companyId', '')
+        count = seen.get(company_id, 0)
+        seen[company_id] = count + 1
+        keys.append(company_id if count == 0 else '{}#{}'.format(company_id, count))
+    return keys
+
+
+def load_conversion_state(path, columns):
+    """Return {key: {'fingerprint', 'rows', 'customers'}} from a previous run, or {}"""
+    if not os.path.exists(path):
+        return {}
+    state = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('columns') != columns:
+            print(f"[WARN] {path} was written with different output columns, rebuilding all companies")
+            return {}
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                state[entry.pop('key')] = entry
+    return state
+
+
+def save_conversion_state(path, state, columns):
+    """Write {key: {'fingerprint', 'rows', 'customers'}} atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'columns': columns}) + '\n')
+        for key, entry in state.items():
+            f.write(json.dumps({
+                'key': key,
+                'fingerprint': entry['fingerprint'],
+                'rows': entry['rows'],
+                'customers': entry['customers']
+            }, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
@@ -1,13 +1,18 @@
+import argparse
 import csv
+import json
 import os
+import shutil
+import tempfile
 from collections import defaultdict
-import openai
-from dotenv import load_dotenv
 import time
-
-load_dotenv()
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-openai.api_key = OPENAI_API_KEY
+from address_rules import EU_COUNTRY_CODES, US_STATE_CODES, normalize_address_local
+from batch_jobs import POLL_INTERVAL, LocalBatchBackend, OpenAIBatchBackend, run_batch_job
+from brightpearl_export import PROFILER, add_profile_arguments, getenv
+from conversion_state import company_fingerprint, company_keys, load_conversion_state, save_conversion_state
+from external_sort import SORT_CHUNK_SIZE, external_sort, merge_join
+from llm_telemetry import TELEMETRY
+from phone_numbers import normalize_phone_number
 
 EXPORT_DIR = './exports'
 CONVERTED_DIR = './converted'
@@ -18,6 +23,18 @@ ADDRESSES_CSV = os.path.join(EXPORT_DIR, 'addresses.csv')
 OUTPUT_CSV = os.path.join(CONVERTED_DIR, 'companies.csv')
 CUSTOMERS_CSV = os.path.join(CONVERTED_DIR, 'customers.csv')
 NORMALIZED_ADDRESSES_CSV = os.path.join(CONVERTED_DIR, 'normalized_addresses.csv')
+COMPANIES_DELTA_CSV = os.path.join(CONVERTED_DIR, 'companies_delta.csv')
+CUSTOMERS_DELTA_CSV = os.path.join(CONVERTED_DIR, 'customers_delta.csv')
+CONVERSION_STATE_FILE = os.path.join(CONVERTED_DIR, 'conversion_state.jsonl')
+NORMALIZATION_REPORT = os.path.join(CONVERTED_DIR, 'normalization_report.json')
+PROFILE_REPORT = os.path.join(CONVERTED_DIR, 'convert_profile')
+PLAN_REPORT = os.path.join(CONVERTED_DIR, 'convert_plan.json')
+PROFILE_STAGES = ['load_inputs', 'row_building', 'normalization', 'csv_write']
+
+# Results of a --batch-backend local job, which only echoes the exported values
+# back. load_normalized_addresses() returns them for the rest of the run, but
+# save_normalized_addresses() never writes them to NORMALIZED_ADDRESSES_CSV.
+run_only_normalizations = {}
 
 # Output columns as per Shopify example
 OUTPUT_COLUMNS = [
@@ -31,6 +48,18 @@ OUTPUT_COLUMNS = [
     'Metafield: brightpearl.contact_id [single_line_text_field]', 'Metafield: brightpearl.wholesale [boolean]'
 ]
 
+# Output rows are lists in OUTPUT_COLUMNS order; positions of the columns filled in after normalization
+# or rewritten for delta output
+COMPANY_COMMAND = OUTPUT_COLUMNS.index('Command')
+LOCATION_NAME = OUTPUT_COLUMNS.index('Location: Name')
+LOCATION_COMMAND = OUTPUT_COLUMNS.index('Location: Command')
+CONTACT_ID = OUTPUT_COLUMNS.index('Metafield: brightpearl.contact_id [single_line_text_field]')
+SHIPPING_CITY = OUTPUT_COLUMNS.index('Location: Shipping City')
+SHIPPING_PROVINCE = OUTPUT_COLUMNS.index('Location: Shipping Province Code')
+BILLING_CITY = OUTPUT_COLUMNS.index('Location: Billing City')
+BILLING_PROVINCE = OUTPUT_COLUMNS.index('Location: Billing Province Code')
+BILLING_COLUMN_COUNT = 11  # 'Location: Billing First Name' .. 'Location: Billing Country Code'
+
 CUSTOMERS_COLUMNS = [
     'Email', 'Command', 'First Name', 'Last Name',
     'State', 'Verified Email', 'Tax Exempt'
@@ -41,54 +70,27 @@ COMPANIES_COLUMNS = ['companyId', 'companyName', 'email', 'phone', 'website', 'i
 CONTACTS_COLUMNS = ['contactId', 'isPrimaryContact', 'name', 'email', 'phone', 'tagList', 'companyId', 'Wholesale', 'Joor Account Code']
 ADDRESSES_COLUMNS = ['contactId', 'addressId', 'isBilling', 'isDelivery', 'isDefault', 'addressLine1', 'addressLine2', 'addressLine3', 'addressLine4', 'city', 'postcode', 'country']
 
-# Mapping of 3-letter to 2-letter country codes for European countries and US
-EU_COUNTRY_CODES = {
-    'ESP': 'ES', 'FRA': 'FR', 'DEU': 'DE', 'ITA': 'IT', 'PRT': 'PT', 'NLD': 'NL', 'BEL': 'BE', 'GBR': 'GB', 'IRL': 'IE',
-    'CHE': 'CH', 'AUT': 'AT', 'SWE': 'SE', 'NOR': 'NO', 'DNK': 'DK', 'FIN': 'FI', 'POL': 'PL', 'CZE': 'CZ', 'SVK': 'SK',
-    'HUN': 'HU', 'ROU': 'RO', 'BGR': 'BG', 'HRV': 'HR', 'SVN': 'SI', 'EST': 'EE', 'LVA': 'LV', 'LTU': 'LT', 'GRC': 'GR',
-    'CYP': 'CY', 'MLT': 'MT', 'LUX': 'LU', 'ISL': 'IS', 'LIE': 'LI',
-    'USA': 'US', 'GUM': 'GU', 'PRI': 'PR', 'VIR': 'VI', 'ASM': 'AS', 'MNP': 'MP'  # US and territories
-}
-
-# US State codes mapping
-US_STATE_CODES = {
-    'ALABAMA': 'AL', 'ALASKA': 'AK', 'ARIZONA': 'AZ', 'ARKANSAS': 'AR', 'CALIFORNIA': 'CA',
-    'COLORADO': 'CO', 'CONNECTICUT': 'CT', 'DELAWARE': 'DE', 'FLORIDA': 'FL', 'GEORGIA': 'GA',
-    'HAWAII': 'HI', 'IDAHO': 'ID', 'ILLINOIS': 'IL', 'INDIANA': 'IN', 'IOWA': 'IA',
-    'KANSAS': 'KS', 'KENTUCKY': 'KY', 'LOUISIANA': 'LA', 'MAINE': 'ME', 'MARYLAND': 'MD',
-    'MASSACHUSETTS': 'MA', 'MICHIGAN': 'MI', 'MINNESOTA': 'MN', 'MISSISSIPPI': 'MS', 'MISSOURI': 'MO',
-    'MONTANA': 'MT', 'NEBRASKA': 'NE', 'NEVADA': 'NV', 'NEW HAMPSHIRE': 'NH', 'NEW JERSEY': 'NJ',
-    'NEW MEXICO': 'NM', 'NEW YORK': 'NY', 'NORTH CAROLINA': 'NC', 'NORTH DAKOTA': 'ND', 'OHIO': 'OH',
-    'OKLAHOMA': 'OK', 'OREGON': 'OR', 'PENNSYLVANIA': 'PA', 'RHODE ISLAND': 'RI', 'SOUTH CAROLINA': 'SC',
-    'SOUTH DAKOTA': 'SD', 'TENNESSEE': 'TN', 'TEXAS': 'TX', 'UTAH': 'UT', 'VERMONT': 'VT',
-    'VIRGINIA': 'VA', 'WASHINGTON': 'WA', 'WEST VIRGINIA': 'WV', 'WISCONSIN': 'WI', 'WYOMING': 'WY',
-    'DISTRICT OF COLUMBIA': 'DC', 'AMERICAN SAMOA': 'AS', 'GUAM': 'GU', 'NORTHERN MARIANA ISLANDS': 'MP',
-    'PUERTO RICO': 'PR', 'VIRGIN ISLANDS': 'VI'
-}
-
-# Country code to phone prefix mapping
-COUNTRY_PHONE_PREFIXES = {
-    'ESP': '34', 'ES': '34',  # Spain
-    'GBR': '44', 'GB': '44',  # UK
-    'FRA': '33', 'FR': '33',  # France
-    'DEU': '49', 'DE': '49',  # Germany
-    'ITA': '39', 'IT': '39',  # Italy
-    'PRT': '351', 'PT': '351',  # Portugal
-    'NLD': '31', 'NL': '31',  # Netherlands
-    'BEL': '32', 'BE': '32',  # Belgium
-    'CHE': '41', 'CH': '41',  # Switzerland
-    'AUT': '43', 'AT': '43',  # Austria
-    'IRL': '353', 'IE': '353',  # Ireland
-    'USA': '1', 'US': '1',  # United States
-}
-
 BATCH_SIZE = 10
+LLM_MODEL = 'gpt-4o'
 
 NORMALIZED_ADDRESSES_COLUMNS = [
     'addressId', 'addressLine1', 'addressLine2', 'postcode', 'country',
     'normalized_city', 'normalized_province_code', 'last_updated'
 ]
 
+# 0: progress and summaries; 1 (-v): a line per normalization batch and cache load/save;
+# 2 (-vv): a line per address and the raw LLM responses
+VERBOSITY = 0
+
+def log(level, message):
+    """print message if the verbosity is at least level"""
+    if VERBOSITY >= level:
+        print(message)
+
+def openai_api_key():
+    """OPENAI_API_KEY from the environment or .env, read when the LLM is first needed"""
+    return getenv('OPENAI_API_KEY')
+
 def strip_country_prefix(province_code):
     """Strip country prefix from province codes (e.g., 'ES-M' becomes 'M')"""
     if not province_code:
@@ -100,7 +102,7 @@ def load_normalized_addresses():
     """Load previously normalized addresses from cache file"""
     normalized = {}
     if os.path.exists(NORMALIZED_ADDRESSES_CSV):
-        print(f"[CACHE] Loading normalized addresses from {NORMALIZED_ADDRESSES_CSV}")
+        log(1, f"[CACHE] Loading normalized addresses from {NORMALIZED_ADDRESSES_CSV}")
         with open(NORMALIZED_ADDRESSES_CSV, 'r', newline='', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             count = 0
@@ -116,19 +118,20 @@ def load_normalized_addresses():
                     row['normalized_province_code']
                 )
                 count += 1
-            print(f"[CACHE] Loaded {count} normalized addresses")
+            log(1, f"[CACHE] Loaded {count} normalized addresses")
     else:
-        print(f"[CACHE] No cache file found at {NORMALIZED_ADDRESSES_CSV}")
+        log(1, f"[CACHE] No cache file found at {NORMALIZED_ADDRESSES_CSV}")
+    normalized.update(run_only_normalizations)
     return normalized
 
 def save_normalized_addresses(normalized_cache, address_data):
     """Save normalized addresses to cache file"""
-    print(f"[CACHE] Saving normalized addresses to {NORMALIZED_ADDRESSES_CSV}")
-    print(f"[CACHE] Cache contains {len(normalized_cache)} addresses")
-    print(f"[CACHE] Current batch contains {len(address_data)} addresses")
+    log(1, f"[CACHE] Saving normalized addresses to {NORMALIZED_ADDRESSES_CSV}")
+    log(1, f"[CACHE] Cache contains {len(normalized_cache)} addresses")
+    log(1, f"[CACHE] Current batch contains {len(address_data)} addresses")
     
-    # Create a set to track unique addresses we've already saved
-    saved_addresses = set()
+    # Create a set to track unique addresses we've already saved (or must not save)
+    saved_addresses = set(run_only_normalizations)
     rows = []
     
     # First add all addresses from the current batch
@@ -138,7 +141,7 @@ def save_normalized_addresses(normalized_cache, address_data):
         if not addr_id:  # Skip addresses without ID
             continue
             
-        if addr_id in normalized_cache:
+        if addr_id in normalized_cache and addr_id not in saved_addresses:
             saved_addresses.add(addr_id)
             addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
             rows.append({
@@ -153,7 +156,7 @@ def save_normalized_addresses(normalized_cache, address_data):
             })
             batch_saved += 1
     
-    print(f"[CACHE] Saved {batch_saved} addresses from current batch")
+    log(1, f"[CACHE] Saved {batch_saved} addresses from current batch")
     
     # Now add any remaining addresses from the cache that weren't in address_data
     cache_saved = 0
@@ -171,8 +174,8 @@ def save_normalized_addresses(normalized_cache, address_data):
             })
             cache_saved += 1
     
-    print(f"[CACHE] Saved {cache_saved} additional addresses from cache")
-    print(f"[CACHE] Total addresses saved: {len(rows)}")
+    log(1, f"[CACHE] Saved {cache_saved} additional addresses from cache")
+    log(1, f"[CACHE] Total addresses saved: {len(rows)}")
     
     # Write all rows to the cache file
     with open(NORMALIZED_ADDRESSES_CSV, 'w', newline='', encoding='utf-8') as f:
@@ -181,265 +184,291 @@ def save_normalized_addresses(normalized_cache, address_data):
         for row in rows:
             writer.writerow(row)
 
+def original_address_values(address_dict):
+    """Return (city, province, country) exactly as exported, used when normalization is unavailable"""
+    return (
+        address_dict.get('city', ''),
+        address_dict.get('addressLine4') or address_dict.get('addressLine3', ''),
+        address_dict.get('country', '')
+    )
+
+# Sent once per request as the system message. Addresses follow as compact
+# JSON in the user message; short keys keep the per-batch token count low.
+NORMALIZATION_INSTRUCTIONS = """Normalize postal addresses. Input: JSON array of addresses with keys id, a1/a2 (street lines), c (city), p (province/state as written), z (postcode), cc (country).
+For every input address return {"id", "city", "prov"} with the same id:
+- city: full, normalized city name.
+- prov: Spain and other European countries: ISO 3166-2 province-level code without the country prefix (Madrid "M", Barcelona "B", Málaga "MA"); never an autonomous community (Madrid is "M", not "MD"); use postcode and city together to resolve ambiguity. US: two-letter state code (New York "NY"). Empty string if unknown."""
+
+# Strict structured output: the model can only answer with this shape
+NORMALIZATION_RESPONSE_FORMAT = {
+    'type': 'json_schema',
+    'json_schema': {
+        'name': 'address_normalization',
+        'strict': True,
+        'schema': {
+            'type': 'object',
+            'properties': {
+                'r': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'id': {'type': 'string'},
+                            'city': {'type': 'string'},
+                            'prov': {'type': 'string'}
+                        },
+                        'required': ['id', 'city', 'prov'],
+                        'additionalProperties': False
+                    }
+                }
+            },
+            'required': ['r'],
+            'additionalProperties': False
+        }
+    }
+}
+
+def address_request_id(address_dict, index):
+    """ID used to match an address with its result: the Brightpearl addressId, or its batch position"""
+    return address_dict.get('addressId', '') or 'i{}'.format(index)
+
+def build_batch_prompt(addresses_to_normalize):
+    """Build the compact JSON user message for a batch of addresses, one entry per unique ID"""
+    items = []
+    seen = set()
+    for idx, a in enumerate(addresses_to_normalize):
+        request_id = address_request_id(a, idx)
+        if request_id in seen:
+            continue
+        seen.add(request_id)
+        item = {
+            'id': request_id,
+            'a1': a.get('addressLine1', ''),
+            'a2': a.get('addressLine2', ''),
+            'c': a.get('city', ''),
+            'p': a.get('addressLine4') or a.get('addressLine3', ''),
+            'z': normalize_spanish_postal_code(a.get('postcode', ''), a.get('country', '')),
+            'cc': a.get('country', '')
+        }
+        items.append({key: value for key, value in item.items() if value})
+    return json.dumps(items, ensure_ascii=False, separators=(',', ':'))
+
+def build_completion_body(prompt):
+    """Chat completion parameters shared by interactive requests and batch-job request lines"""
+    return {
+        'model': LLM_MODEL,
+        'messages': [
+            {'role': 'system', 'content': NORMALIZATION_INSTRUCTIONS},
+            {'role': 'user', 'content': prompt}
+        ],
+        'temperature': 0,
+        'response_format': NORMALIZATION_RESPONSE_FORMAT
+    }
+
+def parse_batch_response(content, addresses_to_normalize):
+    """
+    Match a structured response to the addresses by ID.
+    Returns one (city, province, country) tuple per address, or None for
+    addresses the response did not include. Raises json.JSONDecodeError or
+    ValueError when the response is unusable.
+    """
+    data = json.loads(content)
+    if not isinstance(data, dict) or not isinstance(data.get('r'), list):
+        raise ValueError("Response does not match the normalization schema")
+
+    by_id = {}
+    for item in data['r']:
+        if isinstance(item, dict) and item.get('id'):
+            by_id[str(item['id'])] = item
+
+    results = []
+    for idx, addr in enumerate(addresses_to_normalize):
+        item = by_id.get(address_request_id(addr, idx))
+        if item is None:
+            results.append(None)
+            continue
+        results.append((
+            item.get('city') or addr.get('city', ''),
+            strip_country_prefix(item.get('prov') or addr.get('addressLine4') or addr.get('addressLine3', '')),
+            addr.get('country', '')
+        ))
+    return results
+
+def normalized_cache_entry(address_dict, result):
+    """Build the 6-tuple stored in the normalized address cache from a (city, province, country) result"""
+    city, province, country = result
+    return (
+        address_dict.get('addressLine1', ''),
+        address_dict.get('addressLine2', ''),
+        address_dict.get('postcode', ''),
+        country,
+        city,
+        province
+    )
+
+def request_normalizations(client, addresses_to_normalize, kind):
+    """Send one structured normalization request and return the ID-matched results; kind is 'batch' or 'single'"""
+    start = time.perf_counter()
+    try:
+        response = client.chat.completions.create(**build_completion_body(build_batch_prompt(addresses_to_normalize)))
+    except Exception:
+        TELEMETRY.record_request(kind, time.perf_counter() - start, ok=False)
+        raise
+    TELEMETRY.record_request(kind, time.perf_counter() - start, getattr(response, 'usage', None))
+    message = response.choices[0].message
+    if getattr(message, 'refusal', None):
+        raise ValueError(f"Model refused the request: {message.refusal}")
+    content = message.content or ''
+    if not content.strip():
+        raise ValueError("Empty response from API")
+    log(2, f"[DEBUG] Raw API response content: {content[:200]}...")
+    return parse_batch_response(content, addresses_to_normalize)
+
 def normalize_addresses_llm_batch(addresses, address_type):
-    if not OPENAI_API_KEY or not addresses:
-        return [(
-            a.get('city', ''),
-            a.get('addressLine4') or a.get('addressLine3', '')
-        ) for a in addresses]
+    if not addresses:
+        return []
 
     # Load cached normalizations
     normalized_cache = load_normalized_addresses()
-    results = []
+    results = [None] * len(addresses)
     addresses_to_normalize = []
     address_indices = []
 
-    # Check cache first
-    print("[CACHE] Checking addresses against cache...")
+    # Check cache first, then the offline rules, and only send the rest to the LLM
+    log(1, "[CACHE] Checking addresses against cache...")
     cache_hits = 0
+    local_hits = 0
     for i, addr in enumerate(addresses):
         addr_id = addr.get('addressId', '')
         if addr_id and addr_id in normalized_cache:
             cache_hits += 1
             addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
-            print(f"[CACHE] Hit: {addr_line1} ({postcode}) [ID: {addr_id}]")
-            results.append((city, province, country))
-        else:
-            print(f"[CACHE] Miss: {addr.get('addressLine1', '')} ({addr.get('postcode', '')}) [ID: {addr_id}]")
-            addresses_to_normalize.append(addr)
-            address_indices.append(i)
+            log(2, f"[CACHE] Hit: {addr_line1} ({postcode}) [ID: {addr_id}]")
+            results[i] = (city, province, country)
+            continue
+        local = normalize_address_local(addr)
+        if local:
+            local_hits += 1
+            log(2, f"[RULES] Resolved locally: {addr.get('addressLine1', '')} ({addr.get('postcode', '')}) [ID: {addr_id}]")
+            results[i] = local
+            continue
+        log(2, f"[CACHE] Miss: {addr.get('addressLine1', '')} ({addr.get('postcode', '')}) [ID: {addr_id}]")
+        addresses_to_normalize.append(addr)
+        address_indices.append(i)
 
-    print(f"[CACHE] Cache hits: {cache_hits}/{len(addresses)}")
+    log(1, f"[CACHE] Cache hits: {cache_hits}/{len(addresses)}, resolved locally: {local_hits}/{len(addresses)}")
+
+    TELEMETRY.record_address('cache', cache_hits)
+    TELEMETRY.record_address('local', local_hits)
 
     if not addresses_to_normalize:
-        print(f"[CACHE] All {len(addresses)} addresses found in cache")
+        log(1, f"[CACHE] All {len(addresses)} addresses found in cache or resolved locally")
         return results
 
-    print(f"[LLM] Normalizing {len(addresses_to_normalize)} addresses not found in cache")
-    
-    # Format addresses in a clear, structured way
-    formatted_addresses = ""
-    for idx, a in enumerate(addresses_to_normalize, 1):
-        normalized_postcode = normalize_spanish_postal_code(a.get('postcode', ''), a.get('country', ''))
-        formatted_addresses += f"{idx}.\n"
-        formatted_addresses += f"  Address: {a.get('addressLine1','')}\n"
-        if a.get('addressLine2'):
-            formatted_addresses += f"  Address 2: {a.get('addressLine2','')}\n"
-        formatted_addresses += f"  City: {a.get('city','')}\n"
-        if a.get('addressLine4') or a.get('addressLine3'):
-            formatted_addresses += f"  Province/State: {a.get('addressLine4') or a.get('addressLine3','')}\n"
-        formatted_addresses += f"  Postal Code: {normalized_postcode}\n"
-        formatted_addresses += f"  Country: {a.get('country','')}\n\n"
-
-    prompt = f"""
-You are a JSON-only geolocation API that normalizes addresses into a strict format.
-
-For each of the following {len(addresses_to_normalize)} addresses, return a JSON array where each item contains:
-- "city": the full, normalized city name
-- "province_code": the official state/province code, based on the rules below
-
-Rules:
-1. For **Spain and other European countries**:
-   - Use the **ISO 3166-2 province-level code**, but **omit the country prefix**.
-     - ✅ Example: "MA" for Málaga (not "ES-MA")
-     - ✅ Example: "M" for Madrid
-     - ✅ Example: "B" for Barcelona
-   - **Do NOT confuse provinces with autonomous communities**.
-     - Madrid → "M", not "MD"
-     - Andalucía → Not acceptable (too broad)
-   - Use the **postal code and city name together** to resolve ambiguity.
-
-2. For **US addresses**:
-   - Use the standard **two-letter state abbreviation** (e.g., "NY" for New York, "CA" for California).
-
-3. Response requirements:
-   - Return ONLY a valid **JSON array** with exactly {len(addresses_to_normalize)} items.
-   - Each item must have exactly two fields: `"city"` and `"province_code"`.
-   - Do **not** include explanations, comments, or any extra text — JSON only.
-
-Example format:
-[
-  {{"city": "Madrid", "province_code": "M"}},
-  {{"city": "New York", "province_code": "NY"}}
-]
+    if not openai_api_key():
+        TELEMETRY.record_address('original', len(addresses_to_normalize))
+        for i, addr in zip(address_indices, addresses_to_normalize):
+            results[i] = original_address_values(addr)
+        return results
 
-Addresses:
-{formatted_addresses}
-"""
+    log(1, f"[LLM] Normalizing {len(addresses_to_normalize)} addresses not found in cache")
 
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    # openai is slow to import, so it is only loaded once an address needs the LLM
+    import openai
+    client = openai.OpenAI(api_key=openai_api_key())
     for attempt in range(3):
+        if attempt:
+            TELEMETRY.record_retry('batch')
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            content = response.choices[0].message.content
-            if not content.strip():
-                print(f"[LLM] Warning: Empty response received on attempt {attempt + 1}")
-                raise ValueError("Empty response from API")
-            
-            print(f"[DEBUG] Raw API response content: {content[:200]}...")
-            
-            # Try to clean the response if it's not pure JSON
-            content = content.strip()
-            if not (content.startswith('[') and content.endswith(']')):
-                start = content.find('[')
-                end = content.rfind(']')
-                if start != -1 and end != -1:
-                    content = content[start:end+1]
-                    print(f"[DEBUG] Extracted JSON array: {content[:200]}...")
-            
-            import json
-            data = json.loads(content)
-            if isinstance(data, list) and len(data) == len(addresses_to_normalize):
-                # Update cache with new normalizations
-                for i, item in enumerate(data):
-                    addr = addresses_to_normalize[i]
-                    addr_id = addr.get('addressId', '')
-                    if addr_id:
-                        normalized_value = (
-                            addr_id,  # Store the addressId in the cache
-                            item.get('city', addr.get('city','')),
-                            strip_country_prefix(item.get('province_code', addr.get('addressLine4') or addr.get('addressLine3',''))),
-                            addr.get('country', '')
-                        )
-                        normalized_cache[addr_id] = normalized_value
-                        results.insert(address_indices[i], (normalized_value[1], normalized_value[2], normalized_value[3]))  # Only city, province, and country for results
-
-                # Save updated cache
-                save_normalized_addresses(normalized_cache, addresses)
-                return results
-            else:
-                print(f"[LLM] Warning: Response length mismatch. Expected {len(addresses_to_normalize)}, got {len(data) if isinstance(data, list) else 'non-list'}")
-                raise ValueError("Response length mismatch")
+            batch_results = request_normalizations(client, addresses_to_normalize, 'batch')
+            break
         except openai.RateLimitError as e:
             print(f"[LLM] Rate limit exceeded, falling back to basic address handling: {str(e)}")
-            return [(
-                a.get('city', ''),
-                a.get('addressLine4') or a.get('addressLine3', '')
-            ) for a in addresses]
+            TELEMETRY.record_rate_limited()
+            TELEMETRY.record_address('original', len(addresses_to_normalize))
+            for i, addr in zip(address_indices, addresses_to_normalize):
+                results[i] = original_address_values(addr)
+            return results
         except json.JSONDecodeError as e:
             print(f"[LLM] JSON decode error in batch {address_type} normalization (attempt {attempt + 1}/3): {str(e)}. Position: {e.pos}, Line: {e.lineno}, Column: {e.colno}")
             time.sleep(2)
         except Exception as e:
             print(f"[LLM] Error in batch {address_type} normalization (attempt {attempt + 1}/3): {str(e)}. Error type: {type(e).__name__}. Retrying...")
             time.sleep(2)
-    # Fallback: single requests
-    print(f"[LLM] Batch failed after 3 attempts, falling back to single {address_type} requests.")
-    return [normalize_address_llm(a, address_type) for a in addresses]
+    else:
+        # Fallback: single requests
+        print(f"[LLM] Batch failed after 3 attempts, falling back to single {address_type} requests.")
+        batch_results = [None] * len(addresses_to_normalize)
+
+    # Update cache with new normalizations
+    missing = []
+    for i, addr, result in zip(address_indices, addresses_to_normalize, batch_results):
+        if result is None:
+            missing.append((i, addr))
+            continue
+        addr_id = addr.get('addressId', '')
+        if addr_id:
+            normalized_cache[addr_id] = normalized_cache_entry(addr, result)
+        results[i] = result
+    TELEMETRY.record_address('llm', len(addresses_to_normalize) - len(missing))
+
+    # Save updated cache
+    if len(missing) < len(addresses_to_normalize):
+        save_normalized_addresses(normalized_cache, addresses)
+
+    # Only addresses missing from the response are retried, one at a time
+    if missing and len(missing) < len(addresses_to_normalize):
+        print(f"[LLM] {len(missing)} addresses were missing from the batch response, normalizing them individually")
+    TELEMETRY.record_fallback_to_single(len(missing))
+    for i, addr in missing:
+        results[i] = normalize_address_llm(addr, address_type)
+    return results
 
 def normalize_address_llm(address_dict, address_type):
-    if not OPENAI_API_KEY:
-        return (
-            address_dict.get('city', ''),
-            address_dict.get('addressLine4') or address_dict.get('addressLine3', ''),
-            address_dict.get('country', '')
-        )
-
-    # Check cache first
+    # Check cache first, then the offline rules, as normalize_addresses_llm_batch does
     addr_id = address_dict.get('addressId', '')
+    normalized_cache = load_normalized_addresses() if addr_id else {}
     if addr_id:
-        normalized_cache = load_normalized_addresses()
         if addr_id in normalized_cache:
             addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
-            print(f"[CACHE] Hit in single request: {addr_line1} ({postcode}) [ID: {addr_id}]")
+            log(2, f"[CACHE] Hit in single request: {addr_line1} ({postcode}) [ID: {addr_id}]")
+            TELEMETRY.record_address('cache')
             return (city, province, country)
         else:
-            print(f"[CACHE] Miss in single request: {address_dict.get('addressLine1', '')} ({address_dict.get('postcode', '')}) [ID: {addr_id}]")
-
-    # Build address string separately to avoid f-string issues
-    address_str = f"Address: {address_dict.get('addressLine1','')}\n"
-    if address_dict.get('addressLine2'):
-        address_str += f"Address 2: {address_dict.get('addressLine2','')}\n"
-    address_str += f"City: {address_dict.get('city','')}\n"
-    if address_dict.get('addressLine4') or address_dict.get('addressLine3'):
-        address_str += f"Province/State: {address_dict.get('addressLine4') or address_dict.get('addressLine3','')}\n"
-    address_str += f"Postal Code: {normalize_spanish_postal_code(address_dict.get('postcode', ''), address_dict.get('country', ''))}\n"
-    address_str += f"Country: {address_dict.get('country','')}"
-
-    prompt = """You are a JSON-only geolocation API that normalizes addresses into a strict format.
-
-Rules:
-1. For **Spain and other European countries**:
-   - Use the **ISO 3166-2 province-level code**, but **omit the country prefix**.
-     - ✅ Example: "MA" for Málaga (not "ES-MA")
-     - ✅ Example: "M" for Madrid
-     - ✅ Example: "B" for Barcelona
-   - **Do NOT confuse provinces with autonomous communities**.
-     - Madrid → "M", not "MD"
-     - Andalucía → Not acceptable (too broad)
-   - Use the **postal code and city name together** to resolve ambiguity.
-
-2. For **US addresses**:
-   - Use the standard **two-letter state abbreviation** (e.g., "NY" for New York, "CA" for California).
-
-3. Response requirements:
-   - Return ONLY a single JSON object
-   - The object must have exactly two fields: `"city"` and `"province_code"`
-   - Do **not** include explanations, comments, or any extra text — JSON only.
-
-Example format:
-{"city": "Madrid", "province_code": "M"}
-
-Input address:
-""" + address_str
-
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
+            log(2, f"[CACHE] Miss in single request: {address_dict.get('addressLine1', '')} ({address_dict.get('postcode', '')}) [ID: {addr_id}]")
+
+    local = normalize_address_local(address_dict)
+    if local:
+        TELEMETRY.record_address('local')
+        return local
+
+    if not openai_api_key():
+        TELEMETRY.record_address('original')
+        return original_address_values(address_dict)
+
+    import openai
+    client = openai.OpenAI(api_key=openai_api_key())
     for attempt in range(3):
+        if attempt:
+            TELEMETRY.record_retry('single')
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            content = response.choices[0].message.content
-            if not content.strip():
-                print(f"[LLM] Warning: Empty response received on attempt {attempt + 1}")
-                raise ValueError("Empty response from API")
-            
-            print(f"[DEBUG] Raw API response content: {content[:200]}...")
-            
-            # Try to clean the response if it's not pure JSON
-            content = content.strip()
-            if not (content.startswith('{') and content.endswith('}')):
-                # Try to find JSON object within the response
-                start = content.find('{')
-                end = content.rfind('}')
-                if start != -1 and end != -1:
-                    content = content[start:end+1]
-                    print(f"[DEBUG] Extracted JSON object: {content[:200]}...")
-            
-            import json
-            data = json.loads(content)
-            result = (
-                data.get('city', address_dict.get('city','')),
-                strip_country_prefix(data.get('province_code', address_dict.get('addressLine4') or address_dict.get('addressLine3',''))),
-                address_dict.get('country', '')
-            )
+            result = request_normalizations(client, [address_dict], 'single')[0]
+            if result is None:
+                raise ValueError("Address missing from response")
 
             # Update cache with the new normalization
             if addr_id:
-                normalized_cache[addr_id] = (
-                    address_dict.get('addressLine1', ''),
-                    address_dict.get('addressLine2', ''),
-                    address_dict.get('postcode', ''),
-                    result[2],  # country
-                    result[0],  # city
-                    result[1]   # province
-                )
+                normalized_cache[addr_id] = normalized_cache_entry(address_dict, result)
                 save_normalized_addresses(normalized_cache, [address_dict])
 
+            TELEMETRY.record_address('llm')
             return result
 
         except openai.RateLimitError as e:
             print(f"[LLM] Rate limit exceeded, falling back to basic address handling: {str(e)}")
-            return (
-                address_dict.get('city', ''),
-                address_dict.get('addressLine4') or address_dict.get('addressLine3', ''),
-                address_dict.get('country', '')
-            )
+            TELEMETRY.record_rate_limited()
+            TELEMETRY.record_address('original')
+            return original_address_values(address_dict)
         except json.JSONDecodeError as e:
             print(f"[LLM] JSON decode error in {address_type} address normalization (attempt {attempt + 1}/3): {str(e)}. Position: {e.pos}, Line: {e.lineno}, Column: {e.colno}")
             time.sleep(2)
@@ -448,11 +477,87 @@ Input address:
             time.sleep(2)
     # Fallback to original after all retries
     print(f"[LLM] Single address normalization failed after 3 attempts, using original values.")
-    return (
-        address_dict.get('city', ''),
-        address_dict.get('addressLine4') or address_dict.get('addressLine3', ''),
-        address_dict.get('country', '')
-    )
+    TELEMETRY.record_address('original')
+    return original_address_values(address_dict)
+
+def normalize_addresses_batch_job(addresses, backend_name='openai', poll_interval=POLL_INTERVAL):
+    """
+    Normalize every cache miss through one offline batch job and ingest the
+    results into the normalized address cache. The interactive batches that
+    run afterwards then find everything in the cache. The local stand-in's
+    results are not from a model, so they are kept for this run only
+    (run_only_normalizations) and never saved.
+    """
+    normalized_cache = load_normalized_addresses()
+
+    # Unique cache misses that the offline rules cannot resolve. Addresses
+    # without an ID cannot be cached, so they are left to the interactive path.
+    misses = {}
+    for addr in addresses:
+        addr_id = addr.get('addressId', '')
+        if not addr_id or addr_id in normalized_cache or addr_id in misses:
+            continue
+        if normalize_address_local(addr):
+            continue
+        misses[addr_id] = addr
+
+    if not misses:
+        print("[BATCH] No cache misses, skipping batch job")
+        return
+    if backend_name == 'openai' and not openai_api_key():
+        print("[BATCH] OPENAI_API_KEY is not set, skipping batch job")
+        return
+
+    miss_list = list(misses.values())
+    chunks = {}
+    requests = []
+    for i in range(0, len(miss_list), BATCH_SIZE):
+        custom_id = 'addresses-{}'.format(i // BATCH_SIZE + 1)
+        chunks[custom_id] = miss_list[i:i+BATCH_SIZE]
+        requests.append((custom_id, build_completion_body(build_batch_prompt(chunks[custom_id]))))
+    print(f"[BATCH] {len(miss_list)} addresses need normalization, {len(requests)} batch requests")
+
+    if backend_name == 'local':
+        def responder(custom_id, body):
+            # Echo the exported values back in the structured response format
+            return json.dumps({'r': [
+                {'id': address_request_id(addr, idx), 'city': city, 'prov': province}
+                for idx, (addr, (city, province, _)) in enumerate(
+                    (a, original_address_values(a)) for a in chunks[custom_id])
+            ]}, ensure_ascii=False)
+        backend = LocalBatchBackend(responder, CONVERTED_DIR)
+    else:
+        import openai
+        backend = OpenAIBatchBackend(openai.OpenAI(api_key=openai_api_key()))
+
+    contents = run_batch_job(requests, backend, CONVERTED_DIR, poll_interval)
+
+    ingested = 0
+    for custom_id, chunk in chunks.items():
+        content = contents.get(custom_id)
+        if not content:
+            continue
+        try:
+            chunk_results = parse_batch_response(content, chunk)
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"[BATCH] Could not parse results for {custom_id}: {str(e)}. Those addresses will be normalized interactively.")
+            continue
+        for addr, result in zip(chunk, chunk_results):
+            if result is None:
+                continue
+            if backend_name == 'local':
+                run_only_normalizations[addr['addressId']] = normalized_cache_entry(addr, result)
+            else:
+                normalized_cache[addr['addressId']] = normalized_cache_entry(addr, result)
+            ingested += 1
+
+    TELEMETRY.record_batch_job(len(requests), ingested)
+    if backend_name == 'local':
+        print(f"[BATCH] Kept {ingested}/{len(miss_list)} local stand-in results for this run only; {NORMALIZED_ADDRESSES_CSV} is not changed")
+        return
+    print(f"[BATCH] Ingested {ingested}/{len(miss_list)} normalized addresses into the cache")
+    if ingested:
+        save_normalized_addresses(normalized_cache, miss_list)
 
 def ensure_csv_exists(path, columns):
     if not os.path.exists(path):
@@ -461,7 +566,7 @@ def ensure_csv_exists(path, columns):
             writer = csv.DictWriter(f, fieldnames=columns)
             writer.writeheader()
 
-def read_csv(path):
+def ensure_input_csv(path):
     # Create the file with just the header if it does not exist
     if path == COMPANIES_CSV:
         ensure_csv_exists(path, COMPANIES_COLUMNS)
@@ -469,9 +574,20 @@ def read_csv(path):
         ensure_csv_exists(path, CONTACTS_COLUMNS)
     elif path == ADDRESSES_CSV:
         ensure_csv_exists(path, ADDRESSES_COLUMNS)
+
+def read_csv(path):
+    ensure_input_csv(path)
     with open(path, newline='', encoding='utf-8') as f:
         return list(csv.DictReader(f))
 
+def iter_csv(path):
+    """Stream rows from an input file, tagging each with its position ('_seq')"""
+    ensure_input_csv(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        for seq, row in enumerate(csv.DictReader(f)):
+            row['_seq'] = seq
+            yield row
+
 def normalize_address(addr):
     # Lowercase, remove spaces and special chars for deduplication
     return ''.join(e for e in addr.lower() if e.isalnum())
@@ -511,346 +627,553 @@ def normalize_spanish_postal_code(postcode, country):
     # If less than 5 digits, pad with leading zeros
     return digits.zfill(5)
 
-def normalize_phone_number(phone, country_code):
+def prepare_address(a, normalized_cache):
+    """Apply the cached country and Spanish postcode padding to an exported address (in place)"""
+    # Check if we have this address in normalized cache
+    addr_id = a.get('addressId', '')
+    if addr_id and addr_id in normalized_cache:
+        addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
+        a['country'] = country if country else a.get('country', '')
+
+    # Normalize Spanish postal codes before the address is used
+    a['postcode'] = normalize_spanish_postal_code(a.get('postcode', ''), a.get('country', ''))
+    return a
+
+def build_contact_rows(company, contact, contact_addresses):
     """
-    Normalize phone numbers to E.164 format based on country code.
-    Returns tuple of (normalized_number, success_flag)
+    Build the Shopify location rows for one contact, with placeholders for city/province.
+    Returns ([(row, ship_addr, billing_addr), ...], customer) where each row is
+    a list in OUTPUT_COLUMNS order and customer is None when the contact has no
+    email or no delivery address.
     """
-    if not phone or not country_code:
-        return '', False
-        
-    # Remove any non-digit characters
-    digits = ''.join(c for c in str(phone) if c.isdigit())
-    if not digits:
-        return '', False
-        
-    # If already in international format, just ensure it starts with +
-    if phone.startswith('+'):
-        return phone, True
-        
-    # Get country prefix
-    prefix = COUNTRY_PHONE_PREFIXES.get(country_code.upper())
-    if not prefix:
-        return phone, False  # Can't normalize without knowing the country prefix
-        
-    # Check if number already starts with country code
-    if digits.startswith(prefix):
-        return f"+{digits}", True
-        
-    # Handle special cases by country
-    if country_code.upper() in ['ESP', 'ES']:
-        # Spanish numbers are 9 digits
-        if len(digits) == 9 and digits[0] in ['6', '7', '8', '9']:
-            return f"+{prefix}{digits}", True
-            
-    elif country_code.upper() in ['GBR', 'GB']:
-        # UK numbers: remove leading 0 if present
-        if digits.startswith('0'):
-            digits = digits[1:]
-        return f"+{prefix}{digits}", True
-        
-    elif country_code.upper() in ['USA', 'US']:
-        # US numbers should be 10 digits (area code + local number)
-        # Remove leading 1 if present
-        if digits.startswith('1') and len(digits) == 11:
-            digits = digits[1:]
-        # Check if we have a valid 10-digit number
-        if len(digits) == 10:
-            return f"+{prefix}{digits}", True
-        
-    elif country_code.upper() in ['FRA', 'FR', 'DEU', 'DE', 'ITA', 'IT', 'BEL', 'BE', 'CHE', 'CH']:
-        # Most European numbers: remove leading 0 if present
-        if digits.startswith('0'):
-            digits = digits[1:]
-        return f"+{prefix}{digits}", True
-        
-    # For any other country, just add the prefix if we have it
-    if prefix:
-        # Remove leading zeros
-        digits = digits.lstrip('0')
-        return f"+{prefix}{digits}", True
-        
-    return phone, False
+    company_name = company.get('companyName', '')
+    contact_id = contact.get('contactId', '')
+    contact_name = contact.get('name', '')
+    contact_email = contact.get('email', '')
+    contact_phone = contact.get('phone', '')
+
+    original_phone = contact_phone  # Store original phone before normalization
+
+    # Get all delivery addresses for this contact
+    delivery_addrs = [a for a in contact_addresses if a.get('isDelivery','').upper() == 'TRUE']
+
+    # Remove duplicates based on normalized address
+    seen = set()
+    unique_delivery_addrs = []
+    for addr in delivery_addrs:
+        norm = normalize_address(addr.get('addressLine1',''))
+        if norm and norm not in seen:
+            seen.add(norm)
+            unique_delivery_addrs.append(addr)
+
+    # Find first billing address for this contact
+    billing_addr = next((a for a in contact_addresses if a.get('isBilling','').upper() == 'TRUE'), None)
+
+    # Billing columns are the same for every location of the contact
+    if billing_addr:
+        bill_first, bill_last = split_name(contact_name)
+        bill_phone, _ = normalize_phone_number(original_phone, billing_addr.get('country', ''))
+        billing_columns = [
+            bill_first, bill_last, company_name, bill_phone, original_phone,
+            billing_addr.get('addressLine1',''), billing_addr.get('addressLine2',''), billing_addr.get('postcode',''), billing_addr.get('city',''),
+            billing_addr.get('addressLine4') or billing_addr.get('addressLine3',''), convert_country_code(billing_addr.get('country',''))
+        ]
+        location_role = 'Location admin'
+    else:
+        billing_columns = [''] * BILLING_COLUMN_COUNT
+        location_role = 'Ordering only'
+
+    wholesale = contact.get('Wholesale', 'FALSE').upper()
+    entries = []
+    customer = None
+    for ship_addr in unique_delivery_addrs:
+        # Build row with placeholders for city/province
+        ship_first, ship_last = split_name(contact_name)
+        ship_phone, _ = normalize_phone_number(original_phone, ship_addr.get('country', ''))
+        ship_addr1 = ship_addr.get('addressLine1','')
+        ship_prov = ship_addr.get('addressLine4') or ship_addr.get('addressLine3','')
+
+        row = [
+            company_name, 'NEW', '',
+            ship_addr1, 'NEW', ship_phone, original_phone, 'es', company.get('taxNumber', ''), '', '',
+            'TRUE', 'FALSE', '', 'FALSE',
+            ship_first, ship_last, company_name, ship_phone, original_phone, ship_addr1, ship_addr.get('addressLine2',''),
+            ship_addr.get('postcode',''), ship_addr.get('city',''), ship_prov, convert_country_code(ship_addr.get('country','')),
+        ] + billing_columns + [
+            '', 'MERGE',
+            contact_email, 'MERGE', location_role,
+            contact_id, wholesale
+        ]
+
+        entries.append((row, ship_addr, billing_addr))
+
+        # Customer record for this contact (de-duplicated by email by the caller)
+        if contact_email and customer is None:
+            customer = {
+                'Email': contact_email,
+                'Command': 'MERGE',
+                'First Name': ship_first,
+                'Last Name': ship_last,
+                'State': 'enabled',
+                'Verified Email': 'TRUE',
+                'Tax Exempt': wholesale
+            }
+
+    return entries, customer
+
+def build_company_rows(work, state):
+    """
+    Build the rows and customers of each (key, company, contacts, fingerprint)
+    in work into state[key]. Returns (rows, ship_addr_refs, bill_addr_refs),
+    where the refs are the (row_idx, addr_dict) pairs still to normalize.
+    """
+    rows = []
+    # Collect all shipping and billing addresses to normalize in batch
+    ship_addr_refs = []  # (row_idx, addr_dict)
+    bill_addr_refs = []
+    for key, company, company_contacts, fingerprint in work:
+        # Get all contacts for this company
+        company_rows = []
+        company_customers = []
+        for contact, contact_addresses in company_contacts:
+            entries, customer = build_contact_rows(company, contact, contact_addresses)
+            for row, ship_addr, billing_addr in entries:
+                ship_addr_refs.append((len(rows), ship_addr))
+                if billing_addr:
+                    bill_addr_refs.append((len(rows), billing_addr))
+                rows.append(row)
+                company_rows.append(row)
+            if customer:
+                company_customers.append(customer)
+        state[key] = {'fingerprint': fingerprint, 'rows': company_rows, 'customers': company_customers}
+    return rows, ship_addr_refs, bill_addr_refs
+
+def normalize_address_list(addresses, address_type):
+    """Normalize a list of addresses in batches of BATCH_SIZE, returning one (city, province, country) per address"""
+    results = []
+    with PROFILER.stage('normalization'):
+        for i in range(0, len(addresses), BATCH_SIZE):
+            batch = addresses[i:i+BATCH_SIZE]
+            log(1, f"[LLM] Normalizing {address_type} addresses {i+1}-{i+len(batch)}...")
+            results.extend(normalize_addresses_llm_batch(batch, address_type))
+    return results
+
+def apply_address_normalization(rows, ship_addr_refs, bill_addr_refs):
+    """Batch normalize the referenced addresses and fill in the city/province columns of their rows"""
+    # Batch normalize shipping addresses
+    results = normalize_address_list([addr for _, addr in ship_addr_refs], 'shipping')
+    for (row_idx, _), (city, prov, _) in zip(ship_addr_refs, results):  # Unpack three values, ignore country
+        rows[row_idx][SHIPPING_CITY] = city
+        rows[row_idx][SHIPPING_PROVINCE] = prov
 
-def main():
-    print("[INFO] Starting conversion...")
-    os.makedirs(CONVERTED_DIR, exist_ok=True)
+    # Batch normalize billing addresses
+    results = normalize_address_list([addr for _, addr in bill_addr_refs], 'billing')
+    for (row_idx, _), (city, prov, _) in zip(bill_addr_refs, results):  # Unpack three values, ignore country
+        rows[row_idx][BILLING_CITY] = city
+        rows[row_idx][BILLING_PROVINCE] = prov
+
+def unique_customers(entries):
+    """One customer per email, in order of first appearance, as {email: customer}"""
+    customers = {}
+    for entry in entries:
+        for customer in entry['customers']:
+            # Add customer record if we haven't seen this email before
+            if customer['Email'] not in customers:
+                customers[customer['Email']] = customer
+    return customers
+
+def build_delta(state, previous):
+    """
+    Return (rows, customers) that are new or changed since the previous run.
+    Rows of companies that existed before are sent as MERGE, and so are their
+    locations that already existed; new companies and locations stay NEW.
+    Nothing is deleted for companies or locations removed upstream.
+    """
+    delta_rows = []
+    for key, entry in state.items():
+        prior = previous.get(key)
+        if prior is entry:
+            continue
+        if prior is None:
+            delta_rows.extend(entry['rows'])
+            continue
+        prior_rows = {(row[CONTACT_ID], row[LOCATION_NAME]): row for row in prior['rows']}
+        prior_locations = {row[LOCATION_NAME] for row in prior['rows']}
+        for row in entry['rows']:
+            if prior_rows.get((row[CONTACT_ID], row[LOCATION_NAME])) == row:
+                continue
+            row = list(row)
+            row[COMPANY_COMMAND] = 'MERGE'
+            if row[LOCATION_NAME] in prior_locations:
+                row[LOCATION_COMMAND] = 'MERGE'
+            delta_rows.append(row)
+
+    previous_customers = unique_customers(previous.values())
+    delta_customers = [
+        customer for email, customer in unique_customers(state.values()).items()
+        if previous_customers.get(email) != customer
+    ]
+    return delta_rows, delta_customers
+
+def write_rows(path, rows):
+    """Write output rows; rows already CSV-encoded by a --workers process are written as-is"""
+    print(f"[INFO] Writing {len(rows)} rows to {path}")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        for row in rows:
+            if isinstance(row, str):
+                f.write(row)
+            else:
+                writer.writerow(row)
+
+def write_customers(path, customers):
+    customers = list(customers)
+    print(f"[INFO] Writing {len(customers)} customers to {path}")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CUSTOMERS_COLUMNS)
+        writer.writeheader()
+        writer.writerows(customers)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Convert Brightpearl exports into Shopify B2B import files.')
+    parser.add_argument('--batch-job', action='store_true',
+                        help='Normalize all cache misses through one offline batch job before building the output')
+    parser.add_argument('--batch-backend', choices=['openai', 'local'], default='openai',
+                        help='Batch endpoint to use: the OpenAI Batches API (honours OPENAI_BASE_URL) or an in-process stand-in')
+    parser.add_argument('--batch-poll-interval', type=int, default=POLL_INTERVAL,
+                        help='Seconds between batch job status checks')
+    parser.add_argument('--engine', choices=['rows', 'columnar'], default='rows',
+                        help='Conversion engine: one dict per row (default) or vectorized column operations (requires pandas)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the rows of companies whose inputs are unchanged since the last run')
+    parser.add_argument('--delta', action='store_true',
+                        help='Also write companies_delta.csv and customers_delta.csv with only new or changed rows (implies --incremental)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Build rows in this many processes, companies hash-partitioned by companyId (in-memory rows engine only)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Bounded-memory mode: sort the inputs on disk and stream a merge join to the output files')
+    parser.add_argument('--chunk-size', type=int, default=SORT_CHUNK_SIZE,
+                        help='Records held in memory per sorted run and locations per normalization chunk in --streaming mode')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='-v: a line per normalization batch and cache save; -vv: also a line per address and the raw LLM responses')
+    parser.add_argument('--plan', action='store_true',
+                        help='Only count the addresses and LLM requests the conversion will need after the cache and the offline rules, then exit')
+    add_profile_arguments(parser, PROFILE_STAGES)
+    args = parser.parse_args(argv)
+    if args.delta:
+        args.incremental = True
+    if args.incremental and (args.streaming or args.engine != 'rows'):
+        parser.error('--incremental and --delta are only supported by the default in-memory rows engine')
+    if args.workers > 1 and (args.streaming or args.engine != 'rows'):
+        parser.error('--workers is only supported by the default in-memory rows engine')
+    return args
+
+def convert_in_memory(args):
     print("[INFO] Loading input files...")
-    companies = read_csv(COMPANIES_CSV)
-    contacts = read_csv(CONTACTS_CSV)
-    addresses = read_csv(ADDRESSES_CSV)
-    print(f"[INFO] Loaded {len(companies)} companies, {len(contacts)} contacts, {len(addresses)} addresses.")
+    with PROFILER.stage('load_inputs'):
+        companies = read_csv(COMPANIES_CSV)
+        contacts = read_csv(CONTACTS_CSV)
+        addresses = read_csv(ADDRESSES_CSV)
+        print(f"[INFO] Loaded {len(companies)} companies, {len(contacts)} contacts, {len(addresses)} addresses.")
 
-    # Load normalized addresses cache to get country codes
-    normalized_cache = load_normalized_addresses()
-    
+        # Load normalized addresses cache to get country codes
+        normalized_cache = load_normalized_addresses()
+    convert_records(companies, contacts, addresses, normalized_cache, args)
+
+def collect_company_work(companies, contacts, addresses, normalized_cache, previous, incremental):
+    """
+    Join contacts and addresses to their companies. Returns (state, work):
+    state holds {company key: reused entry from previous, or None} in company
+    order, and work the (key, company, [(contact, addresses), ...], fingerprint)
+    of the companies to rebuild.
+    """
     # Index contacts by companyId
     contacts_by_company = defaultdict(list)
     for c in contacts:
         contacts_by_company[c.get('companyId','')].append(c)
 
-    # Index addresses by contactId and build contact-to-country mapping
+    # Index addresses by contactId
     addresses_by_contact = defaultdict(list)
-    contact_countries = {}  # Map contact IDs to their primary country
     for a in addresses:
-        # Check if we have this address in normalized cache
-        addr_id = a.get('addressId', '')
-        if addr_id and addr_id in normalized_cache:
-            addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
-            a['country'] = country if country else a.get('country', '')
-        
-        # Normalize Spanish postal codes before adding to the index
-        a['postcode'] = normalize_spanish_postal_code(a.get('postcode', ''), a.get('country', ''))
-        contact_id = a.get('contactId','')
-        addresses_by_contact[contact_id].append(a)
-        
-        # Use billing address country as primary if available, otherwise use first country found
-        if a.get('isBilling','').upper() == 'TRUE':
-            contact_countries[contact_id] = a.get('country', '')
-        elif contact_id not in contact_countries:
-            contact_countries[contact_id] = a.get('country', '')
+        prepare_address(a, normalized_cache)
+        addresses_by_contact[a.get('contactId','')].append(a)
 
-    rows = []
-    customers = []
-    processed_emails = set()  # To track unique customers
-    
-    # Collect all shipping and billing addresses to normalize in batch
-    all_ship_addrs = []
-    all_bill_addrs = []
-    ship_addr_refs = []  # (row_idx, addr_dict)
-    bill_addr_refs = []
-    print("[INFO] Building output rows and collecting addresses for normalization...")
-
-    for company in companies:
+    state = {}  # {company key: {'fingerprint', 'rows', 'customers'}} in company order
+    work = []
+    for key, company in zip(company_keys(companies), companies):
         company_id = company.get('companyId', '')
-        company_name = company.get('companyName', '')
-        
-        # Get all contacts for this company
-        company_contacts = contacts_by_company.get(company_id, [])
-        if not company_contacts:
+        company_contacts = [
+            (contact, addresses_by_contact.get(contact.get('contactId', ''), []))
+            for contact in contacts_by_company.get(company_id, [])
+        ]
+        fingerprint = company_fingerprint(company, company_contacts) if incremental else None
+        prior = previous.get(key)
+        if prior and prior['fingerprint'] == fingerprint:
+            state[key] = prior
             continue
-            
-        for contact in company_contacts:
-            contact_id = contact.get('contactId', '')
-            contact_name = contact.get('name', '')
-            contact_email = contact.get('email', '')
-            contact_phone = contact.get('phone', '')
-            
-            # Get addresses for this contact
-            contact_addresses = addresses_by_contact.get(contact_id, [])
-            
-            # Try to get country code from normalized addresses first
-            country_code = None
-            for addr in contact_addresses:
-                addr_id = addr.get('addressId', '')
-                if addr_id and addr_id in normalized_cache:
-                    addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
-                    if country:
-                        country_code = country
-                        break
-            
-            # If no country code found in normalized addresses, fall back to contact_countries
-            if not country_code:
-                country_code = contact_countries.get(contact_id, '')
+        state[key] = None  # Filled in once the rows are built, keeps the company order
+        work.append((key, company, company_contacts, fingerprint))
+    return state, work
 
-            # Normalize phone numbers
-            normalized_phone, phone_success = normalize_phone_number(contact_phone, country_code)
-            original_phone = contact_phone  # Store original phone before normalization
-            
-            # Get all delivery addresses for this contact
-            delivery_addrs = [a for a in addresses_by_contact.get(contact_id, []) if a.get('isDelivery','').upper() == 'TRUE']
-            
-            # Remove duplicates based on normalized address
-            seen = set()
-            unique_delivery_addrs = []
-            for addr in delivery_addrs:
-                norm = normalize_address(addr.get('addressLine1',''))
-                if norm and norm not in seen:
-                    seen.add(norm)
-                    unique_delivery_addrs.append(addr)
-            
-            # Find first billing address for this contact
-            billing_addr = next((a for a in addresses_by_contact.get(contact_id, []) if a.get('isBilling','').upper() == 'TRUE'), None)
-            
-            for ship_addr in unique_delivery_addrs:
-                all_ship_addrs.append(ship_addr)
-                ship_addr_refs.append((len(rows), ship_addr))
-                if billing_addr:
-                    all_bill_addrs.append(billing_addr)
-                    bill_addr_refs.append((len(rows), billing_addr))
-                else:
-                    bill_addr_refs.append((len(rows), None))
-                
-                # Build row with placeholders for city/province
-                ship_first, ship_last = split_name(contact_name)
-                ship_recipient = company_name
-                original_ship_phone = original_phone  # Use original phone for shipping
-                ship_phone, _ = normalize_phone_number(original_ship_phone, ship_addr.get('country', ''))
-                ship_addr1 = ship_addr.get('addressLine1','')
-                ship_addr2 = ship_addr.get('addressLine2','')
-                ship_zip = ship_addr.get('postcode','')
-                ship_city = ship_addr.get('city','')
-                ship_prov = ship_addr.get('addressLine4') or ship_addr.get('addressLine3','')
-                ship_country = convert_country_code(ship_addr.get('country',''))
+def convert_records(companies, contacts, addresses, normalized_cache, args):
+    """
+    Convert export records (dicts with the export CSV columns, all strings) into
+    the Shopify output files. normalized_cache is the cache as it was before
+    any of these addresses were normalized.
+    """
+    # Rows and customers of unchanged companies are reused from the previous run
+    with PROFILER.stage('load_inputs'):
+        previous = load_conversion_state(CONVERSION_STATE_FILE, OUTPUT_COLUMNS) if args.incremental else {}
+
+    with PROFILER.stage('row_building'):
+        state, work = collect_company_work(companies, contacts, addresses, normalized_cache, previous, args.incremental)
+
+        if args.incremental:
+            print(f"[INFO] Reused {len(state) - len(work)} unchanged companies, rebuilding {len(work)}.")
+
+        print("[INFO] Building output rows and collecting addresses for normalization...")
+        if args.workers > 1:
+            from parallel_convert import build_company_rows_parallel
+            # The state file and delta need rows as lists, so only plain runs get pre-encoded rows
+            rows, ship_addr_refs, bill_addr_refs = build_company_rows_parallel(
+                work, state, normalized_cache, args.workers, encode_rows=not args.incremental
+            )
+        else:
+            rows, ship_addr_refs, bill_addr_refs = build_company_rows(work, state)
 
-                if billing_addr:
-                    bill_first, bill_last = split_name(contact_name)
-                    bill_recipient = company_name
-                    original_bill_phone = original_phone  # Use original phone for billing
-                    bill_phone, _ = normalize_phone_number(original_bill_phone, billing_addr.get('country', ''))
-                    bill_addr1 = billing_addr.get('addressLine1','')
-                    bill_addr2 = billing_addr.get('addressLine2','')
-                    bill_zip = billing_addr.get('postcode','')
-                    bill_city = billing_addr.get('city','')
-                    bill_province = billing_addr.get('addressLine4') or billing_addr.get('addressLine3','')
-                    bill_country = convert_country_code(billing_addr.get('country',''))
-
-                    row = {
-                        'Name': company_name,
-                        'Command': 'NEW',
-                        'Main Contact: Customer ID': '',
-                        'Location: Name': ship_addr1,
-                        'Location: Command': 'NEW',
-                        'Location: Phone': ship_phone,
-                        'Location: Original Phone': original_ship_phone,
-                        'Location: Locale': 'es',
-                        'Location: Tax ID': company.get('taxNumber', ''),
-                        'Location: Tax Setting': '',
-                        'Location: Tax Exemptions': '',
-                        'Location: Allow Shipping To Any Address': 'TRUE',
-                        'Location: Checkout To Draft': 'FALSE',
-                        'Location: Checkout Payment Terms': '',
-                        'Location: Checkout Pay Now Only': 'FALSE',
-                        'Location: Shipping First Name': ship_first,
-                        'Location: Shipping Last Name': ship_last,
-                        'Location: Shipping Recipient': ship_recipient,
-                        'Location: Shipping Phone': ship_phone,
-                        'Location: Original Shipping Phone': original_ship_phone,
-                        'Location: Shipping Address 1': ship_addr1,
-                        'Location: Shipping Address 2': ship_addr2,
-                        'Location: Shipping Zip': ship_zip,
-                        'Location: Shipping City': ship_city,
-                        'Location: Shipping Province Code': ship_prov,
-                        'Location: Shipping Country Code': ship_country,
-                        'Location: Billing First Name': bill_first,
-                        'Location: Billing Last Name': bill_last,
-                        'Location: Billing Recipient': bill_recipient,
-                        'Location: Billing Phone': bill_phone,
-                        'Location: Original Billing Phone': original_bill_phone,
-                        'Location: Billing Address 1': bill_addr1,
-                        'Location: Billing Address 2': bill_addr2,
-                        'Location: Billing Zip': bill_zip,
-                        'Location: Billing City': bill_city,
-                        'Location: Billing Province Code': bill_province,
-                        'Location: Billing Country Code': bill_country,
-                        'Location: Catalogs': '',
-                        'Location: Catalogs Command': 'MERGE',
-                        'Customer: Email': contact_email,
-                        'Customer: Command': 'MERGE',
-                        'Customer: Location Role': 'Location admin',
-                        'Metafield: brightpearl.contact_id [single_line_text_field]': contact_id,
-                        'Metafield: brightpearl.wholesale [boolean]': contact.get('Wholesale', 'FALSE').upper(),
-                    }
-                else:
-                    row = {
-                        'Name': company_name,
-                        'Command': 'NEW',
-                        'Main Contact: Customer ID': '',
-                        'Location: Name': ship_addr1,
-                        'Location: Command': 'NEW',
-                        'Location: Phone': ship_phone,
-                        'Location: Original Phone': original_phone,
-                        'Location: Locale': 'es',
-                        'Location: Tax ID': company.get('taxNumber', ''),
-                        'Location: Tax Setting': '',
-                        'Location: Tax Exemptions': '',
-                        'Location: Allow Shipping To Any Address': 'TRUE',
-                        'Location: Checkout To Draft': 'FALSE',
-                        'Location: Checkout Payment Terms': '',
-                        'Location: Checkout Pay Now Only': 'FALSE',
-                        'Location: Shipping First Name': ship_first,
-                        'Location: Shipping Last Name': ship_last,
-                        'Location: Shipping Recipient': company_name,
-                        'Location: Shipping Phone': ship_phone,
-                        'Location: Original Shipping Phone': original_phone,
-                        'Location: Shipping Address 1': ship_addr1,
-                        'Location: Shipping Address 2': ship_addr2,
-                        'Location: Shipping Zip': ship_zip,
-                        'Location: Shipping City': ship_city,
-                        'Location: Shipping Province Code': ship_prov,
-                        'Location: Shipping Country Code': ship_country,
-                        'Location: Billing First Name': '',
-                        'Location: Billing Last Name': '',
-                        'Location: Billing Recipient': '',
-                        'Location: Billing Phone': '',
-                        'Location: Original Billing Phone': '',
-                        'Location: Billing Address 1': '',
-                        'Location: Billing Address 2': '',
-                        'Location: Billing Zip': '',
-                        'Location: Billing City': '',
-                        'Location: Billing Province Code': '',
-                        'Location: Billing Country Code': '',
-                        'Location: Catalogs': '',
-                        'Location: Catalogs Command': 'MERGE',
-                        'Customer: Email': contact_email,
-                        'Customer: Command': 'MERGE',
-                        'Customer: Location Role': 'Ordering only',
-                        'Metafield: brightpearl.contact_id [single_line_text_field]': contact_id,
-                        'Metafield: brightpearl.wholesale [boolean]': contact.get('Wholesale', 'FALSE').upper(),
-                    }
+    print(f"[INFO] Collected {len(ship_addr_refs)} shipping and {len(bill_addr_refs)} billing addresses for normalization.")
+    if args.batch_job:
+        with PROFILER.stage('normalization'):
+            normalize_addresses_batch_job([a for _, a in ship_addr_refs + bill_addr_refs], args.batch_backend, args.batch_poll_interval)
 
-                rows.append(row)
+    apply_address_normalization(rows, ship_addr_refs, bill_addr_refs)
 
-                # Add customer record if we haven't seen this email before
-                if contact_email and contact_email not in processed_emails:
-                    processed_emails.add(contact_email)
-                    customers.append({
-                        'Email': contact_email,
-                        'Command': 'MERGE',
-                        'First Name': ship_first,
-                        'Last Name': ship_last,
-                        'State': 'enabled',
-                        'Verified Email': 'TRUE',
-                        'Tax Exempt': contact.get('Wholesale', 'FALSE').upper()
-                    })
-
-    print(f"[INFO] Collected {len(all_ship_addrs)} shipping and {len(all_bill_addrs)} billing addresses for normalization.")
-    # Batch normalize shipping addresses
-    for i in range(0, len(all_ship_addrs), BATCH_SIZE):
-        batch = all_ship_addrs[i:i+BATCH_SIZE]
-        print(f"[LLM] Normalizing shipping addresses {i+1}-{i+len(batch)}...")
-        results = normalize_addresses_llm_batch(batch, 'shipping')
-        for j, (city, prov, _) in enumerate(results):  # Unpack three values, ignore country
-            row_idx, _ = ship_addr_refs[i+j]
-            rows[row_idx]['Location: Shipping City'] = city
-            rows[row_idx]['Location: Shipping Province Code'] = prov
-    
-    # Batch normalize billing addresses
-    for i in range(0, len(all_bill_addrs), BATCH_SIZE):
-        batch = all_bill_addrs[i:i+BATCH_SIZE]
-        print(f"[LLM] Normalizing billing addresses {i+1}-{i+len(batch)}...")
-        results = normalize_addresses_llm_batch(batch, 'billing')
-        for j, (city, prov, _) in enumerate(results):  # Unpack three values, ignore country
-            row_idx, _ = bill_addr_refs[i+j]
-            if bill_addr_refs[i+j][1] is not None:
-                rows[row_idx]['Location: Billing City'] = city
-                rows[row_idx]['Location: Billing Province Code'] = prov
-
-    print(f"[INFO] Writing {len(rows)} rows to {OUTPUT_CSV}")
-    with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+    with PROFILER.stage('csv_write'):
+        all_rows = [row for entry in state.values() for row in entry['rows']]
+        customers = unique_customers(state.values())
+        write_rows(OUTPUT_CSV, all_rows)
+        write_customers(CUSTOMERS_CSV, customers.values())
 
-    print(f"[INFO] Writing {len(customers)} customers to {CUSTOMERS_CSV}")
-    with open(CUSTOMERS_CSV, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=CUSTOMERS_COLUMNS)
-        writer.writeheader()
-        for customer in customers:
-            writer.writerow(customer)
+        if args.delta:
+            delta_rows, delta_customers = build_delta(state, previous)
+            write_rows(COMPANIES_DELTA_CSV, delta_rows)
+            write_customers(CUSTOMERS_DELTA_CSV, delta_customers)
+
+        if args.incremental:
+            save_conversion_state(CONVERSION_STATE_FILE, state, OUTPUT_COLUMNS)
 
+def convert_streaming(args):
+    """
+    Bounded-memory conversion. The inputs are sorted on disk and merge-joined,
+    so only one company's contacts and one chunk of locations are held in
+    memory at a time (plus the normalization cache and the set of customer
+    emails). Output order matches the in-memory mode.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='convert_', dir=CONVERTED_DIR)
+    chunk_size = args.chunk_size
+    try:
+        with PROFILER.stage('load_inputs'):
+            normalized_cache = load_normalized_addresses()
+
+        # contacts ⋈ addresses on contactId, then re-sorted by companyId in original contact order
+        print("[INFO] Sorting contacts and addresses by contactId...")
+        contacts = external_sort(iter_csv(CONTACTS_CSV), lambda c: c.get('contactId', ''), tmp_dir, chunk_size)
+        addresses = external_sort(iter_csv(ADDRESSES_CSV), lambda a: a.get('contactId', ''), tmp_dir, chunk_size)
+
+        def contacts_with_addresses():
+            for _, contact_group, address_group in merge_join(contacts, addresses, lambda r: r.get('contactId', ''), lambda r: r.get('contactId', '')):
+                contact_addresses = [prepare_address(a, normalized_cache) for a in address_group]
+                for contact in contact_group:
+                    contact['_addresses'] = contact_addresses
+                    yield contact
+
+        print("[INFO] Sorting joined contacts by companyId...")
+        joined = external_sort(contacts_with_addresses(), lambda c: (c.get('companyId', ''), c['_seq']), tmp_dir, chunk_size)
+        companies = external_sort(iter_csv(COMPANIES_CSV), lambda c: c.get('companyId', ''), tmp_dir, chunk_size)
+
+        # companies ⋈ contacts on companyId; rows are normalized one chunk at a
+        # time and spilled to disk keyed by the company's position in the input
+        def company_outputs():
+            pending = []
+            pending_rows = 0
+            for _, company_group, contact_group in merge_join(companies, joined, lambda r: r.get('companyId', ''), lambda r: r.get('companyId', '')):
+                with PROFILER.stage('row_building'):
+                    for company in company_group:
+                        rows = []
+                        customers = []
+                        for contact in contact_group:
+                            entries, customer = build_contact_rows(company, contact, contact['_addresses'])
+                            rows.extend(entries)
+                            if customer:
+                                customers.append(customer)
+                        pending.append({'_seq': company['_seq'], 'rows': rows, 'customers': customers})
+                        pending_rows += len(rows)
+                if pending_rows >= chunk_size:
+                    yield from normalize_company_chunk(pending, args)
+                    pending = []
+                    pending_rows = 0
+            if pending:
+                yield from normalize_company_chunk(pending, args)
+
+        ordered = external_sort(company_outputs(), lambda o: o['_seq'], tmp_dir, chunk_size)
+
+        row_count = 0
+        processed_emails = set()  # To track unique customers
+        customer_count = 0
+        print(f"[INFO] Streaming rows to {OUTPUT_CSV} and customers to {CUSTOMERS_CSV}")
+        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as out_f, \
+                open(CUSTOMERS_CSV, 'w', newline='', encoding='utf-8') as cust_f:
+            row_writer = csv.writer(out_f)
+            row_writer.writerow(OUTPUT_COLUMNS)
+            customer_writer = csv.DictWriter(cust_f, fieldnames=CUSTOMERS_COLUMNS)
+            customer_writer.writeheader()
+            # Everything upstream is lazy: pulling the next output reads, sorts and joins the inputs
+            for output in PROFILER.iterate('load_inputs', ordered):
+                with PROFILER.stage('csv_write'):
+                    row_writer.writerows(output['rows'])
+                    row_count += len(output['rows'])
+                    # Add customer record if we haven't seen this email before
+                    for customer in output['customers']:
+                        if customer['Email'] not in processed_emails:
+                            processed_emails.add(customer['Email'])
+                            customer_writer.writerow(customer)
+                            customer_count += 1
+        print(f"[INFO] Wrote {row_count} rows and {customer_count} customers")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def normalize_company_chunk(pending, args):
+    """Normalize the addresses of a chunk of company outputs and return them ready to spill"""
+    rows = []
+    ship_addr_refs = []
+    bill_addr_refs = []
+    for output in pending:
+        for row, ship_addr, billing_addr in output['rows']:
+            ship_addr_refs.append((len(rows), ship_addr))
+            if billing_addr:
+                bill_addr_refs.append((len(rows), billing_addr))
+            rows.append(row)
+    print(f"[INFO] Normalizing a chunk of {len(rows)} locations...")
+    if args.batch_job:
+        with PROFILER.stage('normalization'):
+            normalize_addresses_batch_job([a for _, a in ship_addr_refs + bill_addr_refs], args.batch_backend, args.batch_poll_interval)
+    apply_address_normalization(rows, ship_addr_refs, bill_addr_refs)
+    for output in pending:
+        output['rows'] = [row for row, _, _ in output['rows']]
+    return pending
+
+def count_llm_batches(addresses, cached_ids):
+    """
+    (addresses sent, LLM requests) for normalize_address_list(addresses) when
+    cached_ids are in the cache. The IDs sent are added to cached_ids, as the
+    run saves them to the cache after each batch.
+    """
+    sent = requests = 0
+    for i in range(0, len(addresses), BATCH_SIZE):
+        misses = [
+            a for a in addresses[i:i+BATCH_SIZE]
+            if not (a.get('addressId', '') and a.get('addressId', '') in cached_ids) and not normalize_address_local(a)
+        ]
+        if misses:
+            sent += len(misses)
+            requests += 1
+            cached_ids.update(a['addressId'] for a in misses if a.get('addressId'))
+    return sent, requests
+
+def plan_conversion(args):
+    """--plan: count what normalization will send to the LLM, building the rows but writing nothing"""
+    companies = read_csv(COMPANIES_CSV)
+    contacts = read_csv(CONTACTS_CSV)
+    addresses = read_csv(ADDRESSES_CSV)
+    normalized_cache = load_normalized_addresses()
+    previous = load_conversion_state(CONVERSION_STATE_FILE, OUTPUT_COLUMNS) if args.incremental else {}
+    state, work = collect_company_work(companies, contacts, addresses, normalized_cache, previous, args.incremental)
+    rows, ship_addr_refs, bill_addr_refs = build_company_rows(work, state)
+    ship_addrs = [a for _, a in ship_addr_refs]
+    bill_addrs = [a for _, a in bill_addr_refs]
+    to_normalize = ship_addrs + bill_addrs
+    cached_ids = set(normalized_cache)
+
+    cache_hits = sum(1 for a in to_normalize if a.get('addressId', '') in cached_ids)
+    local = sum(1 for a in to_normalize if a.get('addressId', '') not in cached_ids and normalize_address_local(a))
+    batch_job_requests = 0
+    if args.batch_job:
+        # Unique cache misses go to the offline job first, as in normalize_addresses_batch_job
+        misses = {a['addressId'] for a in to_normalize
+                  if a.get('addressId') and a['addressId'] not in cached_ids and not normalize_address_local(a)}
+        batch_job_requests = -(-len(misses) // BATCH_SIZE)
+        cached_ids.update(misses)
+    ship_sent, ship_requests = count_llm_batches(ship_addrs, cached_ids)
+    bill_sent, bill_requests = count_llm_batches(bill_addrs, cached_ids)
+    requests = ship_requests + bill_requests
+
+    plan = {
+        'companies': len(companies), 'contacts': len(contacts), 'addresses': len(addresses),
+        'companies_to_rebuild': len(work), 'rows': len(rows),
+        'addresses_to_normalize': len(to_normalize), 'cache_hits': cache_hits, 'resolved_locally': local,
+        'llm_addresses': ship_sent + bill_sent, 'llm_requests': requests, 'batch_job_requests': batch_job_requests,
+        'cached_during_run': len(to_normalize) - cache_hits - local - ship_sent - bill_sent,
+        'openai_api_key': bool(openai_api_key()),
+    }
+    # Latency and tokens per request as measured in the last run, if it made any
+    if os.path.exists(NORMALIZATION_REPORT):
+        with open(NORMALIZATION_REPORT, encoding='utf-8') as f:
+            last = json.load(f)
+        batch = last['llm_requests']['batch']
+        measured = batch['count'] + last['llm_requests']['single']['count']
+        if batch['count']:
+            plan['estimated_llm_seconds'] = round(requests * batch['mean'], 1)
+        if measured:
+            plan['estimated_tokens'] = round(requests * last['tokens']['total'] / measured)
+
+    directory = os.path.dirname(PLAN_REPORT)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(PLAN_REPORT, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2)
+        f.write('\n')
+
+    print(f"[PLAN] {len(companies)} companies ({len(work)} to rebuild), {len(contacts)} contacts, {len(rows)} location rows")
+    print(f"[PLAN] {len(to_normalize)} addresses to normalize: {cache_hits} in the cache, {local} resolved locally, "
+          f"{plan['llm_addresses']} sent to the LLM in {requests} requests of up to {BATCH_SIZE}, "
+          f"{plan['cached_during_run']} found in the cache after an earlier batch")
+    if args.batch_job:
+        print(f"[PLAN] The batch job normalizes the misses first, in {batch_job_requests} offline requests")
+    if requests and 'estimated_llm_seconds' in plan:
+        print(f"[PLAN] About {plan['estimated_llm_seconds']:.0f}s of LLM requests and {plan.get('estimated_tokens', 0)} tokens, "
+              f"at the last run's rates ({NORMALIZATION_REPORT})")
+    if not plan['openai_api_key']:
+        print("[PLAN] OPENAI_API_KEY is not set: those addresses would keep their exported values")
+    print(f"[PLAN] Plan: {PLAN_REPORT}")
+    return plan
+
+def convert(args):
+    """Run the conversion (or its --plan) for parsed arguments"""
+    global VERBOSITY
+    VERBOSITY = args.verbose
+    if args.plan:
+        plan_conversion(args)
+        return
+    if args.profile or args.profile_stage:
+        PROFILER.start(args.profile_stage)
+    print("[INFO] Starting conversion...")
+    os.makedirs(CONVERTED_DIR, exist_ok=True)
+    run_only_normalizations.clear()
+    if args.streaming:
+        convert_streaming(args)
+    elif args.engine == 'columnar':
+        from convert_columnar import convert_columnar
+        convert_columnar(args)
+    else:
+        convert_in_memory(args)
+    TELEMETRY.write_report(NORMALIZATION_REPORT)
     print("[SUCCESS] Conversion complete!")
+    if PROFILER.enabled:
+        PROFILER.report(PROFILE_REPORT)
+
+def main():
+    convert(parse_args())
 
 if __name__ == '__main__':
     main()
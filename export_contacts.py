@@ -1,40 +1,42 @@
 # -*- coding: utf-8 -*-
 
+import argparse
+import json
 import os
-import requests
 import csv
-from dotenv import load_dotenv
 import sys
 import time
 from typing import List, Dict, Any, Optional
 
+from brightpearl_export import (PROFILER, DeadLetters, ProgressReporter, RequestPlan, account_textfile, add_account_arguments,
+                                add_distributed_arguments, add_plan_arguments, add_profile_arguments, add_retry_arguments,
+                                config_or_exit, coordinate, current_profile, dead_letters_path, export_path, get_client,
+                                merge_shards, patch_csv, retry_pass, retryable, run_accounts, run_worker, search_pages,
+                                write_run_report)
+from brightpearl_export.dead_letters import SHARD_DEAD_LETTERS
+
 # Set default encoding to UTF-8 for Python 2 compatibility
 # reload(sys)
 # sys.setdefaultencoding('utf8')
 
-load_dotenv()
-
-BRIGHTPEARL_ACCOUNT = os.getenv('BRIGHTPEARL_ACCOUNT')
-BRIGHTPEARL_API_TOKEN = os.getenv('BRIGHTPEARL_API_TOKEN')
-BRIGHTPEARL_API_DOMAIN = os.getenv('BRIGHTPEARL_API_DOMAIN')
-BRIGHTPEARL_APP_REF = os.getenv('BRIGHTPEARL_APP_REF')
-
-if not all([BRIGHTPEARL_ACCOUNT, BRIGHTPEARL_API_TOKEN, BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_APP_REF]):
-    print('Missing one or more required environment variables.')
-    exit(1)
-
-BASE_URL = 'https://{}/public-api/{}'.format(BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_ACCOUNT)
-HEADERS = {
-    'brightpearl-account-token': BRIGHTPEARL_API_TOKEN,
-    'brightpearl-app-ref': BRIGHTPEARL_APP_REF,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'
-}
+# File names in exports/, or in exports/<profile>/ for --accounts (see export_path)
+RUN_REPORT = 'export_contacts_report.json'
+RETRY_REPORT = 'export_contacts_retry_report.json'
+PROFILE_REPORT = 'export_contacts_profile'
+PROFILE_STAGES = ['id_discovery', 'detail_fetch', 'address_fetch', 'csv_write']
+PLAN_REPORT = 'export_contacts_plan.json'
+ADDITIONAL_CONTACTS_FILE = 'additional_contacts.csv'
+ACCOUNTS_REPORT = os.path.join('exports', 'export_contacts_accounts_report.json')
+ACCOUNTS_PLAN = os.path.join('exports', 'export_contacts_accounts_plan.json')
+ACCOUNTS_RETRY_REPORT = os.path.join('exports', 'export_contacts_accounts_retry_report.json')
 
-# Constants for rate limiting
-REQUEST_DELAY = 0.5  # Half second delay between requests
-MAX_RETRIES = 3
-RETRY_DELAY = 2  # Seconds to wait between retries
+# Requests made per contact by iter_contact_records: get_contact_details and
+# get_company_details each fetch the contact (detail_fetch), and
+# get_contact_addresses fetches it again plus each of its unique postal
+# addresses, at most one each for DEF, BIL and DEL (address_fetch)
+DETAIL_REQUESTS_PER_CONTACT = 2
+MAX_POSTAL_ADDRESSES_PER_CONTACT = 3
+POSTAL_ADDRESS_ENDPOINT = 'contact-service/postal-address/{id}'
 
 # Let's use simple text indicators instead of emojis for better compatibility
 INDICATORS = {
@@ -45,49 +47,11 @@ INDICATORS = {
     'progress': '[PROGRESS]'
 }
 
-def make_request(url, headers, params=None):
-    """
-    Make a rate-limited request with retries, including exponential backoff for 429 and 503 errors
-    """
-    max_retries = 5
-    delay = REQUEST_DELAY
-    for attempt in range(max_retries):
-        try:
-            time.sleep(delay)
-            resp = requests.get(url, headers=headers, params=params)
-            resp.raise_for_status()
-            return resp
-        except requests.exceptions.HTTPError as e:
-            status = e.response.status_code
-            if status in (429, 503):
-                if attempt < max_retries - 1:
-                    print("{} {} error on {} (attempt {}/{}), waiting {} seconds...".format(
-                        INDICATORS['warning'], status, url, attempt + 1, max_retries, delay * 2
-                    ))
-                    time.sleep(delay * 2)
-                    delay *= 2
-                    continue
-            print("{} HTTP error on {}: {}".format(
-                INDICATORS['error'],
-                url,
-                str(e)
-            ))
-            return None
-        except Exception as e:
-            print("{} Request error on {}: {}".format(
-                INDICATORS['error'],
-                url,
-                str(e)
-            ))
-            return None
-    print("{} Max retries exceeded for {}".format(INDICATORS['error'], url))
-    return None
-
 # --- API Functions ---
 def get_tag_id(tag_name):
-    url = "{}/contact-service/tag".format(BASE_URL)
+    url = get_client().url('contact-service/tag')
     try:
-        resp = make_request(url, HEADERS)
+        resp = get_client().get(url)
         if not resp:
             return None
         data = resp.json()
@@ -110,7 +74,7 @@ def get_contacts_with_tag(tag_name):
     if not tag_id:
         return []
         
-    url = "{}/contact-service/contact-search".format(BASE_URL)
+    url = get_client().url('contact-service/contact-search')
     all_contact_ids = []
     first_result = 1
     page_size = 200  # Maximum allowed by Brightpearl
@@ -123,7 +87,7 @@ def get_contacts_with_tag(tag_name):
         }
         
         try:
-            resp = make_request(url, HEADERS, params)
+            resp = get_client().get(url, params)
             if not resp:
                 break
                 
@@ -155,281 +119,242 @@ def get_contacts_with_tag(tag_name):
     print("{} Found {} total contacts with tag '{}'".format(INDICATORS['success'], total, tag_name))
     return all_contact_ids
 
+# The helpers below return None (or skip the address) when a request fails.
+# get_response() has then recorded the failure for iter_contact_records;
+# any other exception is left to iter_contact_records to record.
+
 def get_contact_details(contact_id):
-    url = "{}/contact-service/contact/{}".format(BASE_URL, contact_id)
+    url = get_client().url('contact-service/contact/{}'.format(contact_id))
     params = {"includeOptional": "customFields"}
-    try:
-        resp = make_request(url, HEADERS, params=params)
-        if not resp:
-            return None
-        data = resp.json()
-        contact = data.get('response', [])[0] if data.get('response') else None
-        if not contact:
-            print("No data found for contact ID: {}".format(contact_id))
-            return None
-        # Extract custom fields
-        custom_fields = contact.get('customFields', {})
-        wholesale = custom_fields.get('PCF_CUSTWHOL', None)
-        joor_account_code = custom_fields.get('PCF_JOORACCO', None)
-        # Add to contact dict for export
-        contact['Wholesale'] = wholesale
-        contact['Joor Account Code'] = joor_account_code
-        return contact
-    except Exception as e:
-        print("Error fetching contact {} details:".format(contact_id), e)
+    records = get_client().get_response(url, params=params)
+    if not records:
         return None
+    contact = records[0]
+    # Extract custom fields
+    custom_fields = contact.get('customFields', {})
+    wholesale = custom_fields.get('PCF_CUSTWHOL', None)
+    joor_account_code = custom_fields.get('PCF_JOORACCO', None)
+    # Add to contact dict for export
+    contact['Wholesale'] = wholesale
+    contact['Joor Account Code'] = joor_account_code
+    return contact
 
 def get_contact_addresses(contact_id):
-    try:
-        # Get full contact details using direct contact endpoint
-        contact_url = "{}/contact-service/contact/{}".format(BASE_URL, contact_id)
-        resp = make_request(contact_url, HEADERS)
-        if not resp:
-            return []
-            
-        contact_data = resp.json()
-        contact = contact_data.get('response', [])[0] if contact_data.get('response') else None
-        if not contact:
-            return []
-        
-        # Get postal address IDs from the postAddressIds dictionary
-        post_address_ids = contact.get('postAddressIds', {})
-        if not post_address_ids:
-            return []
-            
-        # Create a mapping of address IDs to their types
-        address_types = {}
-        for addr_type, addr_id in post_address_ids.items():
-            if addr_id not in address_types:
-                address_types[addr_id] = []
-            address_types[addr_id].append(addr_type)
-            
-        # Fetch each unique address once
-        addresses = []
-        for addr_id in address_types.keys():
-            resp = make_request(
-                "{}/contact-service/postal-address/{}".format(BASE_URL, addr_id),
-                HEADERS
-            )
-            if not resp:
-                continue
-                
-            addr_data = resp.json().get('response', [])
-            if addr_data:
-                addr = addr_data[0]
-                # Add contact ID to the address
-                addr['contactId'] = contact_id
-                # Add all types this address is used for
-                types = address_types[addr_id]
-                # Sort types in consistent order: BIL, DEL, DEF
-                type_order = {'BIL': 0, 'DEL': 1, 'DEF': 2}
-                types.sort(key=lambda x: type_order.get(x, 99))
-                addr['addressType'] = '/'.join(types)
-                addresses.append(addr)
-        
-        return addresses
-    except Exception as e:
-        print("{} Error fetching addresses for contact {}: {}".format(INDICATORS['error'], contact_id, str(e)))
+    # Get full contact details using direct contact endpoint
+    contact_url = get_client().url('contact-service/contact/{}'.format(contact_id))
+    records = get_client().get_response(contact_url)
+    if not records:
         return []
+    contact = records[0]
 
-def get_company_details(contact_id):
-    try:
-        # Get full contact details using direct contact endpoint
-        contact_url = "{}/contact-service/contact/{}".format(BASE_URL, contact_id)
-        resp = make_request(contact_url, HEADERS)
-        if not resp:
-            return None
-        
-        contact_data = resp.json()
-        contact = contact_data.get('response', [])[0] if contact_data.get('response') else None
-        if not contact:
-            return None
+    # Get postal address IDs from the postAddressIds dictionary
+    post_address_ids = contact.get('postAddressIds', {})
+    if not post_address_ids:
+        return []
 
-        # Extract organization details
-        org = contact.get('organisation', {})
-        
-        # Get communication details
-        communication = contact.get('communication', {})
-        emails = communication.get('emails', {})
-        telephones = communication.get('telephones', {})
-        websites = communication.get('websites', {})
-
-        # Get primary email if it exists
-        primary_email = emails.get('PRI', {})
-        if isinstance(primary_email, dict):
-            email = primary_email.get('email', '')
-        else:
-            email = ''
+    # Create a mapping of address IDs to their types
+    address_types = {}
+    for addr_type, addr_id in post_address_ids.items():
+        if addr_id not in address_types:
+            address_types[addr_id] = []
+        address_types[addr_id].append(addr_type)
 
-        # Get primary phone or mobile
-        phone = telephones.get('PRI', '') or telephones.get('MOB', '')
+    # Fetch each unique address once
+    addresses = []
+    for addr_id in address_types.keys():
+        addr_data = get_client().get_response(get_client().url('contact-service/postal-address/{}'.format(addr_id)))
+        if not addr_data:
+            continue
+        addr = addr_data[0]
+        # Add contact ID to the address
+        addr['contactId'] = contact_id
+        # Add all types this address is used for
+        types = address_types[addr_id]
+        # Sort types in consistent order: BIL, DEL, DEF
+        type_order = {'BIL': 0, 'DEL': 1, 'DEF': 2}
+        types.sort(key=lambda x: type_order.get(x, 99))
+        addr['addressType'] = '/'.join(types)
+        addresses.append(addr)
 
-        # Get primary website
-        primary_website = websites.get('PRI', {})
-        if isinstance(primary_website, dict):
-            website = primary_website.get('url', '')
-        else:
-            website = ''
-
-        # Extract financial details
-        financial = contact.get('financialDetails', {})
-        priceListId = financial.get('priceListId', '')
-        nominalCode = financial.get('nominalCode', '')
-        taxCodeId = financial.get('taxCodeId', '')
-        creditTermDays = financial.get('creditTermDays', '')
-        currencyId = financial.get('currencyId', '')
-        discountPercentage = financial.get('discountPercentage', '')
-        creditTermTypeId = financial.get('creditTermTypeId', '')
-        taxNumber = financial.get('taxNumber', '')
-
-        # If no organization or organizationId is 0, use contact name as company name
-        if not org or org.get('organisationId', 0) == 0:
-            name = u'{} {}'.format(
-                contact.get('firstName', '') or '',
-                contact.get('lastName', '') or ''
-            ).strip()
-            company = {
-                'companyId': contact.get('contactId', ''),  # Use contact ID as company ID
-                'companyName': name,
-                'email': email,
-                'phone': phone,
-                'website': website,
-                'isPrimaryContact': contact.get('isPrimaryContact', ''),
-                'priceListId': priceListId,
-                'nominalCode': nominalCode,
-                'taxCodeId': taxCodeId,
-                'creditTermDays': creditTermDays,
-                'currencyId': currencyId,
-                'discountPercentage': discountPercentage,
-                'creditTermTypeId': creditTermTypeId,
-                'taxNumber': taxNumber
-            }
-        else:
-            company = {
-                'companyId': org.get('organisationId', ''),
-                'companyName': org.get('name', ''),
-                'email': email,
-                'phone': phone,
-                'website': website,
-                'isPrimaryContact': contact.get('isPrimaryContact', ''),
-                'priceListId': priceListId,
-                'nominalCode': nominalCode,
-                'taxCodeId': taxCodeId,
-                'creditTermDays': creditTermDays,
-                'currencyId': currencyId,
-                'discountPercentage': discountPercentage,
-                'creditTermTypeId': creditTermTypeId,
-                'taxNumber': taxNumber
-            }
-        return company
-    except Exception as e:
-        print("{} Error fetching company details for contact {}: {}".format(INDICATORS['error'], contact_id, str(e)))
+    return addresses
+
+def get_company_details(contact_id):
+    # Get full contact details using direct contact endpoint
+    contact_url = get_client().url('contact-service/contact/{}'.format(contact_id))
+    records = get_client().get_response(contact_url)
+    if not records:
         return None
+    contact = records[0]
+
+    # Extract organization details
+    org = contact.get('organisation', {})
+    
+    # Get communication details
+    communication = contact.get('communication', {})
+    emails = communication.get('emails', {})
+    telephones = communication.get('telephones', {})
+    websites = communication.get('websites', {})
+
+    # Get primary email if it exists
+    primary_email = emails.get('PRI', {})
+    if isinstance(primary_email, dict):
+        email = primary_email.get('email', '')
+    else:
+        email = ''
+
+    # Get primary phone or mobile
+    phone = telephones.get('PRI', '') or telephones.get('MOB', '')
+
+    # Get primary website
+    primary_website = websites.get('PRI', {})
+    if isinstance(primary_website, dict):
+        website = primary_website.get('url', '')
+    else:
+        website = ''
+
+    # Extract financial details
+    financial = contact.get('financialDetails', {})
+    priceListId = financial.get('priceListId', '')
+    nominalCode = financial.get('nominalCode', '')
+    taxCodeId = financial.get('taxCodeId', '')
+    creditTermDays = financial.get('creditTermDays', '')
+    currencyId = financial.get('currencyId', '')
+    discountPercentage = financial.get('discountPercentage', '')
+    creditTermTypeId = financial.get('creditTermTypeId', '')
+    taxNumber = financial.get('taxNumber', '')
+
+    # If no organization or organizationId is 0, use contact name as company name
+    if not org or org.get('organisationId', 0) == 0:
+        name = u'{} {}'.format(
+            contact.get('firstName', '') or '',
+            contact.get('lastName', '') or ''
+        ).strip()
+        company = {
+            'companyId': contact.get('contactId', ''),  # Use contact ID as company ID
+            'companyName': name,
+            'email': email,
+            'phone': phone,
+            'website': website,
+            'isPrimaryContact': contact.get('isPrimaryContact', ''),
+            'priceListId': priceListId,
+            'nominalCode': nominalCode,
+            'taxCodeId': taxCodeId,
+            'creditTermDays': creditTermDays,
+            'currencyId': currencyId,
+            'discountPercentage': discountPercentage,
+            'creditTermTypeId': creditTermTypeId,
+            'taxNumber': taxNumber
+        }
+    else:
+        company = {
+            'companyId': org.get('organisationId', ''),
+            'companyName': org.get('name', ''),
+            'email': email,
+            'phone': phone,
+            'website': website,
+            'isPrimaryContact': contact.get('isPrimaryContact', ''),
+            'priceListId': priceListId,
+            'nominalCode': nominalCode,
+            'taxCodeId': taxCodeId,
+            'creditTermDays': creditTermDays,
+            'currencyId': currencyId,
+            'discountPercentage': discountPercentage,
+            'creditTermTypeId': creditTermTypeId,
+            'taxNumber': taxNumber
+        }
+    return company
 
 # --- CSV Writers ---
-def write_contacts_csv(contacts):
-    if not os.path.exists('exports'):
-        os.makedirs('exports')
-    with open('exports/contacts.csv', 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'contactId', 'name', 'email', 'phone', 'tagList', 'companyId', 'Wholesale', 'Joor Account Code'
-        ])
+CONTACTS_FIELDNAMES = ['contactId', 'name', 'email', 'phone', 'tagList', 'companyId', 'Wholesale', 'Joor Account Code']
+ADDRESSES_FIELDNAMES = [
+    'contactId', 'addressId', 'isBilling', 'isDelivery', 'isDefault',
+    'addressLine1', 'addressLine2', 'addressLine3', 'addressLine4',
+    'city', 'postcode', 'country'
+]
+COMPANIES_FIELDNAMES = [
+    'companyId', 'companyName', 'email', 'phone', 'website',
+    'isPrimaryContact', 'priceListId', 'nominalCode', 'taxCodeId', 'creditTermDays', 'currencyId', 'discountPercentage', 'creditTermTypeId', 'taxNumber'
+]
+
+def csv_value(value):
+    """Stringify a value the way it reads back from the export CSVs"""
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+def contact_csv_row(c):
+    """Contact record as written to contacts.csv"""
+    return {key: csv_value(c.get(key)) for key in CONTACTS_FIELDNAMES}
+
+def address_csv_row(a):
+    """Brightpearl postal address (with contactId and addressType) as written to addresses.csv"""
+    # Get the address types from the combined string (e.g., "BIL/DEL")
+    types = a.get('addressType', '').split('/')
+
+    # Map the Brightpearl fields to our CSV fields
+    row = {
+        'contactId': a.get('contactId', ''),
+        'addressId': a.get('addressId', ''),
+        'isBilling': 'TRUE' if 'BIL' in types else 'FALSE',
+        'isDelivery': 'TRUE' if 'DEL' in types else 'FALSE',
+        'isDefault': 'TRUE' if 'DEF' in types else 'FALSE',
+        'addressLine1': a.get('addressLine1', ''),
+        'addressLine2': a.get('addressLine2', ''),
+        'addressLine3': a.get('addressLine3', ''),
+        'addressLine4': a.get('addressLine4', ''),
+        'city': a.get('addressLine3', ''),  # City is usually in addressLine3
+        'postcode': a.get('postalCode', ''),
+        'country': a.get('countryIsoCode', '')
+    }
+
+    # Ensure all values are encoded as UTF-8 strings
+    return {key: csv_value(value) for key, value in row.items()}
+
+def company_csv_row(c):
+    """Company record as written to companies.csv"""
+    return {key: csv_value(c.get(key)) for key in COMPANIES_FIELDNAMES}
+
+def write_contacts_csv(contacts, path=None):
+    path = path or export_path('contacts.csv')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CONTACTS_FIELDNAMES)
         writer.writeheader()
         for c in contacts:
-            # Ensure all values are encoded as UTF-8 strings
-            row = {}
-            for key, value in c.items():
-                if isinstance(value, str):
-                    row[key] = value
-                elif value is None:
-                    row[key] = ''
-                else:
-                    row[key] = str(value)
-            # Ensure both new columns are present
-            row['Wholesale'] = c.get('Wholesale', '')
-            row['Joor Account Code'] = c.get('Joor Account Code', '')
-            writer.writerow(row)
-
-def write_addresses_csv(addresses):
-    if not os.path.exists('exports'):
-        os.makedirs('exports')
-    
-    with open('exports/addresses.csv', 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'contactId', 'addressId', 'isBilling', 'isDelivery', 'isDefault',
-            'addressLine1', 'addressLine2', 'addressLine3', 'addressLine4',
-            'city', 'postcode', 'country'
-        ])
+            writer.writerow(contact_csv_row(c))
+
+def write_addresses_csv(addresses, path=None):
+    path = path or export_path('addresses.csv')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ADDRESSES_FIELDNAMES)
         writer.writeheader()
         for a in addresses:
-            # Get the address types from the combined string (e.g., "BIL/DEL")
-            types = a.get('addressType', '').split('/')
-            
-            # Map the Brightpearl fields to our CSV fields
-            row = {
-                'contactId': a.get('contactId', ''),
-                'addressId': a.get('addressId', ''),
-                'isBilling': 'TRUE' if 'BIL' in types else 'FALSE',
-                'isDelivery': 'TRUE' if 'DEL' in types else 'FALSE',
-                'isDefault': 'TRUE' if 'DEF' in types else 'FALSE',
-                'addressLine1': a.get('addressLine1', ''),
-                'addressLine2': a.get('addressLine2', ''),
-                'addressLine3': a.get('addressLine3', ''),
-                'addressLine4': a.get('addressLine4', ''),
-                'city': a.get('addressLine3', ''),  # City is usually in addressLine3
-                'postcode': a.get('postalCode', ''),
-                'country': a.get('countryIsoCode', '')
-            }
-            
-            # Ensure all values are encoded as UTF-8 strings
-            encoded_row = {}
-            for key, value in row.items():
-                if value is None:
-                    encoded_row[key] = ''
-                else:
-                    encoded_row[key] = str(value)
-            writer.writerow(encoded_row)
-
-def write_companies_csv(companies):
-    if not os.path.exists('exports'):
-        os.makedirs('exports')
-    
-    with open('exports/companies.csv', 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'companyId', 'companyName', 'email', 'phone', 'website',
-            'isPrimaryContact', 'priceListId', 'nominalCode', 'taxCodeId', 'creditTermDays', 'currencyId', 'discountPercentage', 'creditTermTypeId', 'taxNumber'
-        ])
+            writer.writerow(address_csv_row(a))
+
+def write_companies_csv(companies, path=None):
+    path = path or export_path('companies.csv')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=COMPANIES_FIELDNAMES)
         writer.writeheader()
         for c in companies:
-            row = {}
-            for key, value in c.items():
-                if value is None:
-                    row[key] = ''
-                else:
-                    row[key] = str(value)
-            # Ensure all new columns are present
-            row['isPrimaryContact'] = c.get('isPrimaryContact', '')
-            row['priceListId'] = c.get('priceListId', '')
-            row['nominalCode'] = c.get('nominalCode', '')
-            row['taxCodeId'] = c.get('taxCodeId', '')
-            row['creditTermDays'] = c.get('creditTermDays', '')
-            row['currencyId'] = c.get('currencyId', '')
-            row['discountPercentage'] = c.get('discountPercentage', '')
-            row['creditTermTypeId'] = c.get('creditTermTypeId', '')
-            writer.writerow(row)
+            writer.writerow(company_csv_row(c))
 
 # --- Main Logic ---
-def main():
+def iter_export_records(company_ids_seen, dead_letters=None):
+    """
+    Yield ('contact' | 'company' | 'address', record) for every exported
+    contact as it is fetched: the B2B tagged contacts first, then the IDs in
+    additional_contacts.csv (in exports/, or exports/<profile>/ for --accounts).
+    Contacts that cannot be fetched go to dead_letters (see iter_contact_records).
+    """
     # For testing - set to 0 for unlimited contacts
     TEST_LIMIT = 0
-    
-    contacts_csv = []
-    addresses_csv = []
-    companies_csv = []
-    company_ids_seen = set()
-    
+
     print("\n{} Starting B2B contacts export...".format(INDICATORS['info']))
-    contact_ids = get_contacts_with_tag('B2B')
+    with PROFILER.stage('id_discovery'):
+        contact_ids = get_contacts_with_tag('B2B')
     if TEST_LIMIT:
         original_count = len(contact_ids)
         contact_ids = contact_ids[:TEST_LIMIT]
@@ -442,92 +367,320 @@ def main():
         print("\n{} Processing all {} B2B contacts\n".format(INDICATORS['info'], len(contact_ids)))
     
     # Process B2B contacts
-    process_contacts(contact_ids, contacts_csv, addresses_csv, companies_csv, company_ids_seen)
+    yield from iter_contact_records(contact_ids, company_ids_seen, dead_letters)
     
     # Process additional contacts from file
-    additional_contacts_file = './exports/additional_contacts.csv'
-    if os.path.exists(additional_contacts_file):
+    if os.path.exists(export_path(ADDITIONAL_CONTACTS_FILE)):
         print("\n{} Starting additional contacts export...".format(INDICATORS['info']))
-        with open(additional_contacts_file, 'r') as f:
-            additional_contact_ids = [line.strip() for line in f if line.strip()]
+        with PROFILER.stage('id_discovery'):
+            additional_contact_ids = read_additional_contact_ids()
         print("{} Found {} additional contacts to process\n".format(INDICATORS['info'], len(additional_contact_ids)))
-        process_contacts(additional_contact_ids, contacts_csv, addresses_csv, companies_csv, company_ids_seen)
+        yield from iter_contact_records(additional_contact_ids, company_ids_seen, dead_letters)
+
+def read_additional_contact_ids():
+    """The contact IDs listed in additional_contacts.csv, or [] without one"""
+    if not os.path.exists(export_path(ADDITIONAL_CONTACTS_FILE)):
+        return []
+    with open(export_path(ADDITIONAL_CONTACTS_FILE), 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export B2B contacts from Brightpearl into CSV files.')
+    parser.add_argument('--prometheus-textfile', metavar='PATH',
+                        help='Also write the request metrics in Prometheus text format (for the node_exporter textfile collector)')
+    add_profile_arguments(parser, PROFILE_STAGES)
+    add_plan_arguments(parser)
+    add_account_arguments(parser)
+    add_distributed_arguments(parser)
+    add_retry_arguments(parser)
+    args = parser.parse_args()
+    if args.accounts and (args.profile or args.profile_stage):
+        parser.error('--profile and --profile-stage time a single export and cannot be used with --accounts')
+    if args.distributed and (args.accounts or args.plan or args.profile or args.profile_stage):
+        parser.error('--distributed cannot be combined with --accounts, --plan or --profile')
+    if args.retry_failed and (args.distributed or args.plan or args.profile or args.profile_stage):
+        parser.error('--retry-failed cannot be combined with --distributed, --plan or --profile')
+    return args
+
+def postal_addresses_per_contact():
+    """Postal address requests per contact in the last run, from its run report, or None without one"""
+    if not os.path.exists(export_path(RUN_REPORT)):
+        return None
+    with open(export_path(RUN_REPORT), encoding='utf-8') as f:
+        report = json.load(f)
+    contacts = report.get('contacts')
+    endpoint = report.get('http', {}).get('endpoints', {}).get(POSTAL_ADDRESS_ENDPOINT)
+    if not contacts or not endpoint:
+        return None
+    return endpoint['statuses'].get('200', 0) / contacts
+
+def plan_export(args):
+    """--plan: count the requests of a full run from the tag lookup and the contact search total"""
+    plan = RequestPlan('export_contacts', get_client(), args.requests_per_minute)
+    tag_id = get_tag_id('B2B')
+    total = plan.search_total('contact-service/contact-search', {'tagIds': tag_id}) if tag_id else None
+    if total is None:
+        print("{} Could not read the B2B contact search total".format(INDICATORS['error']))
+        sys.exit(1)
+    additional = len(read_additional_contact_ids())
+    contacts = total + additional
+    print("{} {} B2B contacts and {} additional contacts".format(INDICATORS['info'], total, additional))
+
+    plan.add('id_discovery', 'tag lookup and contact-search pages', 1 + search_pages(total))
+    plan.add('detail_fetch', 'contact requests, {} per contact (details and company)'.format(DETAIL_REQUESTS_PER_CONTACT),
+             DETAIL_REQUESTS_PER_CONTACT * contacts)
+    plan.add('address_fetch', 'contact requests for the postal address IDs, one per contact', contacts)
+    per_contact = postal_addresses_per_contact()
+    if per_contact is None:
+        per_contact = 1.0
+        plan.note('no previous run report, so one postal address per contact is assumed')
+    else:
+        plan.note('postal addresses per contact taken from the last run ({})'.format(export_path(RUN_REPORT)))
+    plan.add('address_fetch', 'postal address requests, about {:.2f} per contact (0-{})'.format(per_contact, MAX_POSTAL_ADDRESSES_PER_CONTACT),
+             round(per_contact * contacts))
+    return plan.report(export_path(PLAN_REPORT), contacts=total, additional_contacts=additional,
+                       postal_addresses_per_contact=round(per_contact, 3),
+                       max_requests=1 + search_pages(total) + (DETAIL_REQUESTS_PER_CONTACT + 1 + MAX_POSTAL_ADDRESSES_PER_CONTACT) * contacts)
+
+def export(args):
+    """Export the contacts of one account (the configured one, or the profile of this --accounts thread); returns the run report"""
+    started = time.time()
+    contacts_csv = []
+    addresses_csv = []
+    companies_csv = []
+    company_ids_seen = set()
+    dead_letters = DeadLetters('contact')
+    
+    records = {'contact': contacts_csv, 'company': companies_csv, 'address': addresses_csv}
+    for kind, record in iter_export_records(company_ids_seen, dead_letters):
+        records[kind].append(record)
+    failed = len(dead_letters)
+    if dead_letters:
+        retried, recovered = retry_pass(dead_letters, lambda ids, still_failing: list(iter_contact_records(ids, company_ids_seen, still_failing)))
+        for kind, record in retried:
+            records[kind].append(record)
     
     # Print a newline after progress is complete
     print("\n")
     print("{} Writing export files:".format(INDICATORS['info']))
-    print("- contacts.csv: {} records".format(len(contacts_csv)))
-    write_contacts_csv(contacts_csv)
-    print("- addresses.csv: {} records".format(len(addresses_csv)))
-    write_addresses_csv(addresses_csv)
-    print("- companies.csv: {} records".format(len(companies_csv)))
-    write_companies_csv(companies_csv)
+    with PROFILER.stage('csv_write'):
+        print("- contacts.csv: {} records".format(len(contacts_csv)))
+        write_contacts_csv(contacts_csv)
+        print("- addresses.csv: {} records".format(len(addresses_csv)))
+        write_addresses_csv(addresses_csv)
+        print("- companies.csv: {} records".format(len(companies_csv)))
+        write_companies_csv(companies_csv)
+    # Replaced on every run, so it only lists the contacts missing or incomplete in these files
+    dead_letters.save(dead_letters_path('export_contacts'))
+    if dead_letters:
+        partial = len(dead_letters.partial_ids())
+        print("\n{} {} contacts could not be fetched ({} missing from the export files, {} exported without the failed requests). "
+              "Run with --retry-failed to fetch them again: {}".format(INDICATORS['warning'], len(dead_letters), len(dead_letters) - partial,
+                                                                       partial, dead_letters_path('export_contacts')))
     print('\n{} Export complete!'.format(INDICATORS['success']))
+    return write_run_report(export_path(RUN_REPORT), 'export_contacts', started, get_client().metrics,
+                            account_textfile(args.prometheus_textfile), prometheus_labels={'account': current_profile()},
+                            contacts=len(contacts_csv), addresses=len(addresses_csv), companies=len(companies_csv),
+                            failed_contacts=failed, dead_letters=len(dead_letters), partial_contacts=len(dead_letters.partial_ids()),
+                            dead_letter_errors=dead_letters.summary())
 
-def process_contacts(contact_ids, contacts_csv, addresses_csv, companies_csv, company_ids_seen):
-    """Process a list of contact IDs and update the CSV data lists."""
-    total_contacts = len(contact_ids)
-    for idx, cid in enumerate(contact_ids, 1):
-        try:
-            # Progress indicator (update on same line)
-            sys.stdout.write("\r{} Progress: {}/{} contacts processed".format(
-                INDICATORS['progress'],
-                idx,
-                total_contacts
-            ))
-            sys.stdout.flush()
-            
-            # Get contact details
-            contact = get_contact_details(cid)
-            if not contact:
-                print("\n{} Skipping contact ID {} - no details found".format(INDICATORS['warning'], cid))
+def export_unit(contact_ids, shard_dir):
+    """--distributed work: fetch one work unit's contacts and write its CSV files and dead letters into shard_dir"""
+    records = {'contact': [], 'company': [], 'address': []}
+    company_ids_seen = set()
+    dead_letters = DeadLetters('contact')
+    # Companies already exported by earlier units are dropped by the merge
+    for kind, record in iter_contact_records(contact_ids, company_ids_seen, dead_letters):
+        records[kind].append(record)
+    if dead_letters:
+        retried, recovered = retry_pass(dead_letters, lambda ids, still_failing: list(iter_contact_records(ids, company_ids_seen, still_failing)))
+        for kind, record in retried:
+            records[kind].append(record)
+    write_contacts_csv(records['contact'], os.path.join(shard_dir, 'contacts.csv'))
+    write_addresses_csv(records['address'], os.path.join(shard_dir, 'addresses.csv'))
+    write_companies_csv(records['company'], os.path.join(shard_dir, 'companies.csv'))
+    dead_letters.save(os.path.join(shard_dir, SHARD_DEAD_LETTERS))
+    return {'contacts': len(records['contact']), 'addresses': len(records['address']), 'companies': len(records['company']),
+            'dead_letters': len(dead_letters)}
+
+def retry_failed(args):
+    """
+    --retry-failed: fetch the contacts in the dead-letter file again and patch
+    the ones fetched, completely or partially, into the export files.
+    Companies already in companies.csv are not added again. Returns the run
+    report.
+    """
+    started = time.time()
+    path = dead_letters_path('export_contacts')
+    if not os.path.exists(path):
+        print("{} No dead-letter file at {}: run an export first".format(INDICATORS['error'], path))
+        sys.exit(1)
+    dead_letters = DeadLetters.load(path, 'contact')
+    if not dead_letters:
+        print("{} No failed contacts in {}".format(INDICATORS['success'], path))
+        return write_run_report(export_path(RETRY_REPORT), 'export_contacts', started, get_client().metrics,
+                                account_textfile(args.prometheus_textfile), prometheus_labels={'account': current_profile()},
+                                recovered=0, dead_letters=0)
+
+    records = {'contact': [], 'company': [], 'address': []}
+    retried, recovered = retry_pass(dead_letters, lambda ids, still_failing: list(iter_contact_records(ids, set(), still_failing)),
+                                    retryable_only=False)
+    for kind, record in retried:
+        records[kind].append(record)
+    # A contact fetched again replaces its rows, including a partial export of it
+    replaced = [c['contactId'] for c in records['contact']]
+
+    with open(export_path('companies.csv'), newline='', encoding='utf-8') as f:
+        exported_companies = {row['companyId'] for row in csv.DictReader(f)}
+    companies = [company_csv_row(c) for c in records['company'] if csv_value(c['companyId']) not in exported_companies]
+    print("{} Patching export files:".format(INDICATORS['info']))
+    rows = {
+        'contacts': patch_csv(export_path('contacts.csv'), CONTACTS_FIELDNAMES, 'contactId', replaced,
+                              [contact_csv_row(c) for c in records['contact']]),
+        'addresses': patch_csv(export_path('addresses.csv'), ADDRESSES_FIELDNAMES, 'contactId', replaced,
+                               [address_csv_row(a) for a in records['address']]),
+        'companies': patch_csv(export_path('companies.csv'), COMPANIES_FIELDNAMES, 'companyId', [], companies),
+    }
+    print("- contacts.csv: {} contacts added, {} records".format(len(records['contact']), rows['contacts']))
+    print("- addresses.csv: {} addresses added, {} records".format(len(records['address']), rows['addresses']))
+    print("- companies.csv: {} companies added, {} records".format(len(companies), rows['companies']))
+    dead_letters.save(path)
+    if dead_letters:
+        print("{} {} contacts still failing, kept in {}".format(INDICATORS['warning'], len(dead_letters), path))
+    print("{} {} of {} failed contacts recovered".format(INDICATORS['success'], len(recovered), len(recovered) + len(dead_letters)))
+    return write_run_report(export_path(RETRY_REPORT), 'export_contacts', started, get_client().metrics,
+                            account_textfile(args.prometheus_textfile), prometheus_labels={'account': current_profile()},
+                            recovered=len(recovered), dead_letters=len(dead_letters), dead_letter_errors=dead_letters.summary(),
+                            **{name + '_rows': count for name, count in rows.items()})
+
+def distributed(args):
+    """--distributed: enqueue the contact IDs, work on the queued units, or merge their shards into exports/"""
+    if args.distributed == 'merge':
+        print("{} Merging export files:".format(INDICATORS['info']))
+        merge_shards(args, 'export_contacts', [('contacts.csv', CONTACTS_FIELDNAMES, None), ('addresses.csv', ADDRESSES_FIELDNAMES, None),
+                                                ('companies.csv', COMPANIES_FIELDNAMES, 'companyId')])
+        return
+    config_or_exit()
+    if args.distributed == 'coordinate':
+        contact_ids = get_contacts_with_tag('B2B')
+        additional_contact_ids = read_additional_contact_ids()
+        print("{} {} B2B contacts and {} additional contacts".format(INDICATORS['info'], len(contact_ids), len(additional_contact_ids)))
+        coordinate(args, 'export_contacts', contact_ids + additional_contact_ids)
+    else:
+        run_worker(args, 'export_contacts', export_unit)
+
+def main():
+    args = parse_args()
+    if args.distributed:
+        distributed(args)
+        return
+    if args.accounts:
+        if args.plan:
+            run_accounts('export_contacts', args.accounts, lambda: plan_export(args), ACCOUNTS_PLAN)
+        elif args.retry_failed:
+            run_accounts('export_contacts', args.accounts, lambda: retry_failed(args), ACCOUNTS_RETRY_REPORT)
+        else:
+            run_accounts('export_contacts', args.accounts, lambda: export(args), ACCOUNTS_REPORT)
+        return
+    config_or_exit()
+    if args.plan:
+        plan_export(args)
+        return
+    if args.retry_failed:
+        retry_failed(args)
+        return
+    if args.profile or args.profile_stage:
+        PROFILER.start(args.profile_stage)
+    export(args)
+    if PROFILER.enabled:
+        PROFILER.report(export_path(PROFILE_REPORT))
+
+def iter_contact_records(contact_ids, company_ids_seen, dead_letters=None):
+    """
+    Fetch a list of contact IDs and yield ('contact' | 'company' | 'address', record)
+    for each one as soon as it is fetched. Companies are only yielded the first
+    time their companyId is seen. A contact with a request that failed is
+    recorded in dead_letters. It is not yielded at all if its details could
+    not be fetched or the failure may pass on a retry; otherwise (and without
+    dead_letters) whatever could be fetched of it is yielded.
+    """
+    progress = ProgressReporter('contacts', len(contact_ids), get_client())
+    for cid in contact_ids:
+        progress.advance()
+        records = []
+        with get_client().capture_failures() as failures:
+            try:
+                records.extend(fetch_contact_records(cid))
+            except Exception as e:
+                progress.message("{} Error processing contact {}: {}".format(INDICATORS['error'], cid, str(e)))
+                failures.append({'endpoint': None, 'url': None, 'status': None, 'error': '{}: {}'.format(type(e).__name__, e)})
+        if failures and dead_letters is not None:
+            # records is empty when the contact's own details could not be fetched
+            partial = bool(records) and not any(retryable(f) for f in failures)
+            dead_letters.add(cid, failures, partial)
+            if not partial:
                 continue
-            
-            # Contact basic info
-            # Extract email and phone robustly from communication
-            communication = contact.get('communication', {})
-            emails = communication.get('emails', {})
-            primary_email = emails.get('PRI', {})
-            if isinstance(primary_email, dict):
-                email = primary_email.get('email', '')
-            else:
-                email = ''
-            telephones = communication.get('telephones', {})
-            phone = telephones.get('PRI', '') or telephones.get('MOB', '')
-
-            name = u'{} {}'.format(
-                contact.get('firstName', '') or '',
-                contact.get('lastName', '') or ''
-            ).strip()
-            
-            # Get company details if we haven't seen this company before
-            company = get_company_details(cid)
-            company_id = company['companyId'] if company else ''
-            
-            contact_row = {
-                'contactId': contact.get('contactId', ''),
-                'name': name,
-                'email': email,
-                'phone': phone,
-                'tagList': '',
-                'companyId': company_id,
-                'Wholesale': contact.get('Wholesale', ''),
-                'Joor Account Code': contact.get('Joor Account Code', '')
-            }
-            contacts_csv.append(contact_row)
-            
-            if company and company_id and company_id not in company_ids_seen:
-                companies_csv.append(company)
-                company_ids_seen.add(company_id)
-
-            # Get addresses
-            addresses = get_contact_addresses(cid)
-            if addresses:
-                addresses_csv.extend(addresses)
-                
-        except Exception as e:
-            print("\n{} Error processing contact {}: {}".format(INDICATORS['error'], cid, str(e)))
+        if not records:
+            progress.message("{} Skipping contact ID {} - no details found".format(INDICATORS['warning'], cid))
             continue
+        for kind, record in records:
+            if kind == 'company':
+                if record['companyId'] in company_ids_seen:
+                    continue
+                company_ids_seen.add(record['companyId'])
+            yield kind, record
+    progress.finish()
+
+def fetch_contact_records(cid):
+    """Yield ('contact' | 'company' | 'address', record) for one contact, or nothing without its details"""
+    # Get contact details
+    with PROFILER.stage('detail_fetch'):
+        contact = get_contact_details(cid)
+    if not contact:
+        return
+    
+    # Contact basic info
+    # Extract email and phone robustly from communication
+    communication = contact.get('communication', {})
+    emails = communication.get('emails', {})
+    primary_email = emails.get('PRI', {})
+    if isinstance(primary_email, dict):
+        email = primary_email.get('email', '')
+    else:
+        email = ''
+    telephones = communication.get('telephones', {})
+    phone = telephones.get('PRI', '') or telephones.get('MOB', '')
+
+    name = u'{} {}'.format(
+        contact.get('firstName', '') or '',
+        contact.get('lastName', '') or ''
+    ).strip()
+    
+    # Get company details (iter_contact_records drops companies it has seen before)
+    with PROFILER.stage('detail_fetch'):
+        company = get_company_details(cid)
+    company_id = company['companyId'] if company else ''
+    
+    contact_row = {
+        'contactId': contact.get('contactId', ''),
+        'name': name,
+        'email': email,
+        'phone': phone,
+        'tagList': '',
+        'companyId': company_id,
+        'Wholesale': contact.get('Wholesale', ''),
+        'Joor Account Code': contact.get('Joor Account Code', '')
+    }
+    yield 'contact', contact_row
+    
+    if company and company_id:
+        yield 'company', company
+
+    # Get addresses
+    with PROFILER.stage('address_fetch'):
+        addresses = get_contact_addresses(cid)
+    for address in addresses:
+        yield 'address', address
 
 if __name__ == '__main__':
     main()
@@ -1,40 +1,31 @@
 # -*- coding: utf-8 -*-
 
+import argparse
 import os
-import requests
 import csv
-from dotenv import load_dotenv
 import sys
 import time
 from typing import List, Dict, Any, Optional
 
+from brightpearl_export import (PROFILER, DeadLetters, ProgressReporter, RequestPlan, account_textfile, add_account_arguments,
+                                add_distributed_arguments, add_plan_arguments, add_profile_arguments, add_retry_arguments,
+                                config_or_exit, coordinate, current_profile, dead_letters_path, export_path, get_client,
+                                merge_shards, patch_csv, retry_pass, retryable, run_accounts, run_worker, search_pages, write_run_report)
+from brightpearl_export.dead_letters import SHARD_DEAD_LETTERS
+
 # Set default encoding to UTF-8 for Python 2 compatibility
 # reload(sys)
 # sys.setdefaultencoding('utf8')
 
-load_dotenv()
-
-BRIGHTPEARL_ACCOUNT = os.getenv('BRIGHTPEARL_ACCOUNT')
-BRIGHTPEARL_API_TOKEN = os.getenv('BRIGHTPEARL_API_TOKEN')
-BRIGHTPEARL_API_DOMAIN = os.getenv('BRIGHTPEARL_API_DOMAIN')
-BRIGHTPEARL_APP_REF = os.getenv('BRIGHTPEARL_APP_REF')
-
-if not all([BRIGHTPEARL_ACCOUNT, BRIGHTPEARL_API_TOKEN, BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_APP_REF]):
-    print('Missing one or more required environment variables.')
-    exit(1)
-
-BASE_URL = 'https://{}/public-api/{}'.format(BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_ACCOUNT)
-HEADERS = {
-    'brightpearl-account-token': BRIGHTPEARL_API_TOKEN,
-    'brightpearl-app-ref': BRIGHTPEARL_APP_REF,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'
-}
-
-# Constants for rate limiting
-REQUEST_DELAY = 0.5  # Half second delay between requests
-MAX_RETRIES = 3
-RETRY_DELAY = 2  # Seconds to wait between retries
+# File names in exports/, or in exports/<profile>/ for --accounts (see export_path)
+RUN_REPORT = 'export_orders_report.json'
+RETRY_REPORT = 'export_orders_retry_report.json'
+PROFILE_REPORT = 'export_orders_profile'
+PLAN_REPORT = 'export_orders_plan.json'
+ACCOUNTS_REPORT = os.path.join('exports', 'export_orders_accounts_report.json')
+ACCOUNTS_PLAN = os.path.join('exports', 'export_orders_accounts_plan.json')
+ACCOUNTS_RETRY_REPORT = os.path.join('exports', 'export_orders_accounts_retry_report.json')
+PROFILE_STAGES = ['id_discovery', 'detail_fetch', 'csv_write']
 
 # Let's use simple text indicators instead of emojis for better compatibility
 INDICATORS = {
@@ -45,49 +36,11 @@ INDICATORS = {
     'progress': '[PROGRESS]'
 }
 
-def make_request(url, headers, params=None):
-    """
-    Make a rate-limited request with retries, including exponential backoff for 429 and 503 errors
-    """
-    max_retries = 5
-    delay = REQUEST_DELAY
-    for attempt in range(max_retries):
-        try:
-            time.sleep(delay)
-            resp = requests.get(url, headers=headers, params=params)
-            resp.raise_for_status()
-            return resp
-        except requests.exceptions.HTTPError as e:
-            status = e.response.status_code
-            if status in (429, 503):
-                if attempt < max_retries - 1:
-                    print("{} {} error on {} (attempt {}/{}), waiting {} seconds...".format(
-                        INDICATORS['warning'], status, url, attempt + 1, max_retries, delay * 2
-                    ))
-                    time.sleep(delay * 2)
-                    delay *= 2
-                    continue
-            print("{} HTTP error on {}: {}".format(
-                INDICATORS['error'],
-                url,
-                str(e)
-            ))
-            return None
-        except Exception as e:
-            print("{} Request error on {}: {}".format(
-                INDICATORS['error'],
-                url,
-                str(e)
-            ))
-            return None
-    print("{} Max retries exceeded for {}".format(INDICATORS['error'], url))
-    return None
-
 def get_orders(department_id=11):
     """
     Get all orders for the specified department using pagination
     """
-    url = "{}/order-service/order-search".format(BASE_URL)
+    url = get_client().url('order-service/order-search')
     all_order_ids = []
     first_result = 1
     page_size = 200  # Maximum allowed by Brightpearl
@@ -100,7 +53,7 @@ def get_orders(department_id=11):
         }
         
         try:
-            resp = make_request(url, HEADERS, params)
+            resp = get_client().get(url, params)
             if not resp:
                 break
                 
@@ -134,156 +87,218 @@ def get_orders(department_id=11):
 
 def get_order_details(order_id):
     """
-    Get full order details including all line items
+    Get full order details including all line items, or None after
+    get_response() recorded why they could not be fetched
     """
-    url = "{}/order-service/order/{}".format(BASE_URL, order_id)
-    try:
-        resp = make_request(url, HEADERS)
-        if not resp:
-            return None
-            
-        data = resp.json()
-        order = data.get('response', [])[0] if data.get('response') else None
-        if not order:
-            return None
-            
-        # Debug: Print the first order structure
-        if order_id == data.get('response', [])[0].get('orderId'):
-            print("\n{} First order structure:".format(INDICATORS['info']))
-            print(order)
-            
-        return order
-    except Exception as e:
-        print("{} Error fetching order {} details: {}".format(INDICATORS['error'], order_id, str(e)))
+    url = get_client().url('order-service/order/{}'.format(order_id))
+    records = get_client().get_response(url)
+    if not records:
         return None
+    order = records[0]
+
+    # Debug: Print the first order structure
+    if order_id == order.get('orderId'):
+        print("\n{} First order structure:".format(INDICATORS['info']))
+        print(order)
+
+    return order
+
+# Define the new column order and headers
+ORDERS_FIELDNAMES = [
+    'Order ID', 'Order Type', 'Status', 'Payment Status', 'Item name', 'Order row SKU', 'Quantity', 'Invoice', 'Ref', 'Tax status', 'Date created', 'Currency', 'Exchange rate',
+    'Delivery name', 'Delivery company', 'Delivery street', 'Delivery suburb', 'Delivery city', 'Delivery state', 'Delivery postcode', 'Delivery country', 'Delivery telephone', 'Delivery mobile', 'Delivery email',
+    'Billing name', 'Billing company', 'Billing Street', 'Billing Suburb', 'Billing City', 'Billing State', 'Billing Postcode', 'Billing Country', 'Billing telephone', 'Billing mobile', 'Billing email',
+    'Contact ID', 'Product ID', 'Order list price',
+    'Row net', 'Row tax', 'Row gross',
+    'Item tax class', 'Tax Rate', 'Shipping Method Id', 'Stock Status Code', 'Allocation Status Code', 'Shipping Status Code'
+]
+
+def order_csv_rows(order):
+    """The orders.csv rows of one order, one per order line item"""
+    rows = []
+    # Extract invoice info (first invoice if present)
+    invoice = order.get('invoices', [{}])[0] if order.get('invoices') else {}
+    invoice_number = invoice.get('invoiceReference', '')
+    tax_date = invoice.get('taxDate', '')
 
-def write_orders_csv(orders):
+    # Base order data shared across all rows
+    base_order = {
+        'Order ID': order.get('id', ''),
+        'Order Type': order.get('orderTypeCode', ''),
+        'Status': order.get('orderStatus', {}).get('name', ''),
+        'Payment Status': order.get('orderPaymentStatus', ''),
+        'Ref': order.get('reference', ''),
+        'Tax status': order.get('state', {}).get('tax', ''),
+        'Date created': order.get('createdOn', ''),
+        'Currency': order.get('currency', {}).get('orderCurrencyCode', ''),
+        'Exchange rate': order.get('currency', {}).get('exchangeRate', ''),
+        'Invoice': invoice_number,
+        'Tax date': tax_date,
+        'Delivery name': order.get('parties', {}).get('delivery', {}).get('addressFullName', ''),
+        'Delivery company': order.get('parties', {}).get('delivery', {}).get('companyName', ''),
+        'Delivery street': order.get('parties', {}).get('delivery', {}).get('addressLine1', ''),
+        'Delivery suburb': order.get('parties', {}).get('delivery', {}).get('addressLine2', ''),
+        'Delivery city': order.get('parties', {}).get('delivery', {}).get('addressLine3', ''),
+        'Delivery state': order.get('parties', {}).get('delivery', {}).get('addressLine4', ''),
+        'Delivery postcode': order.get('parties', {}).get('delivery', {}).get('postalCode', ''),
+        'Delivery country': order.get('parties', {}).get('delivery', {}).get('country', ''),
+        'Delivery telephone': order.get('parties', {}).get('delivery', {}).get('telephone', ''),
+        'Delivery mobile': order.get('parties', {}).get('delivery', {}).get('mobileTelephone', ''),
+        'Delivery email': order.get('parties', {}).get('delivery', {}).get('email', ''),
+        'Billing name': order.get('parties', {}).get('billing', {}).get('addressFullName', ''),
+        'Billing company': order.get('parties', {}).get('billing', {}).get('companyName', ''),
+        'Billing Street': order.get('parties', {}).get('billing', {}).get('addressLine1', ''),
+        'Billing Suburb': order.get('parties', {}).get('billing', {}).get('addressLine2', ''),
+        'Billing City': order.get('parties', {}).get('billing', {}).get('addressLine3', ''),
+        'Billing State': order.get('parties', {}).get('billing', {}).get('addressLine4', ''),
+        'Billing Postcode': order.get('parties', {}).get('billing', {}).get('postalCode', ''),
+        'Billing Country': order.get('parties', {}).get('billing', {}).get('country', ''),
+        'Billing telephone': order.get('parties', {}).get('billing', {}).get('telephone', ''),
+        'Billing mobile': order.get('parties', {}).get('billing', {}).get('mobileTelephone', ''),
+        'Billing email': order.get('parties', {}).get('billing', {}).get('email', ''),
+        'Contact ID': order.get('parties', {}).get('billing', {}).get('contactId', ''),
+    }
+
+    order_rows = order.get('orderRows', {})
+    for row_id, row in order_rows.items():
+        # Row-level values
+        product_price = row.get('productPrice', {})
+        row_value = row.get('rowValue', {})
+        row_net = row_value.get('rowNet', {})
+        row_tax = row_value.get('rowTax', {})
+        # EUR values (base values)
+        base_net = row_net.get('value', '') if row_net.get('currencyCode', '') == 'EUR' else ''
+        base_tax = row_tax.get('value', '') if row_tax.get('currencyCode', '') == 'EUR' else ''
+        base_gross = ''  # Not directly available, can be calculated if needed
+        # Item net (productPrice.value)
+        item_net = product_price.get('value', '')
+        # Item gross and item tax (not directly available, can be calculated if needed)
+        item_gross = ''
+        item_tax = ''
+        # EUR item net/gross/tax (not directly available, can be calculated if needed)
+        eur_item_net = item_net if product_price.get('currencyCode', '') == 'EUR' else ''
+        eur_item_gross = ''
+        eur_item_tax = ''
+        # Row gross (rowNet + rowTax)
+        try:
+            row_gross = str(float(row_net.get('value', 0)) + float(row_tax.get('value', 0)))
+        except:
+            row_gross = ''
+        eur_row_net = base_net
+        eur_row_tax = base_tax
+        try:
+            eur_row_gross = str(float(eur_row_net or 0) + float(eur_row_tax or 0))
+        except:
+            eur_row_gross = ''
+
+        order_row = base_order.copy()
+        order_row.update({
+            'Item name': row.get('productName', ''),
+            'Order row SKU': row.get('productSku', ''),
+            'Quantity': row.get('quantity', {}).get('magnitude', ''),
+            'Product ID': row.get('productId', ''),
+            'Order list price': item_net,
+            'Row net': row_net.get('value', ''),
+            'Row tax': row_tax.get('value', ''),
+            'Row gross': row_gross,
+            'Item tax class': row_value.get('taxCode', ''),
+            'Tax Rate': row_value.get('taxRate', ''),
+            'Shipping Method Id': order.get('delivery', {}).get('shippingMethodId', ''),
+            'Stock Status Code': order.get('stockStatusCode', ''),
+            'Allocation Status Code': order.get('allocationStatusCode', ''),
+            'Shipping Status Code': order.get('shippingStatusCode', ''),
+            'Invoice': invoice_number,
+            'Tax date': tax_date,
+            'Billing mobile': order.get('parties', {}).get('billing', {}).get('mobileTelephone', ''),
+        })
+        # Remove columns not in the new columns list
+        filtered_row = {col: order_row.get(col, '') for col in ORDERS_FIELDNAMES}
+        rows.append(filtered_row)
+    return rows
+
+def write_orders_csv(orders, path=None):
     """
     Write orders data to CSV file, with one row per order line item
     """
-    if not os.path.exists('exports'):
-        os.makedirs('exports')
-
-    # Define the new column order and headers
-    columns = [
-        'Order ID', 'Order Type', 'Status', 'Payment Status', 'Item name', 'Order row SKU', 'Quantity', 'Invoice', 'Ref', 'Tax status', 'Date created', 'Currency', 'Exchange rate',
-        'Delivery name', 'Delivery company', 'Delivery street', 'Delivery suburb', 'Delivery city', 'Delivery state', 'Delivery postcode', 'Delivery country', 'Delivery telephone', 'Delivery mobile', 'Delivery email',
-        'Billing name', 'Billing company', 'Billing Street', 'Billing Suburb', 'Billing City', 'Billing State', 'Billing Postcode', 'Billing Country', 'Billing telephone', 'Billing mobile', 'Billing email',
-        'Contact ID', 'Product ID', 'Order list price',
-        'Row net', 'Row tax', 'Row gross',
-        'Item tax class', 'Tax Rate', 'Shipping Method Id', 'Stock Status Code', 'Allocation Status Code', 'Shipping Status Code'
-    ]
-
-    with open('exports/orders.csv', 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=columns)
+    path = path or export_path('orders.csv')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ORDERS_FIELDNAMES)
         writer.writeheader()
-
         for order in orders:
-            # Extract invoice info (first invoice if present)
-            invoice = order.get('invoices', [{}])[0] if order.get('invoices') else {}
-            invoice_number = invoice.get('invoiceReference', '')
-            tax_date = invoice.get('taxDate', '')
+            writer.writerows(order_csv_rows(order))
 
-            # Base order data shared across all rows
-            base_order = {
-                'Order ID': order.get('id', ''),
-                'Order Type': order.get('orderTypeCode', ''),
-                'Status': order.get('orderStatus', {}).get('name', ''),
-                'Payment Status': order.get('orderPaymentStatus', ''),
-                'Ref': order.get('reference', ''),
-                'Tax status': order.get('state', {}).get('tax', ''),
-                'Date created': order.get('createdOn', ''),
-                'Currency': order.get('currency', {}).get('orderCurrencyCode', ''),
-                'Exchange rate': order.get('currency', {}).get('exchangeRate', ''),
-                'Invoice': invoice_number,
-                'Tax date': tax_date,
-                'Delivery name': order.get('parties', {}).get('delivery', {}).get('addressFullName', ''),
-                'Delivery company': order.get('parties', {}).get('delivery', {}).get('companyName', ''),
-                'Delivery street': order.get('parties', {}).get('delivery', {}).get('addressLine1', ''),
-                'Delivery suburb': order.get('parties', {}).get('delivery', {}).get('addressLine2', ''),
-                'Delivery city': order.get('parties', {}).get('delivery', {}).get('addressLine3', ''),
-                'Delivery state': order.get('parties', {}).get('delivery', {}).get('addressLine4', ''),
-                'Delivery postcode': order.get('parties', {}).get('delivery', {}).get('postalCode', ''),
-                'Delivery country': order.get('parties', {}).get('delivery', {}).get('country', ''),
-                'Delivery telephone': order.get('parties', {}).get('delivery', {}).get('telephone', ''),
-                'Delivery mobile': order.get('parties', {}).get('delivery', {}).get('mobileTelephone', ''),
-                'Delivery email': order.get('parties', {}).get('delivery', {}).get('email', ''),
-                'Billing name': order.get('parties', {}).get('billing', {}).get('addressFullName', ''),
-                'Billing company': order.get('parties', {}).get('billing', {}).get('companyName', ''),
-                'Billing Street': order.get('parties', {}).get('billing', {}).get('addressLine1', ''),
-                'Billing Suburb': order.get('parties', {}).get('billing', {}).get('addressLine2', ''),
-                'Billing City': order.get('parties', {}).get('billing', {}).get('addressLine3', ''),
-                'Billing State': order.get('parties', {}).get('billing', {}).get('addressLine4', ''),
-                'Billing Postcode': order.get('parties', {}).get('billing', {}).get('postalCode', ''),
-                'Billing Country': order.get('parties', {}).get('billing', {}).get('country', ''),
-                'Billing telephone': order.get('parties', {}).get('billing', {}).get('telephone', ''),
-                'Billing mobile': order.get('parties', {}).get('billing', {}).get('mobileTelephone', ''),
-                'Billing email': order.get('parties', {}).get('billing', {}).get('email', ''),
-                'Contact ID': order.get('parties', {}).get('billing', {}).get('contactId', ''),
-            }
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export the orders of a Brightpearl department into a CSV file.')
+    parser.add_argument('--prometheus-textfile', metavar='PATH',
+                        help='Also write the request metrics in Prometheus text format (for the node_exporter textfile collector)')
+    add_profile_arguments(parser, PROFILE_STAGES)
+    add_plan_arguments(parser)
+    add_account_arguments(parser)
+    add_distributed_arguments(parser)
+    add_retry_arguments(parser)
+    args = parser.parse_args()
+    if args.accounts and (args.profile or args.profile_stage):
+        parser.error('--profile and --profile-stage time a single export and cannot be used with --accounts')
+    if args.distributed and (args.accounts or args.plan or args.profile or args.profile_stage):
+        parser.error('--distributed cannot be combined with --accounts, --plan or --profile')
+    if args.retry_failed and (args.distributed or args.plan or args.profile or args.profile_stage):
+        parser.error('--retry-failed cannot be combined with --distributed, --plan or --profile')
+    return args
 
-            order_rows = order.get('orderRows', {})
-            for row_id, row in order_rows.items():
-                # Row-level values
-                product_price = row.get('productPrice', {})
-                row_value = row.get('rowValue', {})
-                row_net = row_value.get('rowNet', {})
-                row_tax = row_value.get('rowTax', {})
-                # EUR values (base values)
-                base_net = row_net.get('value', '') if row_net.get('currencyCode', '') == 'EUR' else ''
-                base_tax = row_tax.get('value', '') if row_tax.get('currencyCode', '') == 'EUR' else ''
-                base_gross = ''  # Not directly available, can be calculated if needed
-                # Item net (productPrice.value)
-                item_net = product_price.get('value', '')
-                # Item gross and item tax (not directly available, can be calculated if needed)
-                item_gross = ''
-                item_tax = ''
-                # EUR item net/gross/tax (not directly available, can be calculated if needed)
-                eur_item_net = item_net if product_price.get('currencyCode', '') == 'EUR' else ''
-                eur_item_gross = ''
-                eur_item_tax = ''
-                # Row gross (rowNet + rowTax)
-                try:
-                    row_gross = str(float(row_net.get('value', 0)) + float(row_tax.get('value', 0)))
-                except:
-                    row_gross = ''
-                eur_row_net = base_net
-                eur_row_tax = base_tax
-                try:
-                    eur_row_gross = str(float(eur_row_net or 0) + float(eur_row_tax or 0))
-                except:
-                    eur_row_gross = ''
+def plan_export(args, department_id=11):
+    """--plan: count the requests of a full run from the order search total, without fetching any order"""
+    plan = RequestPlan('export_orders', get_client(), args.requests_per_minute)
+    total = plan.search_total('order-service/order-search', {'departmentId': department_id})
+    if total is None:
+        print("{} Could not read the order search total".format(INDICATORS['error']))
+        sys.exit(1)
+    print("{} {} orders in department {}".format(INDICATORS['info'], total, department_id))
+    plan.add('id_discovery', 'order-search pages', search_pages(total))
+    plan.add('detail_fetch', 'order requests, one per order', total)
+    return plan.report(export_path(PLAN_REPORT), orders=total)
 
-                order_row = base_order.copy()
-                order_row.update({
-                    'Item name': row.get('productName', ''),
-                    'Order row SKU': row.get('productSku', ''),
-                    'Quantity': row.get('quantity', {}).get('magnitude', ''),
-                    'Product ID': row.get('productId', ''),
-                    'Order list price': item_net,
-                    'Row net': row_net.get('value', ''),
-                    'Row tax': row_tax.get('value', ''),
-                    'Row gross': row_gross,
-                    'Item tax class': row_value.get('taxCode', ''),
-                    'Tax Rate': row_value.get('taxRate', ''),
-                    'Shipping Method Id': order.get('delivery', {}).get('shippingMethodId', ''),
-                    'Stock Status Code': order.get('stockStatusCode', ''),
-                    'Allocation Status Code': order.get('allocationStatusCode', ''),
-                    'Shipping Status Code': order.get('shippingStatusCode', ''),
-                    'Invoice': invoice_number,
-                    'Tax date': tax_date,
-                    'Billing mobile': order.get('parties', {}).get('billing', {}).get('mobileTelephone', ''),
-                })
-                # Remove columns not in the new columns list
-                filtered_row = {col: order_row.get(col, '') for col in columns}
-                writer.writerow(filtered_row)
+def fetch_orders(order_ids, dead_letters=None):
+    """
+    Fetch the details of order_ids, skipping orders that cannot be fetched.
+    A failed request is recorded in dead_letters, if given; an order that was
+    fetched anyway is kept unless the failure may pass on a retry.
+    """
+    orders = []
+    progress = ProgressReporter('orders', len(order_ids), get_client())
+    for oid in order_ids:
+        progress.advance()
+        with get_client().capture_failures() as failures:
+            try:
+                # Get order details
+                with PROFILER.stage('detail_fetch'):
+                    order = get_order_details(oid)
+            except Exception as e:
+                progress.message("{} Error processing order {}: {}".format(INDICATORS['error'], oid, str(e)))
+                failures.append({'endpoint': None, 'url': None, 'status': None, 'error': '{}: {}'.format(type(e).__name__, e)})
+                order = None
+        if failures and dead_letters is not None:
+            partial = bool(order) and not any(retryable(f) for f in failures)
+            dead_letters.add(oid, failures, partial)
+            if not partial:
+                continue
+        if not order:
+            progress.message("{} Skipping order ID {} - no details found".format(INDICATORS['warning'], oid))
+            continue
+            
+        orders.append(order)
+    progress.finish()
+    return orders
 
-def main():
+def export(args):
+    """Export the orders of one account (the configured one, or the profile of this --accounts thread); returns the run report"""
+    started = time.time()
     # For testing - set to 0 for unlimited orders
     TEST_LIMIT = 0
     
     print("\n{} Starting orders export...".format(INDICATORS['info']))
-    order_ids = get_orders(department_id=11)
+    with PROFILER.stage('id_discovery'):
+        order_ids = get_orders(department_id=11)
     if TEST_LIMIT:
         original_count = len(order_ids)
         order_ids = order_ids[:TEST_LIMIT]
@@ -295,36 +310,106 @@ def main():
     else:
         print("\n{} Processing all {} orders\n".format(INDICATORS['info'], len(order_ids)))
     
-    orders = []
-    total_orders = len(order_ids)
-    for idx, oid in enumerate(order_ids, 1):
-        try:
-            # Progress indicator (update on same line)
-            sys.stdout.write("\r{} Progress: {}/{} orders processed".format(
-                INDICATORS['progress'],
-                idx,
-                total_orders
-            ))
-            sys.stdout.flush()
-            
-            # Get order details
-            order = get_order_details(oid)
-            if not order:
-                print("\n{} Skipping order ID {} - no details found".format(INDICATORS['warning'], oid))
-                continue
-                
-            orders.append(order)
-                
-        except Exception as e:
-            print("\n{} Error processing order {}: {}".format(INDICATORS['error'], oid, str(e)))
-            continue
+    dead_letters = DeadLetters('order')
+    orders = fetch_orders(order_ids, dead_letters)
+    failed = len(dead_letters)
+    if dead_letters:
+        retried, recovered = retry_pass(dead_letters, fetch_orders)
+        orders.extend(retried)
 
     # Print a newline after progress is complete
     print("\n")
     print("{} Writing export file:".format(INDICATORS['info']))
     print("- orders.csv: {} orders with line items".format(len(orders)))
-    write_orders_csv(orders)
+    with PROFILER.stage('csv_write'):
+        write_orders_csv(orders)
+    # Replaced on every run, so it only lists the orders missing from orders.csv
+    dead_letters.save(dead_letters_path('export_orders'))
+    if dead_letters:
+        print("\n{} {} orders could not be fetched and are missing from orders.csv. "
+              "Run with --retry-failed to fetch them again: {}".format(INDICATORS['warning'], len(dead_letters), dead_letters_path('export_orders')))
     print('\n{} Export complete!'.format(INDICATORS['success']))
+    return write_run_report(export_path(RUN_REPORT), 'export_orders', started, get_client().metrics,
+                            account_textfile(args.prometheus_textfile), prometheus_labels={'account': current_profile()},
+                            orders=len(orders), failed_orders=failed, dead_letters=len(dead_letters),
+                            dead_letter_errors=dead_letters.summary())
+
+def export_unit(order_ids, shard_dir):
+    """--distributed work: fetch one work unit's orders and write its orders.csv and dead letters into shard_dir"""
+    dead_letters = DeadLetters('order')
+    orders = fetch_orders(order_ids, dead_letters)
+    if dead_letters:
+        retried, recovered = retry_pass(dead_letters, fetch_orders)
+        orders.extend(retried)
+    write_orders_csv(orders, os.path.join(shard_dir, 'orders.csv'))
+    dead_letters.save(os.path.join(shard_dir, SHARD_DEAD_LETTERS))
+    return {'orders': len(orders), 'dead_letters': len(dead_letters)}
+
+def retry_failed(args):
+    """--retry-failed: fetch the orders in the dead-letter file again and patch the ones fetched (or partially fetched) into orders.csv; returns the run report"""
+    started = time.time()
+    path = dead_letters_path('export_orders')
+    if not os.path.exists(path):
+        print("{} No dead-letter file at {}: run an export first".format(INDICATORS['error'], path))
+        sys.exit(1)
+    dead_letters = DeadLetters.load(path, 'order')
+    if not dead_letters:
+        print("{} No failed orders in {}".format(INDICATORS['success'], path))
+        return write_run_report(export_path(RETRY_REPORT), 'export_orders', started, get_client().metrics,
+                                account_textfile(args.prometheus_textfile), prometheus_labels={'account': current_profile()},
+                                recovered=0, dead_letters=0)
+
+    orders, recovered = retry_pass(dead_letters, fetch_orders, retryable_only=False)
+    print("{} Patching export file:".format(INDICATORS['info']))
+    rows = patch_csv(export_path('orders.csv'), ORDERS_FIELDNAMES, 'Order ID', [order.get('id') for order in orders],
+                     [row for order in orders for row in order_csv_rows(order)])
+    print("- orders.csv: {} orders added, {} rows".format(len(orders), rows))
+    dead_letters.save(path)
+    if dead_letters:
+        print("{} {} orders still failing, kept in {}".format(INDICATORS['warning'], len(dead_letters), path))
+    print("{} {} of {} failed orders recovered".format(INDICATORS['success'], len(recovered), len(recovered) + len(dead_letters)))
+    return write_run_report(export_path(RETRY_REPORT), 'export_orders', started, get_client().metrics,
+                            account_textfile(args.prometheus_textfile), prometheus_labels={'account': current_profile()},
+                            recovered=len(recovered), dead_letters=len(dead_letters), dead_letter_errors=dead_letters.summary(),
+                            orders_rows=rows)
+
+def distributed(args, department_id=11):
+    """--distributed: enqueue the order IDs, work on the queued units, or merge their shards into exports/"""
+    if args.distributed == 'merge':
+        print("{} Merging export file:".format(INDICATORS['info']))
+        merge_shards(args, 'export_orders', [('orders.csv', ORDERS_FIELDNAMES, None)])
+        return
+    config_or_exit()
+    if args.distributed == 'coordinate':
+        coordinate(args, 'export_orders', get_orders(department_id=department_id), department_id=department_id)
+    else:
+        run_worker(args, 'export_orders', export_unit)
+
+def main():
+    args = parse_args()
+    if args.distributed:
+        distributed(args)
+        return
+    if args.accounts:
+        if args.plan:
+            run_accounts('export_orders', args.accounts, lambda: plan_export(args), ACCOUNTS_PLAN)
+        elif args.retry_failed:
+            run_accounts('export_orders', args.accounts, lambda: retry_failed(args), ACCOUNTS_RETRY_REPORT)
+        else:
+            run_accounts('export_orders', args.accounts, lambda: export(args), ACCOUNTS_REPORT)
+        return
+    config_or_exit()
+    if args.plan:
+        plan_export(args)
+        return
+    if args.retry_failed:
+        retry_failed(args)
+        return
+    if args.profile or args.profile_stage:
+        PROFILER.start(args.profile_stage)
+    export(args)
+    if PROFILER.enabled:
+        PROFILER.report(export_path(PROFILE_REPORT))
 
 if __name__ == '__main__':
     main()
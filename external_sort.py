@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Disk-backed sorting and merge joins for bounded-memory processing.
+
+external_sort() sorts any iterable of JSON-serializable records by splitting
+it into sorted runs of at most chunk_size records, spilling each run to a
+temporary JSONL file and lazily merging the runs. The sort is stable, so
+records with equal keys keep their input order.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import tempfile
+
+SORT_CHUNK_SIZE = 50000  # Records held in memory per sorted run
+
+
+def _write_run(records, tmp_dir):
+    fd, path = tempfile.mkstemp(prefix='run_', suffix='.jsonl', dir=tmp_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return path
+
+
+def _read_run(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+    finally:
+        # The caller may have removed its temporary directory already when a
+        # join stops before this run is exhausted
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def external_sort(records, key, tmp_dir, chunk_size=SORT_CHUNK_SIZE):
+    """Yield records sorted by key, holding at most chunk_size records in memory"""
+    runs = []
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            chunk.sort(key=key)
+            runs.append(_write_run(chunk, tmp_dir))
+            chunk = []
+
+    chunk.sort(key=key)
+    if not runs:
+        # Everything fit in one chunk, no need to touch the disk
+        yield from chunk
+        return
+    if chunk:
+        runs.append(_write_run(chunk, tmp_dir))
+    # heapq.merge prefers earlier runs on ties, which keeps the sort stable
+    yield from heapq.merge(*(_read_run(path) for path in runs), key=key)
+
+
+def merge_join(left, right, left_key, right_key):
+    """
+    Left outer merge join of two iterables already sorted by their keys.
+    Yields (key, left_group, right_group) for every key present on the left;
+    right_group is an empty list when the right side has no match.
+    """
+    right_groups = itertools.groupby(right, key=right_key)
+    right_current = next(right_groups, None)
+    for key, left_group in itertools.groupby(left, key=left_key):
+        while right_current is not None and right_current[0] < key:
+            right_current = next(right_groups, None)
+        if right_current is not None and right_current[0] == key:
+            right_items = list(right_current[1])
+            right_current = next(right_groups, None)
+        else:
+            right_items = []
+        yield key, list(left_group), right_items
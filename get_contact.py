@@ -1,62 +1,20 @@
 # -*- coding: utf-8 -*-
 
-import os
-import requests
+import argparse
 import json
-from dotenv import load_dotenv
 import sys
-import time
 
-# Load environment variables
-load_dotenv()
+from brightpearl_export import add_daemon_arguments, fetch_id_set, lookup_client
+from brightpearl_export.client import ID_SET_SIZE, chunked
 
-BRIGHTPEARL_ACCOUNT = os.getenv('BRIGHTPEARL_ACCOUNT')
-BRIGHTPEARL_API_TOKEN = os.getenv('BRIGHTPEARL_API_TOKEN')
-BRIGHTPEARL_API_DOMAIN = os.getenv('BRIGHTPEARL_API_DOMAIN')
-BRIGHTPEARL_APP_REF = os.getenv('BRIGHTPEARL_APP_REF')
-
-if not all([BRIGHTPEARL_ACCOUNT, BRIGHTPEARL_API_TOKEN, BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_APP_REF]):
-    print('Missing one or more required environment variables.')
-    exit(1)
-
-BASE_URL = 'https://{}/public-api/{}'.format(BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_ACCOUNT)
-HEADERS = {
-    'brightpearl-account-token': BRIGHTPEARL_API_TOKEN,
-    'brightpearl-app-ref': BRIGHTPEARL_APP_REF,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'
-}
-
-def make_request(url, headers, params=None):
-    """Make a request to the Brightpearl API"""
-    try:
-        resp = requests.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        return resp.json()
-    except Exception as e:
-        print("Error making request: {}".format(str(e)))
-        return None
-
-def get_contact_details(contact_id):
-    """Get full contact details including addresses and company info"""
-    # Get basic contact info
-    url = "{}/contact-service/contact/{}".format(BASE_URL, contact_id)
-    params = {"includeOptional": "customFields"}
-    contact_data = make_request(url, HEADERS, params=params)
-    if not contact_data or not contact_data.get('response'):
-        print("Contact not found")
-        return None
-        
-    contact = contact_data['response'][0]
-    
-    # Get addresses
+def format_contact(contact, addresses_by_id):
+    """Build the contact details from a contact and its already fetched postal addresses"""
+    # One entry per address type; BIL, DEL and DEF often share the same address
     addresses = []
     post_address_ids = contact.get('postAddressIds', {})
     for addr_type, addr_id in post_address_ids.items():
-        addr_url = "{}/contact-service/postal-address/{}".format(BASE_URL, addr_id)
-        addr_data = make_request(addr_url, HEADERS)
-        if addr_data and addr_data.get('response'):
-            addr = addr_data['response'][0]
+        if addr_id in addresses_by_id:
+            addr = dict(addresses_by_id[addr_id])
             addr['type'] = addr_type
             addresses.append(addr)
     
@@ -95,6 +53,28 @@ def get_contact_details(contact_id):
     
     return output
 
+def iter_contact_details(contact_ids):
+    """
+    Yield (contact_id, raw contact, contact details) in request order, one
+    ID-set batch at a time. Each batch costs one contact request and one
+    request per ID_SET_SIZE unique postal addresses; the raw contact and
+    details are None for contacts that were not found.
+    """
+    for chunk in chunked(contact_ids, ID_SET_SIZE):
+        contacts = fetch_id_set('contact-service/contact', chunk, 'contactId', params={"includeOptional": "customFields"})
+        address_ids = []
+        for contact in contacts.values():
+            for addr_id in contact.get('postAddressIds', {}).values():
+                if addr_id not in address_ids:
+                    address_ids.append(addr_id)
+        addresses_by_id = fetch_id_set('contact-service/postal-address', address_ids, 'addressId')
+        for contact_id in chunk:
+            contact = contacts.get(contact_id)
+            if contact:
+                yield contact_id, contact, format_contact(contact, addresses_by_id)
+            else:
+                yield contact_id, None, None
+
 def print_contact(contact_data):
     """Pretty print contact information"""
     if not contact_data:
@@ -152,28 +132,62 @@ def print_contact(contact_data):
         if custom_fields.get("Joor Account Code") is not None:
             print("Joor Account Code: {}".format(custom_fields["Joor Account Code"]))
 
+def parse_contact_ids(token):
+    """Contact IDs for one argument: an ID or an inclusive range like 100-120"""
+    start, sep, end = token.partition('-')
+    if not sep:
+        return [int(token)]
+    start, end = int(start), int(end)
+    if start > end:
+        raise ValueError("empty range {}".format(token))
+    return range(start, end + 1)
+
+def iter_contact_ids(tokens):
+    """Yield unique contact IDs from the arguments; '-' reads IDs and ranges from stdin"""
+    seen = set()
+    for token in tokens:
+        if token == '-':
+            parts = (part for line in sys.stdin for part in line.replace(',', ' ').split())
+        else:
+            parts = [token]
+        for part in parts:
+            try:
+                contact_ids = parse_contact_ids(part)
+            except ValueError:
+                print("Error: invalid contact ID or range '{}'".format(part), file=sys.stderr)
+                sys.exit(1)
+            for contact_id in contact_ids:
+                if contact_id not in seen:
+                    seen.add(contact_id)
+                    yield contact_id
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Display Brightpearl contacts by ID.')
+    parser.add_argument('contact_ids', nargs='+', metavar='contact_id',
+                        help="Contact ID, inclusive range such as 100-120, or '-' to read IDs from stdin")
+    parser.add_argument('--format', choices=['pretty', 'jsonl'], default='pretty',
+                        help='pretty: readable details and the raw contact JSON (default); jsonl: one JSON object per contact')
+    add_daemon_arguments(parser)
+    return parser.parse_args()
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python get_contact.py <contact_id>")
+    args = parse_args()
+    lookup_client(args.daemon)
+    failed = 0
+    for contact_id, contact, contact_data in iter_contact_details(iter_contact_ids(args.contact_ids)):
+        if not contact_data:
+            failed += 1
+            print("Failed to retrieve contact {}".format(contact_id), file=sys.stderr)
+            continue
+        if args.format == 'jsonl':
+            print(json.dumps(contact_data, ensure_ascii=False))
+        else:
+            print_contact(contact_data)
+            print("\n=== Raw JSON Response ===")
+            print(json.dumps({"response": [contact]}, indent=2, ensure_ascii=False))
+        sys.stdout.flush()
+    if failed:
         sys.exit(1)
-        
-    try:
-        contact_id = int(sys.argv[1])
-    except ValueError:
-        print("Error: Contact ID must be a number")
-        sys.exit(1)
-        
-    # Get the raw API response with customFields
-    url = "{}/contact-service/contact/{}".format(BASE_URL, contact_id)
-    params = {"includeOptional": "customFields"}
-    raw_response = make_request(url, HEADERS, params=params)
-    contact_data = get_contact_details(contact_id)
-    if contact_data:
-        print_contact(contact_data)
-        print("\n=== Raw JSON Response ===")
-        print(json.dumps(raw_response, indent=2, ensure_ascii=False))
-    else:
-        print("Failed to retrieve contact information")
 
 if __name__ == '__main__':
     main()
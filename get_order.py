@@ -1,50 +1,73 @@
 # -*- coding: utf-8 -*-
 
-import os
-import requests
+import argparse
 import json
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import sys
+import time
 
-# Load environment variables
-load_dotenv()
-
-BRIGHTPEARL_ACCOUNT = os.getenv('BRIGHTPEARL_ACCOUNT')
-BRIGHTPEARL_API_TOKEN = os.getenv('BRIGHTPEARL_API_TOKEN')
-BRIGHTPEARL_API_DOMAIN = os.getenv('BRIGHTPEARL_API_DOMAIN')
-BRIGHTPEARL_APP_REF = os.getenv('BRIGHTPEARL_APP_REF')
-
-if not all([BRIGHTPEARL_ACCOUNT, BRIGHTPEARL_API_TOKEN, BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_APP_REF]):
-    print('Missing one or more required environment variables.')
-    exit(1)
-
-BASE_URL = 'https://{}/public-api/{}'.format(BRIGHTPEARL_API_DOMAIN, BRIGHTPEARL_ACCOUNT)
-HEADERS = {
-    'brightpearl-account-token': BRIGHTPEARL_API_TOKEN,
-    'brightpearl-app-ref': BRIGHTPEARL_APP_REF,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'
-}
-
-def make_request(url, headers, params=None):
-    """Make a request to the Brightpearl API"""
-    try:
-        resp = requests.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        return resp.json()
-    except Exception as e:
-        print("Error making request: {}".format(str(e)))
-        return None
-
-def get_order_details(order_id):
-    """Get full order details by order ID"""
-    url = "{}/order-service/order/{}".format(BASE_URL, order_id)
-    order_data = make_request(url, HEADERS)
-    if not order_data or not order_data.get('response'):
-        print("Order not found")
-        return None
-    order = order_data['response'][0]
-    return order
+from brightpearl_export import add_daemon_arguments, fetch_id_set, lookup_client
+from brightpearl_export.client import ID_SET_SIZE, chunked
+
+# Concurrent requests for the related contacts, products and shipping methods
+ENRICH_WORKERS = 8
+
+def get_order_details(order_ids):
+    """Get full order details for a list of order IDs, as {order_id: order}"""
+    orders = {}
+    for chunk in chunked(order_ids, ID_SET_SIZE):
+        orders.update(fetch_id_set('order-service/order', chunk, 'id'))
+    return orders
+
+def related_ids(orders):
+    """The contact, product and shipping method IDs referenced by the orders, in first-seen order"""
+    contact_ids, product_ids, shipping_method_ids = [], [], []
+
+    def add(ids, value):
+        if value and value not in ids:
+            ids.append(value)
+
+    for order in orders:
+        for party in order.get('parties', {}).values():
+            add(contact_ids, party.get('contactId'))
+        for row in order.get('orderRows', {}).values():
+            add(product_ids, row.get('productId'))
+        add(shipping_method_ids, order.get('delivery', {}).get('shippingMethodId'))
+    return contact_ids, product_ids, shipping_method_ids
+
+def get_related_entities(orders):
+    """
+    Fetch the contacts, products and shipping methods referenced by the orders
+    concurrently, one ID-set request per ID_SET_SIZE IDs. Returns
+    ({'contacts': {...}, 'products': {...}, 'shipping_methods': {...}}, timings)
+    where timings maps each entity kind to [requests, seconds spent in them].
+    """
+    contact_ids, product_ids, shipping_method_ids = related_ids(orders)
+    fetches = [
+        ('contacts', 'contact-service/contact', contact_ids, 'contactId'),
+        ('products', 'product-service/product', product_ids, 'id'),
+        ('shipping_methods', 'warehouse-service/shipping-method', shipping_method_ids, 'id'),
+    ]
+
+    def timed_fetch(kind, path, ids, id_field):
+        start = time.time()
+        resources = fetch_id_set(path, ids, id_field)
+        return kind, resources, time.time() - start
+
+    related = {kind: {} for kind, _, _, _ in fetches}
+    timings = {kind: [0, 0.0] for kind, _, _, _ in fetches}
+    with ThreadPoolExecutor(max_workers=ENRICH_WORKERS) as executor:
+        futures = [
+            executor.submit(timed_fetch, kind, path, chunk, id_field)
+            for kind, path, ids, id_field in fetches
+            for chunk in chunked(ids, ID_SET_SIZE)
+        ]
+        for future in futures:
+            kind, resources, seconds = future.result()
+            related[kind].update(resources)
+            timings[kind][0] += 1
+            timings[kind][1] += seconds
+    return related, timings
 
 def print_order(order):
     if not order:
@@ -108,22 +131,98 @@ def print_order(order):
         for key in order['nullCustomFields']:
             print(key)
 
+def print_related(order, related):
+    """Print the contacts, products and shipping method an order refers to"""
+    contacts = related['contacts']
+    printed_contacts = set()
+    print("\n=== Contacts ===")
+    for role, party in order.get('parties', {}).items():
+        contact = contacts.get(party.get('contactId'))
+        if not contact or contact['contactId'] in printed_contacts:
+            continue
+        printed_contacts.add(contact['contactId'])
+        communication = contact.get('communication', {})
+        email = communication.get('emails', {}).get('PRI', {})
+        print("\n{} (contact {}):".format(role.capitalize(), contact['contactId']))
+        print("  Name: {} {}".format(contact.get('firstName') or '', contact.get('lastName') or '').rstrip())
+        print("  Organization: {}".format(contact.get('organisation', {}).get('name')))
+        print("  Email: {}".format(email.get('email') if isinstance(email, dict) else email))
+        print("  Phones: {}".format(', '.join('{}: {}'.format(k, v) for k, v in communication.get('telephones', {}).items())))
+        print("  Is Customer: {}".format(contact.get('isCustomer', False)))
+
+    products = related['products']
+    print("\n=== Products ===")
+    for row_id, row in order.get('orderRows', {}).items():
+        product = products.get(row.get('productId'))
+        if not product:
+            continue
+        identity = product.get('identity', {})
+        sales_channels = product.get('salesChannels') or [{}]
+        print("\nRow ID: {} (product {})".format(row_id, product.get('id')))
+        print("  Name: {}".format(sales_channels[0].get('productName')))
+        print("  SKU: {}".format(identity.get('sku')))
+        print("  Barcode: {}".format(identity.get('barcode')))
+        print("  Status: {}".format(product.get('status')))
+        print("  Stock Tracked: {}".format(product.get('stock', {}).get('stockTracked')))
+
+    shipping_method = related['shipping_methods'].get(order.get('delivery', {}).get('shippingMethodId'))
+    if shipping_method:
+        print("\n=== Shipping Method ===")
+        print("Shipping Method ID: {}".format(shipping_method.get('id')))
+        print("Name: {}".format(shipping_method.get('name')))
+        print("Code: {}".format(shipping_method.get('code')))
+        print("Method Type: {}".format(shipping_method.get('methodType')))
+
+def print_timings(order_seconds, related_seconds, timings):
+    """Print where the lookup spent its time"""
+    print("\n=== Timing ===")
+    print("Order fetch: {:.2f}s".format(order_seconds))
+    for kind, (requests_made, seconds) in timings.items():
+        print("{}: {} requests, {:.2f}s".format(kind.replace('_', ' ').capitalize(), requests_made, seconds))
+    print("Related fetches: {:.2f}s wall ({:.2f}s of requests run concurrently)".format(
+        related_seconds, sum(seconds for _, seconds in timings.values())
+    ))
+    print("Total: {:.2f}s".format(order_seconds + related_seconds))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Display Brightpearl orders by ID.')
+    parser.add_argument('order_ids', nargs='+', type=int, metavar='order_id', help='Order ID')
+    parser.add_argument('--enrich', action='store_true',
+                        help='Also fetch the related contacts, products and shipping methods concurrently and show a timing breakdown')
+    add_daemon_arguments(parser)
+    return parser.parse_args()
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python get_order.py <order_id>")
-        sys.exit(1)
-    try:
-        order_id = int(sys.argv[1])
-    except ValueError:
-        print("Error: Order ID must be a number")
-        sys.exit(1)
-    order = get_order_details(order_id)
-    if order:
+    args = parse_args()
+    lookup_client(args.daemon)
+    order_ids = list(dict.fromkeys(args.order_ids))
+
+    start = time.time()
+    orders = get_order_details(order_ids)
+    order_seconds = time.time() - start
+
+    related = None
+    if args.enrich and orders:
+        start = time.time()
+        related, timings = get_related_entities([orders[order_id] for order_id in order_ids if order_id in orders])
+        related_seconds = time.time() - start
+
+    failed = 0
+    for order_id in order_ids:
+        order = orders.get(order_id)
+        if not order:
+            failed += 1
+            print("Failed to retrieve order {}".format(order_id), file=sys.stderr)
+            continue
         print_order(order)
+        if related:
+            print_related(order, related)
         print("\n=== Raw JSON Response ===")
         print(json.dumps(order, indent=2, ensure_ascii=False))
-    else:
-        print("Failed to retrieve order information")
+    if related:
+        print_timings(order_seconds, related_seconds, timings)
+    if failed:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
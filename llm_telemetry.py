@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Telemetry for the address normalization path of convert_contacts.py.
+
+Every address handed to normalization is counted once by how it was
+resolved (normalized address cache, offline rules, LLM, or the exported
+values as a fallback), and every LLM request by kind ('batch' for the
+BATCH_SIZE requests, 'single' for the one-address retries) with its latency
+and token usage. Retries, rate limits, addresses that fell back to single
+requests and offline batch jobs are counted too. summary() aggregates it all
+for the end-of-run report.
+"""
+
+import json
+import os
+import threading
+
+OUTCOMES = ['cache', 'local', 'llm', 'original']
+REQUEST_KINDS = ['batch', 'single']
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {
+        'count': len(ordered),
+        'sum': round(sum(ordered), 3),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'max': round(ordered[-1], 3),
+    }
+
+
+class NormalizationTelemetry:
+    """Thread-safe counters for one conversion run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.latencies = {kind: [] for kind in REQUEST_KINDS}
+        self.failed_requests = dict.fromkeys(REQUEST_KINDS, 0)
+        self.retries = dict.fromkeys(REQUEST_KINDS, 0)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.rate_limited = 0
+        self.fallback_to_single = 0
+        self.batch_job_requests = 0
+        self.batch_job_ingested = 0
+
+    def record_address(self, outcome, count=1):
+        """count addresses resolved from 'cache', by 'local' rules, by the 'llm' or left at their 'original' values"""
+        with self.lock:
+            self.outcomes[outcome] += count
+
+    def record_request(self, kind, seconds, usage=None, ok=True):
+        """One LLM request; usage is the response's usage object, if any"""
+        with self.lock:
+            self.latencies[kind].append(seconds)
+            if not ok:
+                self.failed_requests[kind] += 1
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+                self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+    def record_retry(self, kind):
+        with self.lock:
+            self.retries[kind] += 1
+
+    def record_rate_limited(self):
+        with self.lock:
+            self.rate_limited += 1
+
+    def record_fallback_to_single(self, count):
+        with self.lock:
+            self.fallback_to_single += count
+
+    def record_batch_job(self, requests, ingested):
+        with self.lock:
+            self.batch_job_requests += requests
+            self.batch_job_ingested += ingested
+
+    def summary(self):
+        with self.lock:
+            total = sum(self.outcomes.values())
+            return {
+                'addresses': dict(self.outcomes, total=total),
+                'cache_hit_rate': round(self.outcomes['cache'] / total, 4) if total else None,
+                'resolved_locally_rate': round(self.outcomes['local'] / total, 4) if total else None,
+                'llm_rate': round(self.outcomes['llm'] / total, 4) if total else None,
+                'llm_requests': {
+                    kind: dict(latency_summary(self.latencies[kind]),
+                               failed=self.failed_requests[kind], retries=self.retries[kind])
+                    for kind in REQUEST_KINDS
+                },
+                'tokens': {
+                    'prompt': self.prompt_tokens,
+                    'completion': self.completion_tokens,
+                    'total': self.prompt_tokens + self.completion_tokens,
+                },
+                'rate_limited': self.rate_limited,
+                'fallback_to_single': self.fallback_to_single,
+                'batch_job': {'requests': self.batch_job_requests, 'ingested': self.batch_job_ingested},
+            }
+
+    def write_report(self, path):
+        """Write summary() as JSON and print a short digest of it"""
+        summary = self.summary()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+        os.replace(tmp_path, path)
+
+        addresses = summary['addresses']
+        requests = summary['llm_requests']
+        print(f"[LLM] Normalization: {addresses['total']} addresses, {addresses['cache']} from cache, "
+              f"{addresses['local']} resolved locally, {addresses['llm']} by the LLM, "
+              f"{addresses['original']} left at exported values")
+        print(f"[LLM] {requests['batch']['count']} batch and {requests['single']['count']} single requests "
+              f"({requests['batch']['retries'] + requests['single']['retries']} retries, "
+              f"{summary['fallback_to_single']} addresses fell back to single requests, "
+              f"{summary['rate_limited']} rate limited), {summary['tokens']['total']} tokens. Report: {path}")
+        return summary
+
+
+# Shared by convert_contacts.py and the modules built on it for the current run
+TELEMETRY = NormalizationTelemetry()
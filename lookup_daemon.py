@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Local lookup daemon for get_contact.py and get_order.py.
+
+Serves the Brightpearl ID-set lookups the scripts make (contacts, postal
+addresses, orders, products and shipping methods) from one long-lived
+process: upstream requests go through a pooled requests.Session, so the TLS
+connection stays warm, and every resource fetched is kept in an in-memory
+LRU cache with a TTL. Upstream requests are made with the client's get(),
+so a throttled response is retried with backoff. A request for /contact-service/contact/1,2,3 is
+answered from the cache where possible and only the missing IDs are fetched
+upstream, in one ID-set request.
+
+Point the clients at it with --daemon or BRIGHTPEARL_LOOKUP_DAEMON:
+
+    python lookup_daemon.py --port 8765
+    BRIGHTPEARL_LOOKUP_DAEMON=http://127.0.0.1:8765 python get_contact.py 12345
+
+Other endpoints:
+    GET  /stats                        cache size, hits, misses, upstream request metrics
+    POST /invalidate                   drop every cached resource
+    POST /invalidate?path=contact-service/contact&ids=1,2
+                                       drop only these IDs (path alone drops the resource type)
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from brightpearl_export import config_or_exit, get_client
+
+# Resources the daemon serves, with the field that holds each resource's ID
+CACHED_RESOURCES = {
+    'contact-service/contact': 'contactId',
+    'contact-service/postal-address': 'addressId',
+    'order-service/order': 'id',
+    'product-service/product': 'id',
+    'warehouse-service/shipping-method': 'id',
+}
+
+DEFAULT_PORT = 8765
+DEFAULT_TTL = 300  # Seconds a cached resource is served before it is fetched again
+DEFAULT_MAX_ENTRIES = 10000
+
+INDICATORS = {
+    'error': '[ERROR]',
+    'warning': '[WARNING]',
+    'info': '[INFO]',
+    'success': '[SUCCESS]',
+    'progress': '[PROGRESS]'
+}
+
+
+class LookupCache:
+    """Thread-safe LRU cache with a TTL, keyed by (resource path, query, id)"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, path=None, ids=None):
+        """Drop every entry, every entry of one resource path, or some IDs of it; returns the number dropped"""
+        with self.lock:
+            keys = [
+                key for key in self.entries
+                if (path is None or key[0] == path) and (ids is None or key[2] in ids)
+            ]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class LookupService:
+    """Answers ID-set lookups from the cache, fetching only the missing IDs upstream"""
+
+    def __init__(self, cache, client):
+        self.cache = cache
+        self.client = client
+        self.upstream_requests = 0  # Guarded by cache.lock, like the cache's own counters
+
+    def lookup(self, path, ids, query):
+        """Return the resources for ids (strings) in request order, skipping IDs Brightpearl does not return"""
+        id_field = CACHED_RESOURCES[path]
+        found = {}
+        missing = []
+        for resource_id in ids:
+            resource = self.cache.get((path, query, resource_id))
+            if resource is None:
+                missing.append(resource_id)
+            else:
+                found[resource_id] = resource
+        if missing:
+            url = self.client.url('{}/{}'.format(path, ','.join(missing)))
+            with self.cache.lock:
+                self.upstream_requests += 1
+            # get() backs off on 429/503 like the exports, so one throttled response does not fail every waiting lookup
+            with self.client.capture_failures() as failures:
+                resp = self.client.get(url, dict(parse_qsl(query)))
+            if resp is None:
+                raise RuntimeError(failures[0]['error'] if failures else 'upstream request failed')
+            for resource in resp.json().get('response') or []:
+                resource_id = str(resource.get(id_field))
+                self.cache.put((path, query, resource_id), resource)
+                found[resource_id] = resource
+        return [found[resource_id] for resource_id in ids if resource_id in found]
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self.cache.lock:
+            stats['upstream_requests'] = self.upstream_requests
+        stats['upstream'] = self.client.metrics.snapshot()
+        return stats
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    service = None  # Set by serve()
+
+    def send_json(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.strip('/')
+        if path == 'stats':
+            self.send_json(200, self.service.stats())
+            return
+        resource_path, _, id_set = path.rpartition('/')
+        if resource_path not in CACHED_RESOURCES or not id_set:
+            self.send_json(404, {'errors': [{'message': 'Unsupported lookup: /{}'.format(path)}]})
+            return
+        ids = list(dict.fromkeys(i for i in id_set.split(',') if i))
+        try:
+            self.send_json(200, {'response': self.service.lookup(resource_path, ids, url.query)})
+        except Exception as e:
+            print("{} Upstream error for /{}: {}".format(INDICATORS['error'], path, e))
+            self.send_json(502, {'errors': [{'message': str(e)}]})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.strip('/') != 'invalidate':
+            self.send_json(404, {'errors': [{'message': 'Unsupported endpoint: {}'.format(url.path)}]})
+            return
+        params = dict(parse_qsl(url.query))
+        ids = set(params['ids'].split(',')) if params.get('ids') else None
+        dropped = self.service.cache.invalidate(params.get('path'), ids)
+        print("{} Invalidated {} cached resources".format(INDICATORS['info'], dropped))
+        self.send_json(200, {'invalidated': dropped})
+
+    def log_message(self, format, *args):
+        # One line per lookup is too noisy for a long-lived process
+        pass
+
+
+def serve(client, host, port, ttl, max_entries):
+    LookupHandler.service = LookupService(LookupCache(max_entries, ttl), client)
+    server = ThreadingHTTPServer((host, port), LookupHandler)
+    print("{} Lookup daemon listening on http://{}:{} (ttl {}s, up to {} cached resources)".format(
+        INDICATORS['info'], host, port, ttl, max_entries
+    ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve cached Brightpearl lookups for get_contact.py and get_order.py.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL, help='Seconds a cached resource stays fresh')
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES, help='Cached resources kept before the least recently used are dropped')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config_or_exit()
+    serve(get_client(), args.host, args.port, args.ttl, args.max_entries)
+
+
+if __name__ == '__main__':
+    main()
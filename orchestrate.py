@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Run the contacts export, the orders export and the conversion as one job
+graph in one process, under one shared Brightpearl request budget.
+
+The two exports start at once. The conversion only needs the contacts, so
+it starts as soon as the contacts export has written exports/*.csv, while
+the orders export keeps going. A job whose dependency failed is skipped.
+
+Both exports take their requests from one SharedRateBudget of
+--requests-per-minute, split by weight. With the default weights the
+contacts export gets two thirds of the budget while both run. Once either
+one finishes, the other gets the whole budget. Each export keeps its own
+client, so their 429/503 backoff and request metrics stay separate.
+
+Each job's output lines are prefixed with its name. When every job has
+finished, exports/orchestrate_report.json gives each job's status, timing,
+request totals and budget share.
+
+Usage:
+    python orchestrate.py [--jobs contacts orders convert] [--requests-per-minute 200]
+                          [--weight contacts=2 --weight orders=1] [--convert-args '--incremental']
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+
+import convert_contacts as cc
+import export_contacts as ec
+import export_orders as eo
+from brightpearl_export import (BrightpearlClient, SharedRateBudget, config_or_exit, http_summary, prefixed_output,
+                                set_output_label, set_thread_client, write_atomic)
+from brightpearl_export.planning import THROTTLE_REQUESTS_PER_MINUTE
+
+REPORT = os.path.join('exports', 'orchestrate_report.json')
+
+# name: (dependencies, makes Brightpearl requests)
+JOBS = {
+    'contacts': ([], True),
+    'orders': ([], True),
+    'convert': (['contacts'], False),
+}
+DEFAULT_WEIGHTS = {'contacts': 2.0, 'orders': 1.0}
+
+
+def run_contacts(args):
+    return ec.export(argparse.Namespace(prometheus_textfile=None))
+
+
+def run_orders(args):
+    return eo.export(argparse.Namespace(prometheus_textfile=None))
+
+
+def run_convert(args):
+    cc.convert(cc.parse_args(shlex.split(args.convert_args)))
+    report = {}
+    for name, path in (('companies_rows', cc.OUTPUT_CSV), ('customers_rows', cc.CUSTOMERS_CSV)):
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                report[name] = sum(1 for _ in f) - 1
+    return report
+
+
+RUNNERS = {'contacts': run_contacts, 'orders': run_orders, 'convert': run_convert}
+
+
+def parse_weight(value):
+    name, _, weight = value.partition('=')
+    if name not in DEFAULT_WEIGHTS:
+        raise argparse.ArgumentTypeError('weights apply to {}, got {!r}'.format(' and '.join(DEFAULT_WEIGHTS), name))
+    try:
+        weight = float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected JOB=WEIGHT, got {!r}'.format(value))
+    if weight <= 0:
+        raise argparse.ArgumentTypeError('weights must be positive, got {!r}'.format(value))
+    return name, weight
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the exports and the conversion as one job graph under a shared Brightpearl request budget.')
+    parser.add_argument('--jobs', nargs='+', choices=list(JOBS), default=list(JOBS),
+                        help='Jobs to run (default: all). A dependency that is not run is assumed to be up to date on disk')
+    parser.add_argument('--requests-per-minute', type=float, default=THROTTLE_REQUESTS_PER_MINUTE,
+                        help='Brightpearl requests per minute shared by the exports (default: {}, the standard quota)'.format(THROTTLE_REQUESTS_PER_MINUTE))
+    parser.add_argument('--weight', type=parse_weight, action='append', default=[], metavar='JOB=WEIGHT',
+                        help='Share of the budget while both exports run (default: contacts=2, orders=1)')
+    parser.add_argument('--convert-args', default='', metavar='ARGS',
+                        help="Arguments for the conversion, as for convert_contacts.py (e.g. '--incremental --workers 4')")
+    args = parser.parse_args()
+    if args.requests_per_minute <= 0:
+        parser.error('--requests-per-minute must be positive')
+    if 'convert' in args.jobs:
+        convert_args = cc.parse_args(shlex.split(args.convert_args))
+        if convert_args.plan or convert_args.profile or convert_args.profile_stage:
+            parser.error('--plan and --profile cannot be used in --convert-args')
+    return args
+
+
+class JobGraph:
+    """Runs each job on its own thread once its dependencies have succeeded"""
+
+    def __init__(self, args, budget, config):
+        self.args = args
+        self.budget = budget
+        self.config = config
+        self.weights = dict(DEFAULT_WEIGHTS, **dict(args.weight))
+        self.done = {name: threading.Event() for name in args.jobs}
+        self.results = {name: {'status': 'pending', 'depends_on': JOBS[name][0]} for name in args.jobs}
+
+    def run(self):
+        threads = [threading.Thread(target=self.run_job, args=(name,), name='job-' + name) for name in self.args.jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.results
+
+    def run_job(self, name):
+        set_output_label(name)
+        result = self.results[name]
+        dependencies, uses_brightpearl = JOBS[name]
+        waiting = time.time()
+        try:
+            for dependency in dependencies:
+                if dependency not in self.done:
+                    continue
+                self.done[dependency].wait()
+                if self.results[dependency]['status'] != 'ok':
+                    result['status'] = 'skipped'
+                    result['error'] = '{} {}'.format(dependency, self.results[dependency]['status'])
+                    print("[WARNING] Skipped: {}".format(result['error']))
+                    return
+            started = time.time()
+            result['waited_for_dependencies_seconds'] = round(started - waiting, 3)
+            result['started_at'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started))
+            if uses_brightpearl:
+                share = self.budget.share(name, self.weights[name])
+                client = BrightpearlClient.from_config(self.config, limiter=share)
+                # The ETA in the progress line assumes the whole budget
+                client.request_delay = self.budget.interval
+                set_thread_client(client)
+            print("[INFO] Starting {}".format(name))
+            try:
+                report = RUNNERS[name](self.args) or {}
+            except SystemExit as e:
+                result['status'] = 'failed'
+                result['error'] = 'exited with status {}'.format(e.code)
+            except Exception as e:
+                result['status'] = 'failed'
+                result['error'] = '{}: {}'.format(type(e).__name__, e)
+                print("[ERROR] {} failed: {}".format(name, result['error']))
+            else:
+                result['status'] = 'ok'
+                result.update({key: value for key, value in report.items()
+                               if key not in ('script', 'http', 'started_at', 'finished_at', 'wall_seconds')})
+            finished = time.time()
+            result['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished))
+            result['wall_seconds'] = round(finished - started, 3)
+            if uses_brightpearl:
+                result['http'] = http_summary(client.metrics.snapshot())
+                result['budget'] = share.snapshot()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            self.done[name].set()
+
+
+def write_report(args, budget, started, results):
+    finished = time.time()
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished)),
+        'wall_seconds': round(finished - started, 3),
+        'status': 'ok' if all(result['status'] == 'ok' for result in results.values()) else 'failed',
+        'budget': budget.snapshot(),
+        'jobs': results,
+        'requests': sum(result.get('http', {}).get('requests', 0) for result in results.values()),
+        'throttled': sum(result.get('http', {}).get('throttled', 0) for result in results.values()),
+    }
+    write_atomic(REPORT, json.dumps(report, indent=2) + '\n')
+
+    slots = sum(share['requests'] for share in report['budget']['shares'].values())
+    print("[INFO] {} jobs in {:.1f}s:".format(len(results), finished - started))
+    for name, result in results.items():
+        if result['status'] != 'ok':
+            print("[INFO]   {:<9} {} ({})".format(name, result['status'], result.get('error', '')))
+            continue
+        line = "[INFO]   {:<9} ok in {:.1f}s".format(name, result['wall_seconds'])
+        if result.get('waited_for_dependencies_seconds'):
+            line += ", started after {:.1f}s waiting for {}".format(result['waited_for_dependencies_seconds'], ', '.join(result['depends_on']))
+        if 'http' in result:
+            line += ", {} requests ({:.0%} of the budget's slots), {} throttled".format(
+                result['http']['requests'], result['budget']['requests'] / max(slots, 1), result['http']['throttled'])
+        print(line)
+    print("[INFO] {} Brightpearl requests at up to {:g}/min ({} throttled). Report: {}".format(
+        report['requests'], args.requests_per_minute, report['throttled'], REPORT))
+    return report
+
+
+def main():
+    args = parse_args()
+    config = None
+    if any(JOBS[name][1] for name in args.jobs):
+        config = config_or_exit()
+    budget = SharedRateBudget(args.requests_per_minute)
+    started = time.time()
+    print("[INFO] Running {} under a shared budget of {:g} requests/min".format(', '.join(args.jobs), args.requests_per_minute))
+    with prefixed_output():
+        results = JobGraph(args, budget, config).run()
+    report = write_report(args, budget, started, results)
+    if report['status'] != 'ok':
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
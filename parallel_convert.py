@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process row building for convert_contacts.py (--workers N).
+
+Companies are hash-partitioned on companyId across a process pool. Each
+worker builds the rows of its partition and fills in every address that is
+already in the normalized address cache or resolved by the offline rules.
+The partial outputs are merged back in the original company order, and the
+remaining addresses are normalized in the main process, so LLM requests and
+cache writes stay in one place. Customers are de-duplicated by email after
+the merge, so de-duplication stays global.
+
+Rows whose addresses are all resolved in the worker are returned already
+CSV-encoded (one string per row), which keeps the main process from having
+to rebuild every cell of every row when the results come back. Rows that
+still need normalization come back as lists and are written after they are
+filled in.
+
+Workers inherit their input through fork instead of having it pickled, so
+this mode needs the fork start method (Linux, macOS).
+"""
+
+import csv
+import io
+import multiprocessing
+import zlib
+
+import convert_contacts as cc
+from address_rules import normalize_address_local
+from llm_telemetry import TELEMETRY
+
+# Set in the parent just before the pool forks; workers read their partition from here
+_worker_input = {}
+
+
+def partition_of(company_id, partition_count):
+    """Stable hash partition of a companyId"""
+    return zlib.crc32(company_id.encode('utf-8')) % partition_count
+
+
+def cached_normalization(address_dict, normalized_cache, counts):
+    """
+    (city, province, country) from the cache or the offline rules, or None if
+    the address needs the LLM. Hits are counted in counts['cache'] / counts['local'].
+    """
+    addr_id = address_dict.get('addressId', '')
+    if addr_id and addr_id in normalized_cache:
+        addr_line1, addr_line2, postcode, country, city, province = normalized_cache[addr_id]
+        counts['cache'] += 1
+        return city, province, country
+    local = normalize_address_local(address_dict)
+    if local:
+        counts['local'] += 1
+    return local
+
+
+def row_encoder():
+    """Return a function that encodes one row as a CSV line, quoted like csv.writer"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+    return encode
+
+
+def build_partition(index):
+    """
+    Pool worker: build the rows of one partition.
+    Returns ([(position, rows, customers, ship_misses, bill_misses)], counts)
+    where the misses are (row_idx, addr_dict) pairs into that company's rows
+    and counts holds the cache and offline-rule hits for the telemetry.
+    """
+    normalized_cache = _worker_input['normalized_cache']
+    encode = row_encoder() if _worker_input['encode_rows'] else None
+    outputs = []
+    counts = {'cache': 0, 'local': 0}
+    for position, company, company_contacts in _worker_input['partitions'][index]:
+        rows = []
+        customers = []
+        ship_misses = []
+        bill_misses = []
+        for contact, contact_addresses in company_contacts:
+            entries, customer = cc.build_contact_rows(company, contact, contact_addresses)
+            billing = None
+            for row, ship_addr, billing_addr in entries:
+                resolved = True
+                shipping = cached_normalization(ship_addr, normalized_cache, counts)
+                if shipping:
+                    row[cc.SHIPPING_CITY], row[cc.SHIPPING_PROVINCE], _ = shipping
+                else:
+                    ship_misses.append((len(rows), ship_addr))
+                    resolved = False
+                if billing_addr:
+                    # The billing address is the same for every row of the contact
+                    billing = billing or cached_normalization(billing_addr, normalized_cache, counts)
+                    if billing:
+                        row[cc.BILLING_CITY], row[cc.BILLING_PROVINCE], _ = billing
+                    else:
+                        bill_misses.append((len(rows), billing_addr))
+                        resolved = False
+                rows.append(encode(row) if encode and resolved else row)
+            if customer:
+                customers.append(customer)
+        outputs.append((position, rows, customers, ship_misses, bill_misses))
+    return outputs, counts
+
+
+def build_company_rows_parallel(work, state, normalized_cache, workers, encode_rows=True):
+    """
+    Parallel counterpart of convert_contacts.build_company_rows. Returns
+    (rows, ship_addr_refs, bill_addr_refs) where the refs only hold the
+    addresses the workers could not resolve from the cache or the rules.
+    With encode_rows, fully resolved rows are CSV-encoded strings instead of
+    lists (see convert_contacts.write_rows).
+    """
+    partitions = [[] for _ in range(workers)]
+    for position, (key, company, company_contacts, fingerprint) in enumerate(work):
+        partitions[partition_of(company.get('companyId', ''), workers)].append((position, company, company_contacts))
+    print(f"[INFO] Building rows for {len(work)} companies in {workers} worker processes "
+          f"(partition sizes: {', '.join(str(len(p)) for p in partitions)})")
+
+    _worker_input.update(partitions=partitions, normalized_cache=normalized_cache, encode_rows=encode_rows)
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            partition_outputs = pool.map(build_partition, range(workers))
+    finally:
+        _worker_input.clear()
+
+    # Merge back in company order
+    merged = [None] * len(work)
+    for outputs, counts in partition_outputs:
+        for outcome, count in counts.items():
+            TELEMETRY.record_address(outcome, count)
+        for output in outputs:
+            merged[output[0]] = output
+
+    rows = []
+    ship_addr_refs = []
+    bill_addr_refs = []
+    for (key, company, company_contacts, fingerprint), (_, company_rows, customers, ship_misses, bill_misses) in zip(work, merged):
+        offset = len(rows)
+        ship_addr_refs.extend((offset + row_idx, addr) for row_idx, addr in ship_misses)
+        bill_addr_refs.extend((offset + row_idx, addr) for row_idx, addr in bill_misses)
+        rows.extend(company_rows)
+        state[key] = {'fingerprint': fingerprint, 'rows': company_rows, 'customers': customers}
+    return rows, ship_addr_refs, bill_addr_refs
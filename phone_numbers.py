@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Phone number normalization to E.164.
+
+The per-country rules (trunk prefix stripping and national number lengths)
+are compiled once from COUNTRY_PHONE_PREFIXES into PHONE_RULES. Results are
+memoized on (raw phone, country), since the same contact phone is normalized
+again for every shipping and billing country it appears with.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from address_rules import to_alpha2
+
+# Country code to phone prefix mapping
+COUNTRY_PHONE_PREFIXES = {
+    'ESP': '34', 'ES': '34',  # Spain
+    'GBR': '44', 'GB': '44',  # UK
+    'FRA': '33', 'FR': '33',  # France
+    'DEU': '49', 'DE': '49',  # Germany
+    'ITA': '39', 'IT': '39',  # Italy
+    'PRT': '351', 'PT': '351',  # Portugal
+    'NLD': '31', 'NL': '31',  # Netherlands
+    'BEL': '32', 'BE': '32',  # Belgium
+    'CHE': '41', 'CH': '41',  # Switzerland
+    'AUT': '43', 'AT': '43',  # Austria
+    'IRL': '353', 'IE': '353',  # Ireland
+    'USA': '1', 'US': '1',  # United States
+}
+
+# National numbering rules by 2-letter country code:
+# - trunk: leading trunk prefix removed before adding the country prefix
+# - lengths: accepted national number lengths (None accepts any length)
+# - leading: accepted first digits of the national number
+# Numbers that don't match their country's rule, and countries without a rule,
+# fall back to dropping all leading zeros.
+NATIONAL_NUMBER_RULES = {
+    'ES': {'lengths': (9,), 'leading': '6789'},  # Spanish numbers are 9 digits
+    'GB': {'trunk': '0'},
+    'US': {'trunk': '1', 'lengths': (10,)},  # Area code + local number
+    'FR': {'trunk': '0'},
+    'DE': {'trunk': '0'},
+    'IT': {'trunk': '0'},
+    'BE': {'trunk': '0'},
+    'CH': {'trunk': '0'},
+}
+
+PHONE_CACHE_SIZE = 65536  # Distinct (phone, country) pairs kept in memory
+
+PhoneRule = namedtuple('PhoneRule', ['prefix', 'trunk', 'lengths', 'leading'])
+
+
+def compile_phone_rules():
+    """Build {country code: PhoneRule} for every 2- and 3-letter code with a known prefix"""
+    rules = {}
+    for code, prefix in COUNTRY_PHONE_PREFIXES.items():
+        national = NATIONAL_NUMBER_RULES.get(to_alpha2(code), {})
+        rules[code] = PhoneRule(
+            prefix=prefix,
+            trunk=national.get('trunk', ''),
+            lengths=national.get('lengths'),
+            leading=national.get('leading', '')
+        )
+    return rules
+
+
+PHONE_RULES = compile_phone_rules()
+
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def normalize_phone_number(phone, country_code):
+    """
+    Normalize phone numbers to E.164 format based on country code.
+    Returns tuple of (normalized_number, success_flag)
+    """
+    if not phone or not country_code:
+        return '', False
+
+    # Remove any non-digit characters
+    digits = ''.join(c for c in str(phone) if c.isdigit())
+    if not digits:
+        return '', False
+
+    # If already in international format, just ensure it starts with +
+    if phone.startswith('+'):
+        return phone, True
+
+    rule = PHONE_RULES.get(country_code.upper())
+    if not rule:
+        return phone, False  # Can't normalize without knowing the country prefix
+
+    # Check if number already starts with country code
+    if digits.startswith(rule.prefix):
+        return f"+{digits}", True
+
+    national = digits
+    if rule.trunk and national.startswith(rule.trunk):
+        if rule.lengths is None or len(national) - len(rule.trunk) in rule.lengths:
+            national = national[len(rule.trunk):]
+
+    if rule.lengths is None:
+        if rule.trunk:
+            return f"+{rule.prefix}{national}", True
+    elif len(national) in rule.lengths and (not rule.leading or national[0] in rule.leading):
+        return f"+{rule.prefix}{national}", True
+
+    return f"+{rule.prefix}{national.lstrip('0')}", True
+
+
+def normalize_phone_numbers(phones, country_codes):
+    """Normalize a column of phones against a parallel column of country codes"""
+    return list(map(normalize_phone_number, phones, country_codes))
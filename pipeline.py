@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Export and conversion in one process, without the CSV round-trip.
+
+Records are streamed from the export_contacts.py fetch loop straight into the
+conversion. As soon as a contact and its addresses have been fetched, the
+addresses the conversion will use are queued to a background thread that
+normalizes them (cache, offline rules, then the LLM) into
+converted/normalized_addresses.csv while the export keeps crawling. When the
+export finishes, the output rows are built from the in-memory records and
+every address is already in the cache, so the run takes roughly as long as
+the slower of the two stages instead of their sum.
+
+The exports/*.csv files are only written with --write-exports.
+
+Usage:
+    python pipeline.py [--write-exports] [--incremental | --delta] [--workers N]
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+
+import convert_contacts as cc
+import export_contacts as ec
+from brightpearl_export import config_or_exit, get_client, write_run_report
+from llm_telemetry import TELEMETRY
+
+
+class AddressNormalizer(threading.Thread):
+    """Background thread that normalizes queued addresses in batches of BATCH_SIZE"""
+
+    def __init__(self):
+        super().__init__(name='address-normalizer', daemon=True)
+        self.queue = queue.Queue()
+        self.normalized = 0
+        self.error = None
+
+    def submit(self, addresses):
+        for address in addresses:
+            self.queue.put(address)
+
+    def finish(self):
+        """Normalize whatever is still queued and wait for the thread to stop"""
+        self.queue.put(None)
+        self.join()
+        if self.error:
+            raise self.error
+
+    def run(self):
+        batch = []
+        try:
+            while True:
+                address = self.queue.get()
+                if address is not None:
+                    batch.append(address)
+                if batch and (address is None or len(batch) >= cc.BATCH_SIZE):
+                    cc.normalize_addresses_llm_batch(batch, 'pipeline')
+                    self.normalized += len(batch)
+                    batch = []
+                if address is None:
+                    return
+        except Exception as e:
+            self.error = e
+
+
+def addresses_to_normalize(contact, contact_addresses):
+    """The shipping and billing addresses the conversion will normalize for one contact"""
+    entries, _ = cc.build_contact_rows({}, contact, contact_addresses)
+    shipping = [ship_addr for _, ship_addr, _ in entries]
+    billing = [entries[0][2]] if entries and entries[0][2] else []
+    return shipping + billing
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export B2B contacts from Brightpearl and convert them for Shopify in one pass.')
+    parser.add_argument('--write-exports', action='store_true',
+                        help='Also write exports/contacts.csv, addresses.csv and companies.csv')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the rows of companies whose inputs are unchanged since the last run')
+    parser.add_argument('--delta', action='store_true',
+                        help='Also write companies_delta.csv and customers_delta.csv with only new or changed rows (implies --incremental)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Build rows in this many processes, companies hash-partitioned by companyId')
+    parser.add_argument('--prometheus-textfile', metavar='PATH',
+                        help='Also write the request metrics in Prometheus text format (for the node_exporter textfile collector)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='-v: a line per normalization batch and cache save; -vv: also a line per address')
+    args = parser.parse_args()
+    if args.delta:
+        args.incremental = True
+    # Normalization already happens during the export, so there is no separate batch job
+    args.batch_job = False
+    return args
+
+
+def main():
+    args = parse_args()
+    cc.VERBOSITY = args.verbose
+    config_or_exit()
+    os.makedirs(cc.CONVERTED_DIR, exist_ok=True)
+    started = time.time()
+
+    # The conversion sees the cache as it was before this run, like a separate convert_contacts.py run would
+    normalized_cache = cc.load_normalized_addresses()
+    normalizer = AddressNormalizer()
+    normalizer.start()
+
+    companies = []
+    contacts = []
+    addresses = []
+    exported = {'contact': [], 'company': [], 'address': []}
+    contact = None
+    contact_addresses = []
+
+    for kind, record in ec.iter_export_records(set()):
+        if args.write_exports:
+            exported[kind].append(record)
+        if kind == 'company':
+            companies.append(ec.company_csv_row(record))
+        elif kind == 'address':
+            address = cc.prepare_address(ec.address_csv_row(record), normalized_cache)
+            addresses.append(address)
+            contact_addresses.append(address)
+        else:
+            # A contact's addresses follow it, so the previous contact is complete
+            if contact:
+                normalizer.submit(addresses_to_normalize(contact, contact_addresses))
+            contact = ec.contact_csv_row(record)
+            contact_addresses = []
+            contacts.append(contact)
+    if contact:
+        normalizer.submit(addresses_to_normalize(contact, contact_addresses))
+
+    export_seconds = time.time() - started
+    print(f"\n[INFO] Export finished in {export_seconds:.1f}s: {len(companies)} companies, {len(contacts)} contacts, {len(addresses)} addresses")
+
+    if args.write_exports:
+        print("[INFO] Writing export files")
+        ec.write_contacts_csv(exported['contact'])
+        ec.write_addresses_csv(exported['address'])
+        ec.write_companies_csv(exported['company'])
+
+    print(f"[INFO] Waiting for {normalizer.queue.qsize()} queued addresses to be normalized...")
+    normalizer.finish()
+    print(f"[INFO] Normalized {normalizer.normalized} addresses alongside the export")
+    # Written before the rows are built: they only look up what the normalizer just cached
+    TELEMETRY.write_report(cc.NORMALIZATION_REPORT)
+
+    cc.convert_records(companies, contacts, addresses, normalized_cache, args)
+    print(f"[SUCCESS] Pipeline complete in {time.time() - started:.1f}s (export {export_seconds:.1f}s)")
+    write_run_report(os.path.join(cc.CONVERTED_DIR, 'pipeline_report.json'), 'pipeline', started, get_client().metrics,
+                     args.prometheus_textfile, export_seconds=round(export_seconds, 3),
+                     companies=len(companies), contacts=len(contacts), addresses=len(addresses))
+
+
+if __name__ == '__main__':
+    main()